@@ -0,0 +1,64 @@
+"""Benchmark of decomposed structuring elements against scipy.
+
+Compares the opening of gramcore.filters.morphology with a disk, diamond or
+diagonal line, decomposed into cheaper elements, with
+scipy.ndimage.morphology.grey_opening and the whole footprint, for every
+size of the element.
+
+Usage::
+
+    python benchmarks/footprint.py
+
+"""
+import time
+
+import numpy
+from scipy.ndimage import morphology as reference
+
+from gramcore.filters import morphology
+
+
+SHAPE = (1024, 1024)
+DTYPES = ['uint8', 'float32']
+RADII = [3, 10, 30]
+
+
+def timeit(function, *args, **kwargs):
+    """Returns the best wall time of three runs"""
+    best = None
+    for _ in range(3):
+        start = time.time()
+        function(*args, **kwargs)
+        elapsed = time.time() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def elements(radius):
+    """Returns the structuring elements of a radius"""
+    return [{'shape': 'disk', 'radius': radius},
+            {'shape': 'diamond', 'radius': radius},
+            {'shape': 'line', 'length': 2 * radius + 1, 'angle': 45}]
+
+
+def main():
+    """Prints the timings of every dtype and element"""
+    numpy.random.seed(0)
+    arr = 255 * numpy.random.rand(*SHAPE)
+    print('%-8s %-8s %6s %12s %12s' % ('dtype', 'shape', 'radius',
+                                       'scipy (s)', 'gram (s)'))
+    for dtype in DTYPES:
+        data = arr.astype(dtype)
+        for radius in RADII:
+            for element in elements(radius):
+                footprint = morphology.footprint(element)
+                whole = timeit(reference.grey_opening, data,
+                               footprint=footprint)
+                decomposed = timeit(morphology.opening,
+                                    {'data': [data], 'footprint': element})
+                print('%-8s %-8s %6d %12.4f %12.4f' % (
+                    dtype, element['shape'], radius, whole, decomposed))
+
+
+if __name__ == '__main__':
+    main()
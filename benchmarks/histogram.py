@@ -0,0 +1,60 @@
+"""Benchmark of the sliding histogram median against scipy.
+
+Compares gramcore.filters.histogram.rank_filter with
+scipy.ndimage.filters.median_filter for 8 bit, 12 bit and 16 bit values and
+several window sizes. scipy gets slower with the window area, the histograms
+don't for 8 bit values and only with the window width for 16 bit values. The
+timings show from which window area the histograms are faster, which is what
+histogram.chosen() selects with the 'auto' backend.
+
+Usage::
+
+    python benchmarks/histogram.py
+
+"""
+import time
+
+import numpy
+from scipy.ndimage.filters import median_filter
+
+from gramcore.filters import histogram
+
+
+SHAPE = (1024, 1024)
+# dtype and largest value
+VALUES = [('uint8', 2 ** 8), ('uint16', 2 ** 12), ('uint16', 2 ** 16)]
+SIZES = [3, 5, 9, 15, 21, 31]
+
+
+def timeit(function, *args, **kwargs):
+    """Returns the best wall time of two runs"""
+    best = None
+    for _ in range(2):
+        start = time.time()
+        function(*args, **kwargs)
+        elapsed = time.time() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def main():
+    """Prints the timings of every dtype and window size"""
+    numpy.random.seed(0)
+    print('%-8s %6s %6s %12s %14s %10s' % ('dtype', 'bits', 'size',
+                                           'scipy (s)', 'histogram (s)',
+                                           'auto'))
+    for dtype, top in VALUES:
+        data = numpy.random.randint(0, top, SHAPE).astype(dtype)
+        for size in SIZES:
+            window = (size, size)
+            reference = timeit(median_filter, data, size=window)
+            counted = timeit(histogram.rank_filter, data, window,
+                             size * size // 2)
+            auto = 'histogram' if histogram.chosen('auto', data.dtype,
+                                                   window) else 'scipy'
+            print('%-8s %6d %6d %12.4f %14.4f %10s' % (
+                dtype, int(numpy.log2(top)), size, reference, counted, auto))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,88 @@
+"""Benchmark of gram startup time.
+
+Every measurement runs in a new interpreter, the way gram runs from the
+command line. It compares:
+
+    1. importing gramcore.scripts.gram, which now only imports the execution
+       modules,
+    2. additionally importing all the task modules, as gram used to do,
+    3. executing a short task file that only loads and saves an array.
+
+Usage::
+
+    python benchmarks/startup.py [repeats]
+
+"""
+import os
+import sys
+import json
+import time
+import tempfile
+import subprocess
+
+import numpy
+
+
+IMPORT_GRAM = "import gramcore.scripts.gram"
+
+IMPORT_ALL = """
+import gramcore.scripts.gram as gram
+for task in gram.MAPPING:
+    gram.MAPPING[task]
+"""
+
+RUN_JOB = """
+import sys
+import logging
+import gramcore.scripts.gram as gram
+logging.getLogger('gramcore').setLevel(logging.WARNING)
+sys.argv = ['gram', %r]
+gram.gram()
+modules = ['skimage', 'gramcore.data.images', 'gramcore.filters.edges']
+print(' '.join(m for m in modules if m in sys.modules))
+"""
+
+
+def best(code, repeats):
+    """Returns the minimum wall time of running code in a new interpreter"""
+    timings = []
+    for _ in range(repeats):
+        start = time.time()
+        output = subprocess.check_output([sys.executable, '-c', code])
+        timings.append(time.time() - start)
+    return min(timings), output.decode().strip()
+
+
+def main():
+    """Prints the wall time of each startup scenario"""
+    repeats = int(sys.argv[1]) if len(sys.argv) > 1 else 5
+    directory = tempfile.mkdtemp()
+    array_path = os.path.join(directory, 'array.npy')
+    job_path = os.path.join(directory, 'job.json')
+    numpy.save(array_path, numpy.zeros((100, 100)))
+    with open(job_path, 'w') as job:
+        json.dump({'tasks': [
+            {'task': 'arrays.load', 'parameters': {'path': array_path}},
+            {'task': 'arrays.save',
+             'parameters': {'input_index': [0], 'path': array_path}},
+        ]}, job)
+
+    baseline, _ = best('pass', repeats)
+    gram_only, _ = best(IMPORT_GRAM, repeats)
+    everything, _ = best(IMPORT_ALL, repeats)
+    job, imported = best(RUN_JOB % job_path, repeats)
+
+    os.remove(array_path)
+    os.remove(job_path)
+    os.rmdir(directory)
+
+    print('best of %d runs, in seconds' % repeats)
+    print('%-28s %8.3f' % ('empty interpreter', baseline))
+    print('%-28s %8.3f' % ('import gram', gram_only))
+    print('%-28s %8.3f' % ('import all task modules', everything))
+    print('%-28s %8.3f' % ('arrays.load/save job', job))
+    print('modules imported by the job: %s' % (imported or 'none'))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,65 @@
+"""Benchmark of the local standard deviation filter.
+
+Compares gramcore.filters.statistics.stddev with the previous implementation,
+scipy generic_filter calling standard_deviation for every cell. The previous
+implementation is slow, so it is timed on the smaller arrays only.
+
+Usage::
+
+    python benchmarks/stddev.py
+
+"""
+import time
+
+import numpy
+from scipy.ndimage.filters import generic_filter
+from scipy.ndimage.measurements import standard_deviation
+
+from gramcore.filters import statistics
+
+
+SHAPES = [(256, 256), (512, 512), (1024, 1024), (4096, 4096)]
+SIZES = [3, 9, 15]
+# generic_filter takes minutes on larger arrays
+GENERIC_LIMIT = 512 * 512
+
+
+def timeit(function, *args):
+    """Returns the best wall time of three runs"""
+    best = None
+    for _ in range(3):
+        start = time.time()
+        function(*args)
+        elapsed = time.time() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def generic(arr, size):
+    """The previous implementation of statistics.stddev"""
+    return generic_filter(arr.astype('float'), standard_deviation,
+                          size=(size, size))
+
+
+def main():
+    """Prints the timings of every shape and window size"""
+    numpy.random.seed(0)
+    header = ('shape', 'size', 'generic (s)', 'float64 (s)', 'float32 (s)')
+    print('%-12s %6s %12s %12s %12s' % header)
+    for shape in SHAPES:
+        arr = numpy.random.randint(0, 255, shape).astype('uint8')
+        for size in SIZES:
+            parameters = {'data': [arr], 'size': [size, size]}
+            fast = timeit(statistics.stddev, parameters)
+            parameters['dtype'] = 'float32'
+            single = timeit(statistics.stddev, parameters)
+            if arr.size <= GENERIC_LIMIT:
+                slow = '%12.4f' % timeit(generic, arr, size)
+            else:
+                slow = '%12s' % '-'
+            print('%-12s %6d %s %12.4f %12.4f' % ('%dx%d' % shape, size, slow,
+                                                  fast, single))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,341 @@
+"""Benchmark suite of every task in gram.MAPPING.
+
+Every task is timed on square inputs of every size and dtype. Each
+measurement runs in a new process, so its peak memory isn't affected by the
+previous ones. For every measurement the suite records:
+
+    1. the best wall time of a few repeats, in seconds,
+    2. the throughput in megapixels per second,
+    3. how much the peak resident memory grew while executing the task, in
+       MB, on top of the memory of its inputs.
+
+Tasks that don't take an input array, e.g. arrays.dtm, are timed on the
+output size. Tasks that only work with 8 bit images, e.g. the ones using
+PIL, are only timed on uint8.
+
+Results can be saved as a baseline and later runs compared against it. A
+measurement is a regression when it is slower or uses more memory than the
+baseline by more than the tolerance.
+
+Usage::
+
+    python benchmarks/suite.py [--sizes 512 2048 8192]
+                               [--dtypes uint8 float32 float64]
+                               [--tasks statistics.stddev arrays.dsm]
+                               [--repeats 3] [--save baseline.json]
+                               [--compare baseline.json] [--tolerance 0.25]
+
+The largest sizes need several GB of memory for some tasks, use --sizes to
+skip them on small machines.
+
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+import subprocess
+
+import numpy
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+from gramcore.scripts.gram import MAPPING
+
+
+SIZES = [512, 2048, 8192]
+DTYPES = ['uint8', 'float32', 'float64']
+
+
+def image(side, dtype, seed=0):
+    """Returns a random square array with values in [0, 255]"""
+    random = numpy.random.RandomState(seed)
+    return (255 * random.rand(side, side)).astype(dtype)
+
+
+def pil(side, mode='L'):
+    """Returns a random square PIL image"""
+    from PIL import Image
+    arr = image(side, 'uint8')
+    if mode == 'RGBA':
+        arr = numpy.dstack([arr] * 4)
+    return Image.fromarray(arr, mode)
+
+
+def one(side, dtype, directory, **parameters):
+    """Case of a task that takes a single array"""
+    data = image(side, dtype)
+
+    def make():
+        """Returns the parameters of the task"""
+        result = dict(parameters)
+        result['data'] = [data]
+        return result
+
+    return make
+
+
+def two(side, dtype, directory, **parameters):
+    """Case of a task that takes two arrays"""
+    first = image(side, dtype, seed=1)
+    second = image(side, dtype, seed=2)
+
+    def make():
+        """Returns the parameters of the task"""
+        result = dict(parameters)
+        result['data'] = [first, second]
+        return result
+
+    return make
+
+
+def loading(side, dtype, directory, task):
+    """Case of a load task, the input is written to a file first"""
+    if task == 'images.load':
+        path = os.path.join(directory, 'input.png')
+        pil(side).save(path)
+    else:
+        path = os.path.join(directory, 'input.npy')
+        numpy.save(path, image(side, dtype))
+
+    return lambda: {'path': path}
+
+
+def saving(side, dtype, directory, task):
+    """Case of a save task"""
+    if task == 'images.save':
+        data = pil(side)
+        path = os.path.join(directory, 'output.png')
+    else:
+        data = image(side, dtype)
+        path = os.path.join(directory, 'output.npy')
+
+    return lambda: {'data': [data], 'path': path}
+
+
+def generated(side, dtype, directory, task):
+    """Case of a task that creates a new array of the given size"""
+    if task == 'arrays.dtm':
+        return lambda: {'slope_step': 1, 'min_value': 0,
+                        'size': [side, side], 'dtype': dtype}
+    if task == 'arrays.gaussian_noise':
+        return lambda: {'mean': 0, 'stddev': 1, 'shape': [side, side]}
+    if task == 'images.tiled':
+        tile = pil(64)
+        return lambda: {'data': [tile], 'size': [side, side]}
+
+    # images.synthetic, one patch every 256 pixels along both axes
+    background = pil(side, 'RGBA')
+    patch = pil(64, 'RGBA')
+    positions = [[x, y] for x in range(0, side, 256)
+                 for y in range(0, side, 256)]
+    return lambda: {'data': [background] + [patch] * len(positions),
+                    'positions': positions}
+
+
+def dsm(side, dtype, directory):
+    """Case of arrays.dsm, blobs cover about a tenth of the DTM"""
+    dtm = image(side, dtype)
+    mask = image(side, 'uint8', seed=3) > 230
+
+    return lambda: {'data': [dtm, mask], 'delta_height': 1}
+
+
+def pillow(side, dtype, directory):
+    """Case of a task that takes a PIL image"""
+    data = pil(side)
+    return lambda: {'data': [data]}
+
+
+def stack(side, dtype, directory):
+    """Case of arrays.split, which takes a 3D array"""
+    data = numpy.dstack([image(side, dtype)] * 3)
+    return lambda: {'data': [data], 'layer': 1}
+
+
+UINT8 = ['uint8']
+
+# task: (case, extra parameters, dtypes or None for all)
+CASES = {
+    'images.fromarray': (one, {}, UINT8),
+    'images.load': (loading, {'task': 'images.load'}, UINT8),
+    'images.save': (saving, {'task': 'images.save'}, UINT8),
+    'images.synthetic': (generated, {'task': 'images.synthetic'}, UINT8),
+    'images.tiled': (generated, {'task': 'images.tiled'}, UINT8),
+    'arrays.asarray': (pillow, {}, UINT8),
+    'arrays.get_shape': (one, {}, None),
+    'arrays.gaussian_noise': (generated, {'task': 'arrays.gaussian_noise'},
+                              ['float64']),
+    'arrays.load': (loading, {'task': 'arrays.load'}, None),
+    'arrays.save': (saving, {'task': 'arrays.save'}, None),
+    'arrays.split': (stack, {}, None),
+    'arrays.dtm': (generated, {'task': 'arrays.dtm'}, None),
+    'arrays.dsm': (dsm, {}, None),
+    'descriptors.hog': (one, {}, None),
+    'points.harris': (one, {}, None),
+    'edges.canny': (one, {}, None),
+    'edges.prewitt': (one, {}, None),
+    'edges.sobel': (one, {}, None),
+    'morphology.closing': (one, {'size': [5, 5]}, None),
+    'morphology.erosion': (one, {'size': [5, 5]}, None),
+    'morphology.dilation': (one, {'size': [5, 5]}, None),
+    'morphology.opening': (one, {'size': [5, 5]}, None),
+    'statistics.bank': (one, {'sizes': [[3, 3], [9, 9], [25, 25]]}, None),
+    'statistics.describe': (one, {'size': [5, 5]}, None),
+    'statistics.maximum': (one, {'size': [5, 5]}, None),
+    'statistics.average': (one, {'size': [5, 5]}, None),
+    'statistics.median': (one, {'size': [5, 5]}, None),
+    'statistics.minimum': (one, {'size': [5, 5]}, None),
+    'statistics.percentile': (one, {'size': [5, 5], 'percentile': 25}, None),
+    'statistics.rank': (one, {'size': [5, 5], 'rank': 3}, None),
+    'statistics.stddev': (one, {'size': [5, 5]}, None),
+    'thresholds.binary': (one, {'threshold': 128}, None),
+    'thresholds.otsu': (one, {}, None),
+    'arithmetic.add': (two, {}, None),
+    'arithmetic.diff': (two, {}, None),
+    'arithmetic.divide': (two, {}, None),
+    'arithmetic.expression': (two, {'expression': 'ndvi'}, None),
+    'arithmetic.ndvi': (two, {}, None),
+    'geometric.resize': (one, {}, None),
+    'geometric.rotate': (one, {'angle': 30}, None),
+}
+
+
+def peak_rss():
+    """Returns the peak resident memory of this process in MB"""
+    if resource is None:
+        return float('nan')
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # macOS reports bytes, Linux KB
+    return peak / 2.0 ** 20 if sys.platform == 'darwin' else peak / 1024.0
+
+
+def measure(task, size, dtype, repeats):
+    """Times a task in this process and returns its measurement"""
+    case, extra, _ = CASES[task]
+    directory = tempfile.mkdtemp()
+    extra = dict(extra)
+    if task == 'geometric.resize':
+        extra['output_shape'] = [size // 2, size // 2]
+    make = case(size, dtype, directory, **extra)
+    function = MAPPING[task]
+
+    base = peak_rss()
+    # the first call warms up caches, e.g. of scipy
+    function(make())
+    timings = []
+    for _ in range(repeats):
+        parameters = make()
+        start = time.time()
+        function(parameters)
+        timings.append(time.time() - start)
+    peak = peak_rss() - base
+
+    for name in os.listdir(directory):
+        os.remove(os.path.join(directory, name))
+    os.rmdir(directory)
+
+    seconds = min(timings)
+    return {'seconds': seconds,
+            'mpixels_per_second': size * size / 1e6 / max(seconds, 1e-9),
+            'peak_mb': peak}
+
+
+def run(task, size, dtype, repeats):
+    """Measures a task in a new process and returns its measurement"""
+    command = [sys.executable, os.path.abspath(__file__), '--measure', task,
+               str(size), dtype, '--repeats', str(repeats)]
+    process = subprocess.Popen(command, stdout=subprocess.PIPE,
+                               stderr=subprocess.PIPE)
+    output, error = process.communicate()
+    if process.returncode != 0:
+        lines = error.decode('utf-8', 'replace').strip().splitlines()
+        return {'error': lines[-1] if lines else 'failed'}
+
+    return json.loads(output.decode('utf-8').strip().splitlines()[-1])
+
+
+def compare(results, baseline, tolerance):
+    """Returns the regressions of results against a baseline"""
+    regressions = []
+    for key, result in sorted(results.items()):
+        reference = baseline.get(key)
+        if reference is None or 'error' in result or 'error' in reference:
+            continue
+        for metric in ('seconds', 'peak_mb'):
+            # ignore memory growth below 1 MB, it is measurement noise
+            floor = 1.0 if metric == 'peak_mb' else 0.0
+            if result[metric] > max(reference[metric], floor) * \
+               (1 + tolerance):
+                regressions.append((key, metric, reference[metric],
+                                    result[metric]))
+
+    return regressions
+
+
+def main():
+    """Runs the suite and prints the results"""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sizes', type=int, nargs='+', default=SIZES)
+    parser.add_argument('--dtypes', nargs='+', default=DTYPES)
+    parser.add_argument('--tasks', nargs='+', default=sorted(CASES))
+    parser.add_argument('--repeats', type=int, default=3)
+    parser.add_argument('--save', help="write the results to this file")
+    parser.add_argument('--compare', help="baseline results file")
+    parser.add_argument('--tolerance', type=float, default=0.25)
+    parser.add_argument('--measure', nargs=3, help=argparse.SUPPRESS)
+    options = parser.parse_args()
+
+    if options.measure:
+        task, size, dtype = options.measure
+        print(json.dumps(measure(task, int(size), dtype, options.repeats)))
+        return 0
+
+    missing = sorted(set(MAPPING) - set(CASES))
+    if missing:
+        print('no benchmark for: %s' % ', '.join(missing))
+
+    results = {}
+    print('%-24s %6s %8s %10s %10s %10s' % ('task', 'size', 'dtype',
+                                            'seconds', 'Mpx/s', 'peak MB'))
+    for task in options.tasks:
+        dtypes = CASES[task][2] or options.dtypes
+        for size in options.sizes:
+            for dtype in [dtype for dtype in dtypes
+                          if dtype in options.dtypes]:
+                key = '%s %d %s' % (task, size, dtype)
+                result = run(task, size, dtype, options.repeats)
+                results[key] = result
+                if 'error' in result:
+                    print('%-24s %6d %8s %s' % (task, size, dtype,
+                                                result['error']))
+                else:
+                    print('%-24s %6d %8s %10.4f %10.1f %10.1f' % (
+                        task, size, dtype, result['seconds'],
+                        result['mpixels_per_second'], result['peak_mb']))
+                sys.stdout.flush()
+
+    if options.save:
+        with open(options.save, 'w') as saved:
+            json.dump(results, saved, indent=4, sort_keys=True)
+
+    if options.compare:
+        with open(options.compare) as stored:
+            baseline = json.load(stored)
+        regressions = compare(results, baseline, options.tolerance)
+        for key, metric, before, after in regressions:
+            print('REGRESSION %s %s: %.4f -> %.4f' % (key, metric, before,
+                                                      after))
+        if regressions:
+            return 1
+        print('no regressions against %s' % options.compare)
+
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,56 @@
+"""Benchmark of txt array loading and saving.
+
+Compares the throughput, in MB of txt per second, of
+gramcore.data.arrays.load and save with the previous implementation,
+numpy.loadtxt and numpy.savetxt.
+
+Usage::
+
+    python benchmarks/txt_io.py [rows] [columns]
+
+"""
+import os
+import sys
+import time
+import tempfile
+
+import numpy
+
+from gramcore.data import arrays
+
+
+def throughput(function, path):
+    """Returns MB/s and the result of a function reading or writing path"""
+    start = time.time()
+    result = function()
+    elapsed = time.time() - start
+    return os.path.getsize(path) / elapsed / 2 ** 20, result
+
+
+def main():
+    """Prints the throughput of loading and saving a random txt array"""
+    rows = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    columns = int(sys.argv[2]) if len(sys.argv) > 2 else 2000
+    numpy.random.seed(0)
+    arr = 1000 * numpy.random.rand(rows, columns)
+    path = os.path.join(tempfile.mkdtemp(), 'dem.txt')
+    parameters = {'path': path, 'data': [arr], 'fmt': '%.2f'}
+
+    saved, _ = throughput(lambda: numpy.savetxt(path, arr, fmt='%.2f'), path)
+    size = os.path.getsize(path) / 2 ** 20
+    loaded, expected = throughput(lambda: numpy.loadtxt(path), path)
+    chunk_saved, _ = throughput(lambda: arrays.save(parameters), path)
+    chunk_loaded, result = throughput(lambda: arrays.load(parameters), path)
+
+    numpy.testing.assert_array_equal(result, expected)
+    os.remove(path)
+    os.rmdir(os.path.dirname(path))
+
+    print('%dx%d array, %.1f MB of txt' % (rows, columns, size))
+    print('%-8s %14s %14s' % ('', 'numpy (MB/s)', 'gramcore (MB/s)'))
+    print('%-8s %14.1f %14.1f' % ('load', loaded, chunk_loaded))
+    print('%-8s %14.1f %14.1f' % ('save', saved, chunk_saved))
+
+
+if __name__ == '__main__':
+    main()
@@ -45,6 +45,9 @@ setup(
     entry_points={
         'console_scripts': [
             'gram = gramcore.scripts.gram:gram',
+            'gram-batch = gramcore.scripts.batch:batch',
+            'gram-service = gramcore.scripts.service:serve',
+            'gram-client = gramcore.scripts.service:client',
         ],
     },
 )
@@ -1,3 +1 @@
-"""Relative imports for gramcore.data"""
-import gramcore.data.images
-import gramcore.data.arrays
+"""Loading, saving and generation of images and arrays"""
@@ -5,7 +5,10 @@ values. All sizes and 2D coordinates refer to array elements, with (0==row,
 0==column) being the top left cell.
 
 """
+import itertools
+
 import numpy
+from numpy.lib import format as npy_format
 from scipy.ndimage import measurements
 
 
@@ -51,37 +54,78 @@ def gaussian_noise(parameters):
     :type parameters['mean']: float
     :param parameters['stddev']: standard deviation of the distribution
     :type parameters['stddev']: float
+    :param parameters['dtype']: dtype of the noise, defaults to 'float'
+    :type parameters['dtype']: string
+    :param parameters['seed']: seed of reproducible noise, defaults to None
+                               which gives different noise every time
+    :type parameters['seed']: integer
 
     :return: numpy.array
 
     """
-    return numpy.random.normal(parameters['mean'],
-                               parameters['stddev'],
-                               parameters['shape'])
+    seed = parameters.get('seed')
+    random = numpy.random.RandomState(seed) if seed is not None \
+        else numpy.random
+    noise = random.normal(parameters['mean'], parameters['stddev'],
+                          parameters['shape'])
+
+    return noise.astype(parameters.get('dtype', 'float'), copy=False)
 
 
 def load(parameters):
     """Loads an array from file and returns it.
 
-    It supports loading from txt and npy files.
+    It supports loading from txt, npy and npz files.
+
+    txt files are parsed a chunk of rows at a time, directly into a
+    preallocated array. Lines starting with # and empty lines are skipped,
+    comments at the end of a line are not supported.
+
+    npy files can be opened as memory maps, so only the parts of the array
+    that are actually used are read from disk, e.g. a window or a single
+    band. From npz archives only the requested member is read, or all of
+    them into a dict. The archive is closed before returning.
 
     :param parameters['path']: path to the file
     :type parameters['path']: string
     :param parameters['delimiter']: select which delimiter to use for loading
                                     a txt to an array, defaults to space
     :type parameters['delimiter']: string
-
-    :return: numpy.array
+    :param parameters['chunk_rows']: how many rows of a txt file to parse at a
+                                     time, defaults to 4096
+    :type parameters['chunk_rows']: integer
+    :param parameters['mmap_mode']: open an npy file as a memory map, one of
+                                    'r', 'r+', 'c', defaults to None which
+                                    reads the whole file in memory
+    :type parameters['mmap_mode']: string
+    :param parameters['member']: name of the array to load from an npz
+                                 archive, or its index if it was saved
+                                 without a name, defaults to None which
+                                 loads all of them
+    :type parameters['member']: string or integer
+
+    :return: numpy.array, numpy.memmap or dict of numpy.arrays, by member
+             name, for npz archives without a member
 
     """
     path = parameters['path']
     extension = path.split('.').pop()
 
-    if extension in 'txt':
+    if extension in ['txt']:
         delimiter = parameters.get('delimiter', ' ')
-        return numpy.loadtxt(path, delimiter=delimiter)
-    elif extension in 'npy':
-        return numpy.load(path)
+        chunk_rows = parameters.get('chunk_rows', 4096)
+        return _load_txt_chunked(path, delimiter, chunk_rows)
+    elif extension in ['npy']:
+        return numpy.load(path, mmap_mode=parameters.get('mmap_mode'))
+    elif extension in ['npz']:
+        member = parameters.get('member')
+        if isinstance(member, int):
+            member = 'arr_%d' % member
+        # every access reads a new array, so none of them needs the archive
+        with numpy.load(path) as archive:
+            if member is None:
+                return dict((name, archive[name]) for name in archive.files)
+            return archive[member]
     else:
         raise TypeError("Filetype not supported")
 
@@ -89,9 +133,20 @@ def load(parameters):
 def save(parameters):
     """Saves an object to a file.
 
-    It supports saving to txt and npy files.
+    It supports saving to txt, npy and npz files.
 
-    :param parameters['data']: the object to be saved, takes only one
+    txt files are written a block of rows at a time, each block formatted
+    with a single string operation. Only 1D and 2D arrays are supported.
+
+    Arrays can be written to npy files a block of rows at a time. This way
+    memory maps or non contiguous arrays are never copied as a whole in
+    memory.
+
+    npz archives store all the input arrays, named after the `names`
+    parameter or arr_0, arr_1 etc.
+
+    :param parameters['data']: the object to be saved, takes only one except
+                               for npz archives
     :type parameters['data']: numpy.array
     :param parameters['path']: destination path
     :type parameters['path']: string
@@ -100,6 +155,15 @@ def save(parameters):
     :param parameters['delimiter']: select which delimiter to use for saving a
                                     txt to an array, defaults to space
     :type parameters['delimiter']: string
+    :param parameters['chunk_rows']: write a txt or npy file this many rows
+                                     at a time, defaults to 4096 for txt and
+                                     to None for npy which writes the whole
+                                     array at once
+    :type parameters['chunk_rows']: integer
+    :param parameters['names']: names of the arrays in an npz archive
+    :type parameters['names']: list
+    :param parameters['compressed']: compress npz archives, defaults to False
+    :type parameters['compressed']: bool
 
     :return: True or raise TypeError
 
@@ -108,12 +172,26 @@ def save(parameters):
     data = parameters['data'][0]
     extension = path.split('.').pop()
 
-    if extension in 'txt':
+    if extension in ['txt']:
         format = parameters.get('fmt', '%.2f')
         delimiter = parameters.get('delimiter', ' ')
-        numpy.savetxt(path, data, fmt=format, delimiter=delimiter)
-    elif extension in 'npy':
-        numpy.save(path, data)
+        chunk_rows = parameters.get('chunk_rows', 4096)
+        _save_txt_chunked(path, data, format, delimiter, chunk_rows)
+    elif extension in ['npy']:
+        chunk_rows = parameters.get('chunk_rows')
+        if chunk_rows is None:
+            numpy.save(path, data)
+        else:
+            _save_npy_chunked(path, data, chunk_rows)
+    elif extension in ['npz']:
+        savez = numpy.savez
+        if parameters.get('compressed', False):
+            savez = numpy.savez_compressed
+        names = parameters.get('names')
+        if names is None:
+            savez(path, *parameters['data'])
+        else:
+            savez(path, **dict(zip(names, parameters['data'])))
     else:
         raise TypeError("Filetype not supported")
 
@@ -140,24 +218,52 @@ def dtm(parameters):
     Slope is applied in row major order, so pixels in each row have the same
     height value.
 
+    The surface is built by broadcasting a single row of heights to every
+    row. Very large surfaces can be written directly to an npy file, a chunk
+    of rows at a time, without keeping them in memory.
+
     :param parameters['slope_step']: height difference for neighbouring cells
     :type parameters['slope_step']: float or integer
     :param parameters['min_value']: global minimum height value
     :type parameters['min_value']: float or integer
     :param parameters['size']: the size of the surface in [rows, columns]
     :type parameters['size']: list
+    :param parameters['dtype']: dtype of the surface, defaults to 'float',
+                                integer dtypes e.g. 'int16' get rounded
+                                heights
+    :type parameters['dtype']: string
+    :param parameters['path']: optional, path of an npy file to write the
+                               surface to
+    :type parameters['path']: string
+    :param parameters['chunk_rows']: how many rows to write at a time to the
+                                     npy file, defaults to 1024
+    :type parameters['chunk_rows']: integer
 
-    :return: numpy.array
+    :return: numpy.array, or numpy.memmap if path is set
 
     """
     slope_step = parameters['slope_step']
     min_value = parameters['min_value']
-    size = parameters['size']
-
-    data = numpy.zeros(size, dtype=float)
-
-    for i in range(size[0]):
-        data[i, :] = numpy.arange(min_value, size[1], slope_step)
+    size = tuple(parameters['size'])
+    dtype = numpy.dtype(parameters.get('dtype', 'float'))
+    path = parameters.get('path')
+    chunk_rows = parameters.get('chunk_rows', 1024)
+
+    row = min_value + slope_step * numpy.arange(size[1], dtype=float)
+    if dtype.kind in 'iu':
+        row = numpy.round(row)
+    row = row.astype(dtype)
+
+    if path is None:
+        data = numpy.empty(size, dtype=dtype)
+        data[...] = row
+        return data
+
+    data = npy_format.open_memmap(path, mode='w+', dtype=dtype, shape=size)
+    for start in range(0, size[0], chunk_rows):
+        data[start:start + chunk_rows] = row
+        # write each chunk so dirty pages don't pile up in memory
+        data.flush()
 
     return data
 
@@ -181,12 +287,25 @@ def dsm(parameters):
     Next, it finds the maximum height value of underlying DTM for each blob.
     Finally, it assigns `max_blob_height + delta_height` to each blob cell.
 
+    The maximum heights are gathered in an array of blob heights and they are
+    assigned with a single lookup of the labels, so the cost doesn't grow with
+    the number of blobs.
+
     :param parameters['data'][0]: the base DTM
     :type parameters['data'][0]: numpy.array
     :param parameters['data'][1]: the mask of cells to elevate
     :type parameters['data'][1]: numpy.array with boolean/binary values
     :param parameters['delta_height']: single cell elevation value
     :type parameters['delta_height']: float or integer
+    :param parameters['structure']: which neighbours are connected when
+                                    labeling the mask, defaults to None which
+                                    means no diagonal neighbours, e.g.
+                                    [[1, 1, 1], [1, 1, 1], [1, 1, 1]] connects
+                                    diagonal neighbours too
+    :type parameters['structure']: list
+    :param parameters['inplace']: elevate the DTM itself instead of a copy,
+                                  defaults to False
+    :type parameters['inplace']: bool
 
     :return: numpy.array
 
@@ -194,18 +313,109 @@ def dsm(parameters):
     dtm = parameters['data'][0]
     mask = parameters['data'][1]
     delta_height = parameters['delta_height']
+    structure = parameters.get('structure')
+    inplace = parameters.get('inplace', False)
+
+    # label and find the max height of each blob, ufunc.at is used because
+    # measurements.maximum sorts the cells and it is slow with many blobs
+    labels, count = measurements.label(mask, structure=structure)
+    blobs = labels > 0
+    blob_labels = labels[blobs]
+    blob_heights = dtm[blobs]
+
+    # lookup table of blob heights, label 0 is the background and it is
+    # never used
+    max_heights = numpy.zeros(count + 1, dtype=dtm.dtype)
+    if count > 0:
+        max_heights[1:] = blob_heights.min()
+        numpy.maximum.at(max_heights, blob_labels, blob_heights)
+
+    # without inplace it is required to copy so it won't change the initial
+    # dtm values
+    dsm = dtm if inplace else dtm.copy()
+    dsm[blobs] = max_heights[blob_labels] + delta_height
 
-    # label and find the max height of each blob
-    labels, count = measurements.label(mask)
-    max_heights = measurements.maximum(dtm,
-                                       labels=labels,
-                                       index=range(1, count + 1))
+    return dsm
 
-    # assign the max height at each blob cell, required to copy so it won't
-    # change the initial dtm values
-    dsm = dtm.copy()
-    for blob_id in range(1, count + 1):
-        dsm[numpy.where(labels == blob_id)] = max_heights[blob_id - 1] +\
-                                              delta_height
 
-    return dsm
+def _save_npy_chunked(path, data, chunk_rows):
+    """Writes an npy header and then appends the array rows in blocks"""
+    header = {
+        'descr': npy_format.dtype_to_descr(data.dtype),
+        'fortran_order': False,
+        'shape': data.shape,
+    }
+    with open(path, 'wb') as npy:
+        npy_format.write_array_header_1_0(npy, header)
+        for start in range(0, data.shape[0], chunk_rows):
+            block = numpy.ascontiguousarray(data[start:start + chunk_rows])
+            npy.write(block.tobytes())
+
+
+def _load_txt_chunked(path, delimiter, chunk_rows):
+    """Parses a txt file into a preallocated array, a chunk of rows at a time
+
+    The array is allocated with one row per line, which is counted without
+    parsing the file. Comment and empty lines are skipped, so the result can
+    have less rows than the allocated array.
+
+    """
+    with open(path, 'rb') as txt:
+        lines = 0
+        last = b'\n'
+        for block in iter(lambda: txt.read(1 << 24), b''):
+            lines += block.count(b'\n')
+            last = block[-1:]
+        if last != b'\n':
+            lines += 1
+
+    with open(path, 'r') as txt:
+        data = None
+        rows = 0
+        while True:
+            lines_read = list(itertools.islice(txt, chunk_rows))
+            if not lines_read:
+                break
+            chunk = [line for line in lines_read
+                     if line.strip() and not line.lstrip().startswith('#')]
+            if not chunk:
+                continue
+            text = ' '.join(chunk)
+            if delimiter.strip():
+                text = text.replace(delimiter, ' ')
+            values = numpy.fromstring(text, dtype=float, sep=' ')
+            if data is None:
+                columns = len(chunk[0].split(delimiter.strip() or None))
+                data = numpy.empty((lines, columns))
+            if values.size != len(chunk) * columns:
+                raise ValueError("Wrong number of columns in %s" % path)
+            data[rows:rows + len(chunk)] = values.reshape((-1, columns))
+            rows += len(chunk)
+
+    if data is None:
+        return numpy.empty((0,))
+
+    # like numpy.loadtxt, a single row or column becomes a 1D array
+    return numpy.squeeze(data[:rows])
+
+
+def _save_txt_chunked(path, data, format, delimiter, chunk_rows):
+    """Formats and writes a txt file a block of rows at a time"""
+    if data.ndim == 1:
+        data = data.reshape((-1, 1))
+    elif data.ndim != 2:
+        raise TypeError("Only 1D and 2D arrays can be saved to txt")
+
+    if not isinstance(format, str):
+        row_format = delimiter.join(format)
+    elif format.count('%') == 1:
+        row_format = delimiter.join([format] * data.shape[1])
+    else:
+        row_format = format
+    row_format += '\n'
+
+    with open(path, 'w') as txt:
+        for start in range(0, data.shape[0], chunk_rows):
+            block = data[start:start + chunk_rows]
+            values = tuple(block.ravel().tolist())
+            txt.write((row_format * len(block)) % values)
@@ -10,10 +10,15 @@ the bottom left.
 
 """
 import numpy
+from numpy.lib import format as npy_format
 from PIL import Image
 from skimage import io
 
 
+# image modes that convert to and from numpy arrays without losing anything
+NUMPY_MODES = ['L', 'RGB', 'RGBA', 'I', 'F']
+
+
 def fromarray(parameters):
     """Converts a numpy array to a PIL image.
 
@@ -78,52 +83,113 @@ def synth_positions(parameters):
     """Calculates the best positions to place the patches in order to create
     a synthetic image.
 
-    It places the patches in a row along the width of the background image
-    and not in a grid-like layout. This is why the background is preferable to
-    have big width. The patche are aligned to their top.
+    The patches are packed in shelves, rows as high as their tallest patch,
+    from the top of the background to the bottom. Patches are sorted by
+    height and every shelf is filled from left to right before a new one is
+    started below it, known as Next Fit Decreasing Height packing. This takes
+    O(N log N) for N patches. When all patches fit in a single shelf they are
+    placed in the given order instead.
+
+    The space left over is spread evenly: along the width of each shelf
+    between its patches and along the height between the shelves. So a
+    single shelf is centered vertically, with equal buffers around its
+    patches. The patches are aligned to the top of their shelf.
+
+    With a seed the layout is randomized, but reproducible. The patches of
+    every shelf are shuffled, the left over space is split randomly and every
+    patch gets a random vertical offset in its shelf.
 
-    Optimal positions in this case are those that maximize the buffer around
-    patches. There shouldn't be any overlap of the patches along their width.
-    Also, no patch can have height larger than the height of the background.
-    The user must provide a background large enough to fit all the patches in,
-    otherwise this will return an exception.
+    The user must provide a background large enough to fit all the patches
+    in, otherwise this will return an exception.
 
     :param parameters['data']: the background image and the patches, first in
                                list is always the background
     :type parameters['data']: PIL.Image
+    :param parameters['buffer']: minimum number of pixels between patches and
+                                 around them, defaults to 0
+    :type parameters['buffer']: integer
+    :param parameters['seed']: seed of the randomized layout, defaults to None
+                               which spreads the space evenly
+    :type parameters['seed']: integer
 
     :return: list of integer positions in [[width, height], [...]] format
 
     """
-    sizes = []
-    for img in parameters['data']:
-        sizes.append(img.size)
-    sizes = numpy.array(sizes)
-    bg_size = sizes[0, :]
-    patch_sizes = sizes[1::, :]
-    patch_nr = patch_sizes.shape[0]
-
-    widths = patch_sizes[:, 0].sum()
-    max_height = patch_sizes[:, 1].max()
-
-    if bg_size[0] < widths or bg_size[1] < max_height:
+    bg_width, bg_height = parameters['data'][0].size
+    sizes = [img.size for img in parameters['data'][1:]]
+    buffer = parameters.get('buffer', 0)
+    seed = parameters.get('seed')
+    random = numpy.random.RandomState(seed) if seed is not None else None
+
+    if not sizes:
+        return []
+    if max(height for _, height in sizes) + 2 * buffer > bg_height:
         raise ValueError('Patches too big to fit in the background')
 
-    # these are all ints so the results will be int floors of these
-    width_buffer = (bg_size[0] - widths) / (patch_nr + 1)
-    height_buffer = (bg_size[1] - max_height) / 2
+    # one shelf keeps the given order, more than one are packed by height
+    total = sum(width for width, _ in sizes) + buffer * (len(sizes) + 1)
+    order = list(range(len(sizes)))
+    if total > bg_width:
+        order.sort(key=lambda patch: -sizes[patch][1])
+
+    shelves = [[]]
+    used = buffer
+    for patch in order:
+        width = sizes[patch][0]
+        if width + 2 * buffer > bg_width:
+            raise ValueError('Patches too big to fit in the background')
+        if used + width + buffer > bg_width:
+            shelves.append([])
+            used = buffer
+        shelves[-1].append(patch)
+        used += width + buffer
+
+    heights = [max(sizes[patch][1] for patch in shelf) for shelf in shelves]
+    y_gaps = _gaps(bg_height - sum(heights), len(shelves), buffer, random)
+    if y_gaps is None:
+        raise ValueError('Patches too big to fit in the background')
 
-    positions = []
-    current_x = 0
-    for patch in range(patch_nr):
-        x_pos = current_x + width_buffer
-        current_x = x_pos + patch_sizes[patch, 0]
-        y_pos = height_buffer
-        positions.append([x_pos, y_pos])
+    positions = [None] * len(sizes)
+    y_pos = 0
+    for shelf, shelf_height, y_gap in zip(shelves, heights, y_gaps):
+        y_pos += y_gap
+        if random is not None:
+            random.shuffle(shelf)
+        widths = sum(sizes[patch][0] for patch in shelf)
+        x_gaps = _gaps(bg_width - widths, len(shelf), buffer, random)
+        x_pos = 0
+        for patch, x_gap in zip(shelf, x_gaps):
+            x_pos += x_gap
+            offset = 0
+            if random is not None:
+                offset = random.randint(0, shelf_height - sizes[patch][1] + 1)
+            positions[patch] = [int(x_pos), int(y_pos + offset)]
+            x_pos += sizes[patch][0]
+        y_pos += shelf_height
 
     return positions
 
 
+def _gaps(space, count, buffer, random=None):
+    """Splits free space in the count + 1 gaps before, between and after
+    count items.
+
+    Every gap is at least buffer wide. The rest is split evenly, rounded
+    down, or randomly. Returns None if the space isn't enough.
+
+    """
+    spare = space - buffer * (count + 1)
+    if spare < 0:
+        return None
+    if random is None:
+        return [buffer + spare // (count + 1)] * (count + 1)
+
+    cuts = numpy.sort(random.randint(0, spare + 1, count))
+    bounds = numpy.concatenate([[0], cuts, [spare]])
+
+    return [buffer + int(gap) for gap in numpy.diff(bounds)]
+
+
 def synthetic(parameters):
     """Creates an image from a background and smaller patches.
 
@@ -133,6 +199,14 @@ def synthetic(parameters):
     the top left pixel of each patch. Pasting patches is naive, the user must
     provide suitable patches and positions.
 
+    Every patch is alpha blended only with the part of the background under
+    it, so the cost depends on the size of the patches and not on the size of
+    the background. The blending is exactly the one of `Image.composite`.
+
+    Very large images can be written directly to an npy file, one strip of
+    rows at a time, by setting parameters['path']. The result is then a
+    memory map of the file, with shape (height, width, 4).
+
     .. warning::
 
         Pasting to positions on the boundary of the background will not result
@@ -144,43 +218,66 @@ def synthetic(parameters):
                                list is always the background
     :type parameters['data']: PIL.Image
     :param parameters['positions']: Where to place each patch in final image,
-                                    given in [[row, column], [...]], if this
+                                    given in [[column, row], [...]], if this
                                     is set to 'auto' the positions are
                                     calculated automatically with
-                                    synth_positions()
+                                    synth_positions(), which also takes
+                                    the optional buffer and seed
     :type parameters['positions']: list or str
+    :param parameters['path']: optional, npy file to write the image to
+    :type parameters['path']: string
+    :param parameters['strip_rows']: how many rows to write at a time to the
+                                     npy file, defaults to 1024
+    :type parameters['strip_rows']: integer
 
-    :return: PIL.Image with mode 'RGBA'
+    :return: PIL.Image with mode 'RGBA', or numpy.memmap if path is set
 
     """
     images = parameters['data']
-    positions = []
-    if parameters['positions'] is not 'auto':
+    if parameters['positions'] != 'auto':
         positions = parameters['positions']
     else:
-        positions = synth_positions({'data': images})
-
-    # convert all input images to RGBA and replace them in th container
-    index = 0
-    for img in images:
-        if img.mode is not 'RGBA':
-            images[index] = img.convert('RGBA')
-        index += 1
-
-    synth = images.pop(0)
-    patches = images
-    index = 0
-    if len(positions) is len(patches):
-        for patch in patches:
-            layer = Image.new('RGBA', synth.size)
-            layer.paste(patch, tuple(positions[index]))
-            synth = Image.composite(layer, synth, layer)
-            index += 1
-    else:
-        if len(positions) > len(patches):
-            raise ValueError('More positions than patches')
-        else:
-            raise ValueError('Less positions than patches')
+        positions = synth_positions(parameters)
+
+    patches = images[1:]
+    if len(positions) > len(patches):
+        raise ValueError('More positions than patches')
+    elif len(positions) < len(patches):
+        raise ValueError('Less positions than patches')
+
+    background = _rgba(images[0])
+    # the same patch object is often pasted many times
+    arrays = {}
+    for patch in patches:
+        if id(patch) not in arrays:
+            arrays[id(patch)] = _rgba(patch)
+    patches = [arrays[id(patch)] for patch in patches]
+    positions = [(int(column), int(row)) for column, row in positions]
+
+    path = parameters.get('path')
+    if path is None:
+        _composite(background, 0, patches, positions)
+        return Image.fromarray(background, 'RGBA')
+
+    height = background.shape[0]
+    strip_rows = parameters.get('strip_rows', 1024)
+    synth = npy_format.open_memmap(path, mode='w+', dtype='uint8',
+                                   shape=background.shape)
+    # the patches overlapping each strip, in pasting order
+    strips = [[] for _ in range(0, height, strip_rows)]
+    for index, (patch, (_, row)) in enumerate(zip(patches, positions)):
+        first = max(row, 0) // strip_rows
+        last = (min(row + patch.shape[0], height) - 1) // strip_rows
+        for strip in range(first, last + 1):
+            strips[strip].append(index)
+
+    for strip, indices in enumerate(strips):
+        top = strip * strip_rows
+        rows = synth[top:top + strip_rows]
+        rows[...] = background[top:top + strip_rows]
+        _composite(rows, top, [patches[i] for i in indices],
+                   [positions[i] for i in indices])
+    synth.flush()
 
     return synth
 
@@ -191,24 +288,85 @@ def tiled(parameters):
     This works regardless the size of the tile and the final image. The tile
     is cropped to the image boundaries.
 
+    The tile is repeated with numpy.tile, so it isn't pasted one at a time.
+    Very large images can be written directly to an npy file, one strip of
+    rows at a time, by setting parameters['path']. The result is then a
+    memory map of the file.
+
     :param parameters['data']: the basic image to use as tile
     :type parameters['data']: PIL.Image
     :param parameters['size']: [width, height] of the resulting image
     :type parameters['size']: list
+    :param parameters['path']: optional, npy file to write the image to
+    :type parameters['path']: string
+    :param parameters['strip_rows']: how many rows to write at a time to the
+                                     npy file, defaults to 1024
+    :type parameters['strip_rows']: integer
 
-    :return: PIL.Image
+    :return: PIL.Image, or numpy.memmap if path is set
 
     """
     tile = parameters['data'][0]
-    size = parameters['size']
+    width, height = parameters['size']
+    path = parameters.get('path')
+
+    if tile.mode not in NUMPY_MODES:
+        if path is not None:
+            raise TypeError("Can't write %s images to npy" % tile.mode)
+        img = Image.new(tile.mode, (width, height))
+        for w_coord in range(0, width, tile.size[0]):
+            for h_coord in range(0, height, tile.size[1]):
+                img.paste(tile, (w_coord, h_coord))
+        return img
+
+    arr = numpy.asarray(tile)
+    repeats = (-(-height // arr.shape[0]), -(-width // arr.shape[1])) + \
+              (1,) * (arr.ndim - 2)
+
+    if path is None:
+        result = numpy.tile(arr, repeats)[:height, :width]
+        return Image.fromarray(numpy.ascontiguousarray(result), tile.mode)
+
+    strip_rows = parameters.get('strip_rows', 1024)
+    img = npy_format.open_memmap(path, mode='w+', dtype=arr.dtype,
+                                 shape=(height, width) + arr.shape[2:])
+    for top in range(0, height, strip_rows):
+        rows = numpy.arange(top, min(top + strip_rows, height)) % \
+            arr.shape[0]
+        strip = numpy.tile(arr[rows], (1,) + repeats[1:])
+        img[top:top + len(rows)] = strip[:, :width]
+    img.flush()
 
-    img = Image.new(tile.mode, tuple(size))
+    return img
 
-    w_pos = range(0, size[0], tile.size[0])
-    h_pos = range(0, size[1], tile.size[1])
 
-    for w_coord in w_pos:
-        for h_coord in h_pos:
-            img.paste(tile, (w_coord, h_coord))
+def _rgba(img):
+    """Returns an RGBA copy of an image as an array"""
+    if img.mode != 'RGBA':
+        img = img.convert('RGBA')
+    return numpy.array(img)
 
-    return img
+
+def _composite(synth, top, patches, positions):
+    """Alpha blends patches on rows of an RGBA array, in place.
+
+    Only the part of synth under each patch is blended, with the integer
+    arithmetic of PIL's Image.composite.
+
+    """
+    height, width = synth.shape[:2]
+    for patch, (column, row) in zip(patches, positions):
+        row -= top
+        rows = slice(max(row, 0), min(row + patch.shape[0], height))
+        columns = slice(max(column, 0), min(column + patch.shape[1], width))
+        if rows.start >= rows.stop or columns.start >= columns.stop:
+            continue
+        under = synth[rows, columns]
+        over = patch[rows.start - row:rows.stop - row,
+                     columns.start - column:columns.stop - column]
+
+        alpha = over[:, :, 3:].astype('uint32')
+        blended = under * (255 - alpha) + over * alpha + 128
+        blended += blended >> 8
+        blended >>= 8
+        under[...] = blended
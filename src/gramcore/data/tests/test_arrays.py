@@ -95,6 +95,16 @@ def test_gaussian_noise():
     assert_almost_equal(abs(noise.std() - stddev), 0.0, places=1)
 
 
+def test_gaussian_noise_seed():
+    """The same seed gives the same noise"""
+    parameters = {'shape': (10, 10), 'mean': 0, 'stddev': 1, 'seed': 3}
+
+    first = arrays.gaussian_noise(parameters)
+    second = arrays.gaussian_noise(parameters)
+
+    numpy.testing.assert_array_equal(first, second)
+
+
 def test_load_txt():
     """Load txt fixture and check value"""
     parameters = {'path': 'array.txt'}
@@ -228,3 +238,197 @@ def test_dsm():
     # make sure no other values where changed
     assert_equal(dsm.sum(), 23148)
 
+
+def test_dsm_inplace():
+    """Create a DSM elevating the DTM itself"""
+    dtm = numpy.arange(100)
+    dtm.shape = (10, 10)
+    mask = numpy.zeros((10, 10))
+    mask[2:5, 2:5] = 1
+
+    parameters = {
+        'data': [dtm, mask],
+        'delta_height': 1000,
+        'inplace': True
+    }
+
+    dsm = arrays.dsm(parameters)
+
+    assert dsm is dtm
+    assert numpy.all(dtm[2:5, 2:5] == 1044)
+
+
+def test_dsm_structure():
+    """Diagonal neighbours belong to the same blob with a full structure"""
+    dtm = numpy.arange(100)
+    dtm.shape = (10, 10)
+    mask = numpy.zeros((10, 10))
+    # two squares touching only at their corners
+    mask[2:4, 2:4] = 1
+    mask[4:6, 4:6] = 1
+
+    parameters = {
+        'data': [dtm, mask],
+        'delta_height': 1000
+    }
+
+    separate = arrays.dsm(parameters)
+    parameters['structure'] = [[1, 1, 1], [1, 1, 1], [1, 1, 1]]
+    connected = arrays.dsm(parameters)
+
+    assert numpy.all(separate[2:4, 2:4] == 1033)
+    assert numpy.all(separate[4:6, 4:6] == 1055)
+    assert numpy.all(connected[2:4, 2:4] == 1055)
+    assert numpy.all(connected[4:6, 4:6] == 1055)
+
+
+def test_dsm_empty_mask():
+    """A DSM without blobs equals the DTM"""
+    dtm = numpy.arange(100.0)
+    dtm.shape = (10, 10)
+    mask = numpy.zeros((10, 10))
+
+    parameters = {
+        'data': [dtm, mask],
+        'delta_height': 1000
+    }
+
+    dsm = arrays.dsm(parameters)
+
+    numpy.testing.assert_array_equal(dsm, dtm)
+
+
+def test_dtm_dtype():
+    """Create an int16 DTM with rounded heights"""
+    parameters = {
+        'slope_step': 0.5,
+        'min_value': 10,
+        'size': (4, 5),
+        'dtype': 'int16'
+    }
+
+    dtm = arrays.dtm(parameters)
+
+    assert_equal(dtm.dtype, numpy.dtype('int16'))
+    # 10, 10.5, 11, 11.5, 12 rounded to the nearest even
+    numpy.testing.assert_array_equal(dtm[3], [10, 10, 11, 12, 12])
+
+
+def test_dtm_path():
+    """Write a DTM to an npy file in chunks of rows"""
+    parameters = {
+        'slope_step': 1.0,
+        'min_value': 0.0,
+        'size': (10, 10),
+        'dtype': 'float32',
+        'path': 'dtm.npy',
+        'chunk_rows': 3
+    }
+
+    dtm = arrays.dtm(parameters)
+    saved = numpy.load('dtm.npy')
+    os.remove('dtm.npy')
+
+    assert isinstance(dtm, numpy.memmap)
+    assert_equal(saved.dtype, numpy.dtype('float32'))
+    assert_equal(saved.shape, (10, 10))
+    assert_equal(saved.sum(), numpy.arange(10).sum() * 10)
+
+
+def test_load_npy_mmap():
+    """Load npy as a read only memory map"""
+    numpy.save('mmap.npy', numpy.arange(200.0).reshape((20, 10)))
+    parameters = {'path': 'mmap.npy', 'mmap_mode': 'r'}
+    arr = arrays.load(parameters)
+    assert isinstance(arr, numpy.memmap)
+    assert_equal(arr[10, 5], 105)
+    del arr
+    os.remove('mmap.npy')
+
+
+def test_save_load_npz():
+    """Save two arrays to an npz archive and load them"""
+    first = numpy.zeros((20, 10))
+    second = numpy.ones((5, 5))
+    parameters = {
+        'path': 'arrays.npz',
+        'data': [first, second],
+        'names': ['first', 'second'],
+        'compressed': True
+    }
+    assert arrays.save(parameters)
+
+    archive = arrays.load({'path': 'arrays.npz'})
+    by_name = arrays.load({'path': 'arrays.npz', 'member': 'second'})
+    os.remove('arrays.npz')
+
+    assert_equal(sorted(archive), ['first', 'second'])
+    assert_equal(archive['first'].shape, (20, 10))
+    assert_equal(by_name.sum(), 25)
+
+    # without names the arrays can be loaded by their index
+    del parameters['names']
+    assert arrays.save(parameters)
+    by_index = arrays.load({'path': 'arrays.npz', 'member': 1})
+    os.remove('arrays.npz')
+
+    assert_equal(by_index.shape, (5, 5))
+
+
+def test_save_npy_chunked():
+    """Save a non contiguous 3D array to npy a few rows at a time"""
+    arr = numpy.arange(20 * 10 * 3, dtype='float32')
+    arr.shape = (20, 10, 3)
+    band = arr[:, :, 1]
+
+    parameters = {'path': 'array.npy', 'data': [band], 'chunk_rows': 3}
+
+    assert arrays.save(parameters)
+
+    saved = numpy.load('array.npy')
+    assert_equal(saved.dtype, numpy.dtype('float32'))
+    numpy.testing.assert_array_equal(saved, band)
+
+
+def test_load_txt_chunked():
+    """Load a txt with comments and a delimiter in chunks of rows"""
+    arr = numpy.arange(7 * 3, dtype='float')
+    arr.shape = (7, 3)
+    numpy.savetxt('chunked.txt', arr, delimiter=',', header='comment')
+
+    parameters = {'path': 'chunked.txt', 'delimiter': ',', 'chunk_rows': 2}
+    result = arrays.load(parameters)
+    os.remove('chunked.txt')
+
+    numpy.testing.assert_array_equal(result, arr)
+
+
+@raises(ValueError)
+def test_load_txt_columns_fail():
+    """Fail to load a txt with rows of different length"""
+    with open('ragged.txt', 'w') as txt:
+        txt.write('1 2 3\n4 5\n')
+    try:
+        arrays.load({'path': 'ragged.txt'})
+    finally:
+        os.remove('ragged.txt')
+
+
+def test_save_txt_chunked():
+    """Save a 2D array to txt in chunks, same output as numpy.savetxt"""
+    arr = numpy.random.rand(7, 3)
+
+    parameters = {
+        'path': 'array.txt',
+        'data': [arr],
+        'fmt': '%.4f',
+        'delimiter': ';',
+        'chunk_rows': 2
+    }
+    assert arrays.save(parameters)
+    numpy.savetxt('expected.txt', arr, fmt='%.4f', delimiter=';')
+
+    with open('array.txt') as result:
+        with open('expected.txt') as expected:
+            assert_equal(result.read(), expected.read())
+    os.remove('expected.txt')
@@ -167,6 +167,57 @@ def test_synth_positions():
     assert_equal(positions[1][1], 5)
 
 
+def test_synth_positions_shelves():
+    """Pack patches wider than the background in shelves"""
+    background = Image.new('RGB', (30, 40))
+    patches = [Image.new('RGB', (10, 10)) for _ in range(6)]
+    patches.append(Image.new('RGB', (20, 20)))
+
+    parameters = {'data': [background] + patches}
+
+    positions = images.synth_positions(parameters)
+
+    # the tallest patch starts the first shelf, then 1 more fits next to it
+    assert_equal(positions[-1], [0, 0])
+    assert_equal(positions[0], [20, 0])
+    # the second shelf has the other 5 patches, only 3 fit in it
+    assert_equal(positions[1:4], [[0, 20], [10, 20], [20, 20]])
+    # the third shelf
+    assert_equal(positions[4:6], [[3, 30], [16, 30]])
+
+
+def test_synth_positions_buffer():
+    """Keep a minimum buffer around every patch"""
+    background = Image.new('RGB', (50, 50))
+    patches = [Image.new('RGB', (10, 10)) for _ in range(8)]
+
+    parameters = {'data': [background] + patches, 'buffer': 3}
+
+    positions = images.synth_positions(parameters)
+
+    occupied = numpy.zeros((50, 50), dtype='uint8')
+    for x_pos, y_pos in positions:
+        assert x_pos >= 3 and y_pos >= 3
+        assert x_pos + 10 <= 47 and y_pos + 10 <= 47
+        # grow every patch by 1 pixel, grown patches must not overlap
+        occupied[y_pos - 1:y_pos + 11, x_pos - 1:x_pos + 11] += 1
+    assert_equal(occupied.max(), 1)
+
+
+def test_synth_positions_seed():
+    """The same seed gives the same random layout"""
+    background = Image.new('RGB', (100, 100))
+    patches = [Image.new('RGB', (10, 5 + i)) for i in range(20)]
+
+    parameters = {'data': [background] + patches, 'seed': 7}
+
+    positions = images.synth_positions(parameters)
+
+    assert_equal(images.synth_positions(parameters), positions)
+    parameters['seed'] = 8
+    assert images.synth_positions(parameters) != positions
+
+
 @raises(ValueError)
 def test_synth_positions_small_width():
     """Fail in synth_positions because of small backgound width"""
@@ -244,6 +295,49 @@ def test_synthetic_auto():
     assert_equal(synth.getpixel((5, 1)), (0, 0, 255, 255))
 
 
+def test_synthetic_alpha():
+    """Blend translucent patches exactly as Image.composite does"""
+    background = Image.new('RGBA', (30, 20), (10, 100, 200, 255))
+    patch = Image.new('RGBA', (10, 10), (255, 0, 0, 77))
+    positions = [[-5, 3], [25, 15]]
+
+    parameters = {
+        'data': [background, patch, patch],
+        'positions': positions
+    }
+
+    synth = images.synthetic(parameters)
+
+    expected = background
+    for position in positions:
+        layer = Image.new('RGBA', background.size)
+        layer.paste(patch, tuple(position))
+        expected = Image.composite(layer, expected, layer)
+    numpy.testing.assert_array_equal(numpy.asarray(synth),
+                                     numpy.asarray(expected))
+
+
+def test_synthetic_path():
+    """Write a synthetic image to npy in strips"""
+    background = Image.new('RGB', (100, 50), (125, 125, 125))
+    red = Image.new('RGB', (10, 5), (255, 0, 0))
+    positions = [[0, 0], [50, 8], [20, 45]]
+
+    parameters = {
+        'data': [background, red, red, red],
+        'positions': positions
+    }
+    expected = numpy.asarray(images.synthetic(parameters))
+    parameters['path'] = 'synthetic.npy'
+    parameters['strip_rows'] = 10
+
+    synth = images.synthetic(parameters)
+
+    numpy.testing.assert_array_equal(synth, expected)
+    numpy.testing.assert_array_equal(numpy.load('synthetic.npy'), expected)
+    os.remove('synthetic.npy')
+
+
 @raises(ValueError)
 def test_synthetic_less_positions():
     """Fail to create synthetic image, less positions than patches"""
@@ -290,3 +384,20 @@ def test_tiled():
     assert_equal(tiled.size, tuple(size))
     assert_equal(tiled.getpixel((5, 5)), (0, 255, 0))
     assert_equal(tiled.getpixel((15, 5)), (0, 255, 0))
+
+
+def test_tiled_path():
+    """Write a tiled image to npy in strips"""
+    img = Image.new('RGB', (10, 10))
+    img.putpixel((5, 5), (0, 255, 0))
+
+    parameters = {'data': [img], 'size': [25, 25]}
+    expected = numpy.asarray(images.tiled(parameters))
+    parameters['path'] = 'tiled.npy'
+    parameters['strip_rows'] = 4
+
+    tiled = images.tiled(parameters)
+
+    assert_equal(tiled.shape, (25, 25, 3))
+    numpy.testing.assert_array_equal(tiled, expected)
+    os.remove('tiled.npy')
@@ -0,0 +1 @@
+"""Execution of task files"""
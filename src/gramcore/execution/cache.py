@@ -0,0 +1,256 @@
+"""Persistent cache of task results across executions of task files.
+
+Task files are often executed again after changing only their last tasks.
+The cache keeps the results of previous executions on disk, so unchanged
+tasks are loaded instead of computed again.
+
+Every task gets a key, the SHA-1 hash of:
+
+    1. the task name,
+    2. its parameters as canonical JSON, without input_index,
+    3. the keys of its input tasks, in input_index order,
+    4. the size and modification time of any file named in its parameters.
+
+Since the keys of the inputs are part of the key, a change in a task
+changes the keys of all the tasks that depend on it, the same way it would
+change their results. Results are never hashed, which would take as long as
+loading them.
+
+Arrays are stored as npy files and loaded as copy-on-write memory maps, any
+other result is pickled. The least recently used results are evicted when
+the cache grows beyond its maximum size.
+
+Tasks that write files are never cached, e.g. arrays.save, tasks with an
+`output` parameter and tasks other than loads with a `path`, e.g. arrays.dtm
+writing its result. Random tasks are only cached with a `seed`, otherwise a
+new execution would get the same random data. Caching can also be disabled
+for any task by setting `"cache": false` in its parameters.
+
+"""
+import os
+import json
+import pickle
+import hashlib
+import logging
+import tempfile
+
+import numpy
+
+
+logger = logging.getLogger('gramcore')
+
+
+# bump this when the key or the stored format change
+VERSION = 1
+
+# tasks whose results are random unless they are given a seed
+RANDOM = ['arrays.gaussian_noise']
+
+
+def cacheable(arg):
+    """Returns whether the result of a task can be cached.
+
+    :param arg: a task of the JSON task file
+    :type arg: dict
+
+    :return: bool
+
+    """
+    task = arg['task']
+    parameters = arg['parameters']
+    if not parameters.get('cache', True):
+        return False
+    if task.endswith('.save') or 'output' in parameters:
+        return False
+    # loads read their path, the rest write their result to it
+    if 'path' in parameters and not task.endswith('.load'):
+        return False
+    if task in RANDOM and parameters.get('seed') is None:
+        return False
+
+    return True
+
+
+class ResultCache(object):
+    """On disk cache of task results.
+
+    :param directory: where to keep the results, it is created if missing
+    :type directory: string
+    :param max_size: maximum bytes of the cached results, defaults to None
+                     which means no limit
+    :type max_size: integer
+
+    """
+
+    def __init__(self, directory, max_size=None):
+        self.directory = directory
+        self.max_size = max_size
+        self._pinned = set()
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+
+    def key(self, arg, input_keys):
+        """Returns the key of a task.
+
+        :param arg: a task of the JSON task file
+        :type arg: dict
+        :param input_keys: the keys of its input tasks, in input_index order
+        :type input_keys: list
+
+        :return: string, hexadecimal SHA-1 digest
+
+        """
+        parameters = dict((name, value)
+                          for name, value in arg['parameters'].items()
+                          if name not in ('input_index', 'data', 'cache'))
+        files = {}
+        for name, value in parameters.items():
+            if isinstance(value, (type(''), type(u''))) and \
+               os.path.isfile(value):
+                stat = os.stat(value)
+                files[name] = [stat.st_size, stat.st_mtime]
+
+        description = json.dumps([VERSION, arg['task'], parameters,
+                                  input_keys, files],
+                                 sort_keys=True, separators=(',', ':'),
+                                 default=repr)
+
+        return hashlib.sha1(description.encode('utf-8')).hexdigest()
+
+    def keys(self, tasks, deps):
+        """Returns the keys of all the tasks of a task file.
+
+        :param tasks: the tasks section of a JSON task file
+        :type tasks: list
+        :param deps: the input indices of every task, as returned by
+                     gramcore.execution.graph.dependencies()
+        :type deps: list
+
+        :return: list of strings
+
+        """
+        keys = []
+        for arg, inputs in zip(tasks, deps):
+            keys.append(self.key(arg, [keys[i] for i in inputs]))
+
+        return keys
+
+    def __contains__(self, key):
+        return self._path(key) is not None
+
+    def get(self, key):
+        """Loads a cached result and marks it as recently used.
+
+        :param key: key of the task, as returned by key()
+        :type key: string
+
+        :return: the result, or raise KeyError if it isn't cached
+
+        """
+        path = self._path(key)
+        if path is None:
+            raise KeyError(key)
+
+        os.utime(path, None)
+        if path.endswith('.npy'):
+            return numpy.load(path, mmap_mode='c')
+        with open(path, 'rb') as stored:
+            return pickle.load(stored)
+
+    def put(self, key, result):
+        """Stores a result, evicting old ones if the cache gets too large.
+
+        Results that can't be pickled are not stored.
+
+        :param key: key of the task, as returned by key()
+        :type key: string
+        :param result: what the task returned
+
+        :return: True if the result was stored, otherwise False
+
+        """
+        handle, temporary = tempfile.mkstemp(dir=self.directory,
+                                             suffix='.tmp')
+        try:
+            with os.fdopen(handle, 'wb') as stored:
+                if isinstance(result, numpy.ndarray):
+                    numpy.save(stored, result)
+                    extension = '.npy'
+                else:
+                    pickle.dump(result, stored, pickle.HIGHEST_PROTOCOL)
+                    extension = '.pkl'
+        except (pickle.PicklingError, TypeError, AttributeError):
+            os.remove(temporary)
+            logger.debug("Result with key %s can't be cached", key)
+            return False
+
+        # renaming is atomic, concurrent executions never see partial files
+        os.rename(temporary, os.path.join(self.directory, key + extension))
+        self.evict()
+
+        return True
+
+    def pin(self, keys):
+        """Keeps results from being evicted until they are unpinned, e.g.
+        results that an execution plans to load.
+
+        :param keys: keys of the results
+        :type keys: list
+        """
+        self._pinned.update(keys)
+
+    def unpin(self, keys):
+        """Lets pinned results be evicted again.
+
+        :param keys: keys of the results
+        :type keys: list
+        """
+        self._pinned.difference_update(keys)
+
+    def evict(self):
+        """Deletes least recently used results until the cache fits in
+        max_size. Pinned results are never deleted.
+
+        :return: list of deleted files
+
+        """
+        if self.max_size is None:
+            return []
+
+        entries = []
+        for name in os.listdir(self.directory):
+            if not name.endswith(('.npy', '.pkl')):
+                continue
+            path = os.path.join(self.directory, name)
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+
+        entries.sort()
+        total = sum(size for _, size, _ in entries)
+        evicted = []
+        for _, size, path in entries:
+            if total <= self.max_size:
+                break
+            # pinned results count towards the size, but are kept
+            if os.path.basename(path)[:-len('.npy')] in self._pinned:
+                continue
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            total -= size
+            evicted.append(path)
+            logger.debug("Evicted %s from cache", path)
+
+        return evicted
+
+    def _path(self, key):
+        """Returns the path of a cached result or None"""
+        for extension in ('.npy', '.pkl'):
+            path = os.path.join(self.directory, key + extension)
+            if os.path.exists(path):
+                return path
+        return None
@@ -0,0 +1,362 @@
+"""Dependency graph execution of JSON task files.
+
+Every task in a task file can request the results of previously executed
+tasks through `parameters['input_index']`. These indices turn the flat list of
+tasks into a directed acyclic graph. Tasks that don't depend on each other,
+e.g. loading and filtering four different tiles, can run at the same time.
+
+Tasks are dispatched as soon as all of their inputs are available. With a
+single worker they run one after the other in file order, which is exactly
+how gram used to work. Results are kept in a ResultStore, which drops every
+intermediate result once the last task using it has finished.
+
+With a ResultCache, tasks whose results are cached from a previous execution
+are loaded instead of executed, and tasks that only feed cached tasks aren't
+executed at all.
+
+"""
+import sys
+import time
+import logging
+import traceback
+from multiprocessing import Pool
+from multiprocessing.pool import ThreadPool
+
+import numpy
+
+from gramcore.execution import profiling
+from gramcore.execution.cache import cacheable
+from gramcore.execution.store import ResultStore
+
+try:
+    from Queue import Queue
+except ImportError:
+    from queue import Queue
+
+
+logger = logging.getLogger('gramcore')
+
+
+POOLS = {
+    'thread': ThreadPool,
+    'process': Pool,
+}
+
+
+def dependencies(tasks):
+    """Returns the input indices of every task.
+
+    Negative indices are relative to the task that uses them, the same way
+    they would be when indexing the list of results, e.g. -1 is the previous
+    task. They are all converted to absolute indices. Duplicates are kept,
+    since a task may receive the same input twice.
+
+    :param tasks: the tasks section of a JSON task file
+    :type tasks: list
+
+    :return: list of lists, the absolute input indices of each task, or raise
+             ValueError if a task refers to itself or to a later task
+
+    """
+    deps = []
+    for index, arg in enumerate(tasks):
+        inputs = []
+        for input_index in arg['parameters'].get('input_index', []):
+            absolute = input_index + index if input_index < 0 else input_index
+            if absolute < 0 or absolute >= index:
+                raise ValueError('Task %d (%s) has invalid input index %d' %
+                                 (index, arg['task'], input_index))
+            inputs.append(absolute)
+        deps.append(inputs)
+
+    return deps
+
+
+def consumers(deps):
+    """Inverts the dependencies, so it returns which tasks use each result.
+
+    :param deps: the input indices of every task, as returned by
+                 dependencies()
+    :type deps: list
+
+    :return: list of sorted lists, the indices of the consumers of each task
+
+    """
+    users = [set() for _ in deps]
+    for index, inputs in enumerate(deps):
+        for input_index in inputs:
+            users[input_index].add(index)
+
+    return [sorted(user) for user in users]
+
+
+def plan(tasks, deps, keys, cache):
+    """Finds which tasks to execute and which to load from a cache.
+
+    Starting from the tasks that no other task uses, the graph is walked
+    backwards. A cached task is loaded and the tasks it takes input from
+    aren't needed for it. Any other task is executed, so its inputs are
+    needed.
+
+    :param tasks: the tasks section of a JSON task file
+    :type tasks: list
+    :param deps: the input indices of every task, as returned by
+                 dependencies()
+    :type deps: list
+    :param keys: the cache key of every task
+    :type keys: list
+    :param cache: the cache of task results
+    :type cache: gramcore.execution.cache.ResultCache
+
+    :return: tuple of sets (executed, cached), tasks in neither of them are
+             skipped
+
+    """
+    needed = set(index for index, user in enumerate(consumers(deps))
+                 if not user)
+    executed = set()
+    cached = set()
+    for index in reversed(range(len(tasks))):
+        if index not in needed:
+            continue
+        if cacheable(tasks[index]) and keys[index] in cache:
+            cached.add(index)
+        else:
+            executed.add(index)
+            needed.update(deps[index])
+
+    return executed, cached
+
+
+def with_dtype(tasks, dtype):
+    """Sets the dtype of every task that doesn't set its own.
+
+    Only floating dtypes are accepted. The dtype option of most tasks is the
+    precision of their floating results, and integer ones would make them
+    fail or truncate their results.
+
+    :param tasks: the tasks section of a JSON task file, it is not modified
+    :type tasks: list
+    :param dtype: the default dtype, e.g. 'float32'
+    :type dtype: string
+
+    :return: list, a copy of the tasks
+
+    """
+    if numpy.dtype(dtype).kind != 'f':
+        raise ValueError('The dtype of a task file must be floating, not %s'
+                         % dtype)
+
+    result = []
+    for arg in tasks:
+        arg = dict(arg)
+        arg['parameters'] = dict(arg['parameters'])
+        arg['parameters'].setdefault('dtype', dtype)
+        result.append(arg)
+
+    return result
+
+
+def run_task(task, parameters):
+    """Executes a single task and measures its wall time.
+
+    Exceptions are caught and returned, because a pool would otherwise never
+    report back a failed task and the scheduler would wait forever.
+
+    :param task: the function of the task, one of those in gram.MAPPING
+    :type task: function
+    :param parameters: the task parameters, including the input data
+    :type parameters: dict
+
+    :return: tuple (success, result or exception, elapsed seconds)
+
+    """
+    start = time.time()
+    try:
+        result = task(parameters)
+    except Exception:
+        logger.error(''.join(traceback.format_exception(*sys.exc_info())))
+        return False, sys.exc_info()[1], time.time() - start
+
+    return True, result, time.time() - start
+
+
+def execute(tasks, mapping, workers=1, pool='thread', memory_budget=None,
+            spill_dir=None, cache=None, profiler=None, dtype=None):
+    """Executes the tasks of a JSON task file.
+
+    A task is dispatched as soon as all the tasks it takes input from have
+    finished. The task parameters are copied before adding the input data
+    to them, so the tasks section is not modified.
+
+    Intermediate results are dropped as soon as their last consumer has
+    finished, so only the results of tasks that no other task uses are
+    returned. For details on spilling arrays to disk check
+    gramcore.execution.store.ResultStore.
+
+    With 'process' pools task functions, parameters and results have to be
+    picklable. 'thread' pools don't have this limitation and work well since
+    most numpy and scipy routines release the GIL.
+
+    With a cache, the results of cacheable tasks are stored in it and tasks
+    with cached results are loaded instead of executed, check plan().
+
+    With a profiler, every executed task is measured, check
+    gramcore.execution.profiling.
+
+    A floating dtype for the whole task file, e.g. 'float32', is given to
+    every task that doesn't set its own dtype. Tasks without a dtype option
+    ignore it.
+
+    :param tasks: the tasks section of a JSON task file
+    :type tasks: list
+    :param mapping: task name to function, e.g. gram.MAPPING
+    :type mapping: dict
+    :param workers: how many tasks can run at the same time, defaults to 1
+    :type workers: integer
+    :param pool: 'thread' or 'process', defaults to 'thread'
+    :type pool: string
+    :param memory_budget: maximum bytes of arrays to keep in memory, larger
+                          results are spilled to disk, defaults to None
+                          which means no limit
+    :type memory_budget: integer
+    :param spill_dir: where to spill results, defaults to a temporary
+                      directory
+    :type spill_dir: string
+    :param cache: cache of task results, defaults to None
+    :type cache: gramcore.execution.cache.ResultCache
+    :param profiler: collects measurements of every executed task, defaults
+                     to None
+    :type profiler: gramcore.execution.profiling.Profiler
+    :param dtype: default floating dtype of the tasks, defaults to None
+                  which leaves the dtype to each task
+    :type dtype: string
+
+    :return: tuple (results, timings), lists with the result, None for
+             dropped intermediate results and skipped tasks, and the elapsed
+             seconds of every task, None for skipped tasks
+
+    """
+    if dtype is not None:
+        tasks = with_dtype(tasks, dtype)
+    deps = dependencies(tasks)
+    if cache is None:
+        keys = None
+        executed, cached = set(range(len(tasks))), set()
+    else:
+        keys = cache.keys(tasks, deps)
+        executed, cached = plan(tasks, deps, keys, cache)
+        # results stored during the execution must not evict the planned ones
+        cache.pin([keys[index] for index in cached])
+        for index in range(len(tasks)):
+            if index not in executed and index not in cached:
+                logger.info("Task %d (%s) skipped, its result isn't needed",
+                            index, tasks[index]['task'])
+    # only executed tasks take input from the store
+    deps = [inputs if index in executed else []
+            for index, inputs in enumerate(deps)]
+    planned = sorted(executed | cached)
+    users = consumers(deps)
+    store = ResultStore(users, memory_budget=memory_budget,
+                        spill_dir=spill_dir)
+    timings = [None] * len(tasks)
+
+    def close():
+        """Releases the store and the planned results of the cache"""
+        store.close()
+        if cache is not None:
+            cache.unpin([keys[index] for index in cached])
+
+    def prepare(index):
+        """Gets the function to call and its arguments for a task"""
+        arg = tasks[index]
+        parameters = dict(arg['parameters'])
+        if 'input_index' in parameters:
+            parameters['data'] = [store.get(i) for i in deps[index]]
+        logger.debug("Executing task %d: %s", index, arg['task'])
+        if profiler is not None:
+            return profiling.run_task, (mapping[arg['task']], parameters,
+                                        index, arg['task'],
+                                        profiler.profile_dir)
+        return run_task, (mapping[arg['task']], parameters)
+
+    def load(index):
+        """Loads the result of a task from the cache"""
+        start = time.time()
+        result = cache.get(keys[index])
+        cache.unpin([keys[index]])
+        return True, result, time.time() - start
+
+    def finish(index, outcome):
+        """Stores the outcome of a task or raises its exception"""
+        success, value, elapsed = outcome[:3]
+        if profiler is not None and len(outcome) > 3:
+            profiler.add(outcome[3])
+        if not success:
+            raise value
+        timings[index] = elapsed
+        if index in cached:
+            logger.info("Task %d (%s) cache hit, loaded in %.3f seconds",
+                        index, tasks[index]['task'], elapsed)
+        elif cache is not None and cacheable(tasks[index]):
+            logger.info("Task %d (%s) cache miss, finished in %.3f seconds",
+                        index, tasks[index]['task'], elapsed)
+            cache.put(keys[index], value)
+        else:
+            logger.info("Task %d (%s) finished in %.3f seconds",
+                        index, tasks[index]['task'], elapsed)
+        store.put(index, value)
+        for input_index in set(deps[index]):
+            store.release(input_index)
+
+    if pool not in POOLS:
+        raise ValueError('Unknown pool type %s' % pool)
+
+    if workers <= 1:
+        try:
+            for index in planned:
+                if index in cached:
+                    finish(index, load(index))
+                else:
+                    function, arguments = prepare(index)
+                    finish(index, function(*arguments))
+        finally:
+            close()
+        return store.results(len(tasks)), timings
+
+    waiting = [len(set(inputs)) for inputs in deps]
+    done = Queue()
+    workers_pool = POOLS[pool](workers)
+
+    def dispatch(index):
+        """Sends a task to the pool, its outcome is put in the done queue"""
+        if index in cached:
+            done.put((index, load(index)))
+            return
+        function, arguments = prepare(index)
+        workers_pool.apply_async(function, arguments,
+                                 callback=lambda outcome: done.put((index,
+                                                                    outcome)))
+
+    try:
+        for index in planned:
+            if waiting[index] == 0:
+                dispatch(index)
+
+        for _ in range(len(planned)):
+            index, outcome = done.get()
+            finish(index, outcome)
+            for user in users[index]:
+                waiting[user] -= 1
+                if waiting[user] == 0:
+                    dispatch(user)
+    except Exception:
+        workers_pool.terminate()
+        raise
+    else:
+        workers_pool.close()
+    finally:
+        workers_pool.join()
+        close()
+
+    return store.results(len(tasks)), timings
@@ -0,0 +1,214 @@
+"""Per task instrumentation of task file executions.
+
+When a Profiler is given to gramcore.execution.graph.execute, every
+executed task is measured and a record is written with:
+
+    1. the task index and name, the process and thread that executed it,
+    2. its start time, wall time and CPU time in seconds,
+    3. how much the peak resident memory of the process grew, in KB,
+    4. the shape, dtype and bytes of its input arrays and of its result.
+
+Records are written either as JSON lines, one per task, or as a Chrome trace
+that can be opened in chrome://tracing or https://ui.perfetto.dev to see
+which tasks ran when. Optionally, every task is also run under cProfile and
+its statistics are dumped to a file, to be inspected with pstats.
+
+Without a Profiler nothing is measured, so there is no overhead.
+
+.. note::
+
+    The peak resident memory is a high water mark of the whole process.
+    When tasks run at the same time, the growth is attributed to whichever
+    of them happened to reach the new peak. Run with a single worker for
+    exact attribution.
+
+"""
+import os
+import sys
+import json
+import time
+import cProfile
+import threading
+import traceback
+import logging
+
+import numpy
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+
+logger = logging.getLogger('gramcore')
+
+
+def cpu_time():
+    """Returns the CPU time of the current thread, if the platform can
+    measure it, otherwise of the whole process.
+
+    """
+    if hasattr(time, 'thread_time'):
+        return time.thread_time()
+    if resource is not None:
+        usage = resource.getrusage(resource.RUSAGE_SELF)
+        return usage.ru_utime + usage.ru_stime
+    return time.clock()
+
+
+def peak_rss():
+    """Returns the peak resident memory of the process in KB, or None"""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # macOS reports bytes, Linux KB
+    return peak // 1024 if sys.platform == 'darwin' else peak
+
+
+def describe(value):
+    """Returns the shape, dtype and bytes of an array, or its type.
+
+    :param value: a task input or result, lists and tuples are described
+                  element by element
+    :type value: anything
+
+    :return: dict, or list of dicts
+
+    """
+    if isinstance(value, numpy.ndarray):
+        return {'shape': list(value.shape), 'dtype': str(value.dtype),
+                'nbytes': int(value.nbytes)}
+    if isinstance(value, (list, tuple)):
+        return [describe(item) for item in value]
+
+    return {'type': type(value).__name__}
+
+
+def run_task(task, parameters, index, name, profile_dir=None):
+    """Executes a single task and measures it.
+
+    It is the instrumented version of gramcore.execution.graph.run_task.
+
+    :param task: the function of the task
+    :type task: function
+    :param parameters: the task parameters, including the input data
+    :type parameters: dict
+    :param index: index of the task in the task file
+    :type index: integer
+    :param name: name of the task, e.g. 'arrays.load'
+    :type name: string
+    :param profile_dir: if set, dump the cProfile statistics of the task to
+                        this directory, defaults to None
+    :type profile_dir: string
+
+    :return: tuple (success, result or exception, elapsed seconds, record)
+
+    """
+    profile = cProfile.Profile() if profile_dir is not None else None
+    rss = peak_rss()
+    start = time.time()
+    cpu = cpu_time()
+    try:
+        if profile is not None:
+            result = profile.runcall(task, parameters)
+        else:
+            result = task(parameters)
+        success = True
+    except Exception:
+        logger.error(''.join(traceback.format_exception(*sys.exc_info())))
+        result = sys.exc_info()[1]
+        success = False
+    cpu = cpu_time() - cpu
+    elapsed = time.time() - start
+
+    record = {
+        'index': index,
+        'task': name,
+        'pid': os.getpid(),
+        'thread': threading.current_thread().ident,
+        'start': start,
+        'wall': elapsed,
+        'cpu': cpu,
+        'peak_rss_delta': None if rss is None else peak_rss() - rss,
+        'inputs': describe(parameters.get('data', [])),
+        'output': describe(result) if success else None,
+        'success': success,
+    }
+    if profile is not None:
+        if not os.path.isdir(profile_dir):
+            os.makedirs(profile_dir)
+        path = os.path.join(profile_dir, 'task-%d-%s.prof' % (index, name))
+        profile.dump_stats(path)
+        record['profile'] = path
+
+    return success, result, elapsed, record
+
+
+class Profiler(object):
+    """Collects the records of executed tasks and writes them to a file.
+
+    :param path: where to write the records
+    :type path: string
+    :param format: 'jsonl' for JSON lines, written as tasks finish, or
+                   'chrome' for a Chrome trace, written on close(), defaults
+                   to 'jsonl'
+    :type format: string
+    :param profile_dir: if set, run every task under cProfile and dump its
+                        statistics to this directory, defaults to None
+    :type profile_dir: string
+
+    """
+
+    def __init__(self, path, format='jsonl', profile_dir=None):
+        if format not in ('jsonl', 'chrome'):
+            raise ValueError('Unknown profile format %s' % format)
+        self.path = path
+        self.format = format
+        self.profile_dir = profile_dir
+        self.records = []
+        self._file = open(path, 'w')
+
+    def add(self, record):
+        """Adds the record of a task.
+
+        :param record: as returned by run_task()
+        :type record: dict
+
+        """
+        self.records.append(record)
+        if self.format == 'jsonl':
+            self._file.write(json.dumps(record, sort_keys=True) + '\n')
+            self._file.flush()
+
+    def trace(self):
+        """Returns the records as a Chrome trace.
+
+        :return: dict in the Trace Event Format
+
+        """
+        events = []
+        for record in self.records:
+            args = dict((key, value) for key, value in record.items()
+                        if key not in ('task', 'pid', 'thread', 'start',
+                                       'wall'))
+            events.append({
+                'name': record['task'],
+                'cat': 'task',
+                'ph': 'X',
+                'ts': record['start'] * 1e6,
+                'dur': record['wall'] * 1e6,
+                'pid': record['pid'],
+                'tid': record['thread'],
+                'args': args,
+            })
+
+        return {'traceEvents': events, 'displayTimeUnit': 'ms'}
+
+    def close(self):
+        """Writes the Chrome trace, if that is the format, and closes the
+        file.
+
+        """
+        if self.format == 'chrome':
+            json.dump(self.trace(), self._file)
+        self._file.close()
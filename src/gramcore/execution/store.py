@@ -0,0 +1,151 @@
+"""Storage of task results during the execution of a task file.
+
+A result is only needed until the last task that takes input from it has
+run. The store counts how many tasks use each result and drops it as soon as
+all of them have finished, so the memory of a long task file depends on how
+wide its graph is and not on how many tasks it has.
+
+Results of tasks that no other task uses are the outputs of the task file
+and they are always kept.
+
+Optionally, numpy arrays are spilled to disk when keeping them in memory
+would exceed a memory budget. Spilled arrays are returned as copy-on-write
+memory maps, so tasks can use them as any other array.
+
+"""
+import os
+import shutil
+import tempfile
+import logging
+
+import numpy
+
+
+logger = logging.getLogger('gramcore')
+
+
+class ResultStore(object):
+    """Keeps task results until their last consumer has finished.
+
+    :param users: the consumers of each task, as returned by
+                  gramcore.execution.graph.consumers()
+    :type users: list
+    :param memory_budget: maximum bytes of arrays kept in memory, defaults to
+                          None which means no limit
+    :type memory_budget: integer
+    :param spill_dir: where to write spilled arrays, defaults to a temporary
+                      directory which is deleted on close()
+    :type spill_dir: string
+
+    """
+
+    def __init__(self, users, memory_budget=None, spill_dir=None):
+        self.pending = [len(user) for user in users]
+        self.memory_budget = memory_budget
+        self.spill_dir = spill_dir
+        self.in_memory = 0
+        self._results = {}
+        self._sizes = {}
+        self._paths = {}
+        self._temporary = spill_dir is None
+
+    def __len__(self):
+        return len(self._results)
+
+    def __contains__(self, index):
+        return index in self._results
+
+    def put(self, index, result):
+        """Stores the result of a task.
+
+        Arrays that don't fit in the memory budget are written to an npy file
+        and replaced by a memory map of it.
+
+        :param index: index of the task in the task file
+        :type index: integer
+        :param result: what the task returned
+
+        """
+        if isinstance(result, numpy.ndarray) and \
+           not isinstance(result, numpy.memmap):
+            if self.memory_budget is not None and \
+               self.in_memory + result.nbytes > self.memory_budget:
+                result = self._spill(index, result)
+            else:
+                self._sizes[index] = result.nbytes
+                self.in_memory += result.nbytes
+
+        self._results[index] = result
+
+    def get(self, index):
+        """Returns the result of a task.
+
+        :param index: index of the task in the task file
+        :type index: integer
+
+        :return: the stored result or raise KeyError if it has been dropped
+
+        """
+        return self._results[index]
+
+    def release(self, index):
+        """Marks that one of the consumers of a result has finished.
+
+        The result is dropped when its last consumer has finished.
+
+        :param index: index of the task whose result was used
+        :type index: integer
+
+        :return: True if the result was dropped, otherwise False
+
+        """
+        self.pending[index] -= 1
+        if self.pending[index] > 0:
+            return False
+
+        del self._results[index]
+        self.in_memory -= self._sizes.pop(index, 0)
+        path = self._paths.pop(index, None)
+        if path is not None:
+            os.remove(path)
+        logger.debug("Dropped result of task %d", index)
+
+        return True
+
+    def results(self, size):
+        """Returns the kept results in a list, dropped ones are None.
+
+        :param size: number of tasks in the task file
+        :type size: integer
+
+        :return: list
+
+        """
+        return [self._results.get(index) for index in range(size)]
+
+    def close(self):
+        """Deletes the spilled files.
+
+        On POSIX systems memory maps of already returned results remain
+        valid after this.
+
+        """
+        for path in self._paths.values():
+            os.remove(path)
+        self._paths = {}
+        if self._temporary and self.spill_dir is not None:
+            shutil.rmtree(self.spill_dir)
+            self.spill_dir = None
+
+    def _spill(self, index, result):
+        """Writes an array to an npy file and returns a memory map of it"""
+        if self.spill_dir is None:
+            self.spill_dir = tempfile.mkdtemp(prefix='gram-')
+        elif not os.path.isdir(self.spill_dir):
+            os.makedirs(self.spill_dir)
+        path = os.path.join(self.spill_dir, 'result-%d.npy' % index)
+        numpy.save(path, result)
+        self._paths[index] = path
+        logger.debug("Spilled result of task %d to %s", index, path)
+
+        return numpy.load(path, mmap_mode='c')
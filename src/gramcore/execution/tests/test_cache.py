@@ -0,0 +1,148 @@
+"""Tests for module gramcore.execution.cache"""
+import os
+import time
+import shutil
+import tempfile
+
+import numpy
+
+from nose.tools import assert_equal, assert_not_equal, raises, with_setup
+
+from gramcore.execution.cache import ResultCache, cacheable
+
+
+DIRECTORY = {}
+
+
+def setup_cache():
+    """Creates a temporary cache directory"""
+    DIRECTORY['path'] = tempfile.mkdtemp(prefix='gram-cache-')
+
+
+def teardown_cache():
+    """Deletes the cache directory"""
+    shutil.rmtree(DIRECTORY.pop('path'))
+
+
+def test_cacheable():
+    """Never cache tasks that write files or opt out"""
+    assert cacheable({'task': 'arrays.load', 'parameters': {}})
+    assert not cacheable({'task': 'arrays.save', 'parameters': {}})
+    assert not cacheable({'task': 'statistics.mean',
+                          'parameters': {'output': 'mean.npy'}})
+    assert not cacheable({'task': 'arrays.gaussian_noise',
+                          'parameters': {'cache': False, 'seed': 1}})
+
+
+def test_cacheable_random():
+    """Cache random tasks only with a seed"""
+    assert not cacheable({'task': 'arrays.gaussian_noise',
+                          'parameters': {'mean': 0, 'stddev': 1}})
+    assert cacheable({'task': 'arrays.gaussian_noise',
+                      'parameters': {'mean': 0, 'stddev': 1, 'seed': 1}})
+
+
+def test_cacheable_path():
+    """Never cache tasks that write their result to a path"""
+    assert cacheable({'task': 'images.load',
+                      'parameters': {'path': 'image.png'}})
+    assert cacheable({'task': 'arrays.dtm', 'parameters': {}})
+    for task in ['arrays.dtm', 'images.synthetic', 'images.tiled']:
+        assert not cacheable({'task': task,
+                              'parameters': {'path': 'result.npy'}})
+
+
+@with_setup(setup_cache, teardown_cache)
+def test_key():
+    """Keys depend on the task, its parameters and its inputs"""
+    cache = ResultCache(DIRECTORY['path'])
+    arg = {'task': 'statistics.mean',
+           'parameters': {'size': [3, 3], 'input_index': [0]}}
+    key = cache.key(arg, ['a'])
+
+    # input_index doesn't matter, only what the inputs are
+    moved = {'task': 'statistics.mean',
+             'parameters': {'input_index': [-1], 'size': [3, 3]}}
+    assert_equal(cache.key(moved, ['a']), key)
+    assert_not_equal(cache.key(arg, ['b']), key)
+    changed = {'task': 'statistics.mean',
+               'parameters': {'size': [5, 5], 'input_index': [0]}}
+    assert_not_equal(cache.key(changed, ['a']), key)
+
+
+@with_setup(setup_cache, teardown_cache)
+def test_key_file():
+    """Keys change when a file in the parameters is modified"""
+    cache = ResultCache(DIRECTORY['path'])
+    path = os.path.join(DIRECTORY['path'], 'input.txt')
+    arg = {'task': 'arrays.load', 'parameters': {'path': path}}
+    with open(path, 'w') as input_file:
+        input_file.write('1 2 3\n')
+    key = cache.key(arg, [])
+
+    with open(path, 'w') as input_file:
+        input_file.write('1 2 3 4\n')
+
+    assert_not_equal(cache.key(arg, []), key)
+
+
+@with_setup(setup_cache, teardown_cache)
+def test_put_get():
+    """Store arrays as memory maps and anything else pickled"""
+    cache = ResultCache(DIRECTORY['path'])
+    cache.put('array', numpy.arange(10))
+    cache.put('shape', (10, 10))
+
+    result = cache.get('array')
+    assert isinstance(result, numpy.memmap)
+    assert_equal(result.tolist(), list(range(10)))
+    assert_equal(cache.get('shape'), (10, 10))
+    assert 'foo' not in cache
+
+
+@raises(KeyError)
+@with_setup(setup_cache, teardown_cache)
+def test_get_missing():
+    """Fail to get a result that isn't cached"""
+    cache = ResultCache(DIRECTORY['path'])
+
+    cache.get('foo')
+
+
+@with_setup(setup_cache, teardown_cache)
+def test_evict():
+    """Evict the least recently used results beyond max_size"""
+    # every 100 element float array is 800 bytes plus an npy header
+    cache = ResultCache(DIRECTORY['path'], max_size=2000)
+    cache.put('first', numpy.zeros(100))
+    cache.put('second', numpy.zeros(100))
+    past = time.time() - 100
+    os.utime(os.path.join(DIRECTORY['path'], 'second.npy'), (past, past))
+    cache.get('first')
+
+    cache.put('third', numpy.zeros(100))
+
+    assert 'first' in cache
+    assert 'second' not in cache
+    assert 'third' in cache
+
+
+@with_setup(setup_cache, teardown_cache)
+def test_evict_pinned():
+    """Never evict pinned results"""
+    cache = ResultCache(DIRECTORY['path'], max_size=2000)
+    cache.put('first', numpy.zeros(100))
+    past = time.time() - 100
+    os.utime(os.path.join(DIRECTORY['path'], 'first.npy'), (past, past))
+    cache.pin(['first'])
+
+    cache.put('second', numpy.zeros(100))
+    cache.put('third', numpy.zeros(100))
+
+    assert 'first' in cache
+    assert 'second' not in cache
+
+    cache.unpin(['first'])
+    cache.put('fourth', numpy.zeros(100))
+
+    assert 'first' not in cache
@@ -0,0 +1,236 @@
+"""Tests for module gramcore.execution.graph"""
+import os
+import time
+import shutil
+import tempfile
+
+import numpy
+
+from nose.tools import assert_equal, raises
+
+from gramcore.data import arrays
+from gramcore.execution import graph
+from gramcore.execution.cache import ResultCache
+from gramcore.filters import statistics
+from gramcore.transformations import arithmetic, geometric
+
+
+MAPPING = {
+    'arrays.dtm': arrays.dtm,
+    'arrays.load': arrays.load,
+    'arithmetic.add': arithmetic.add,
+    'arithmetic.diff': arithmetic.diff,
+}
+
+
+def diamond():
+    """Tasks fixture with two independent branches joined at the end
+
+    Task 0 generates a DTM, tasks 1 and 2 use only task 0 and task 3 uses
+    both of them.
+
+    """
+    return [
+        {'task': 'arrays.dtm',
+         'parameters': {'slope_step': 1, 'min_value': 0, 'size': [10, 10]}},
+        {'task': 'arithmetic.add',
+         'parameters': {'input_index': [0, 0]}},
+        {'task': 'arithmetic.add',
+         'parameters': {'input_index': [0, 0, 0]}},
+        {'task': 'arithmetic.diff',
+         'parameters': {'input_index': [2, -2]}},
+    ]
+
+
+def test_dependencies():
+    """Check absolute input indices, negative ones are relative"""
+    deps = graph.dependencies(diamond())
+
+    assert_equal(deps, [[], [0, 0], [0, 0, 0], [2, 1]])
+
+
+@raises(ValueError)
+def test_dependencies_forward():
+    """Fail when a task takes input from a later task"""
+    tasks = diamond()
+    tasks[1]['parameters']['input_index'] = [2]
+
+    graph.dependencies(tasks)
+
+
+def test_consumers():
+    """Check which tasks use each result"""
+    users = graph.consumers([[], [0, 0], [0, 0, 0], [2, 1]])
+
+    assert_equal(users, [[1, 2], [3], [3], []])
+
+
+def test_with_dtype():
+    """Set the dtype of tasks without their own"""
+    tasks = diamond()
+    tasks[1]['parameters']['dtype'] = 'int32'
+
+    typed = graph.with_dtype(tasks, 'float32')
+
+    assert_equal([arg['parameters']['dtype'] for arg in typed],
+                 ['float32', 'int32', 'float32', 'float32'])
+    assert 'dtype' not in tasks[0]['parameters']
+
+
+def test_execute_sequential():
+    """Execute with one worker and check results and timings"""
+    tasks = diamond()
+
+    results, timings = graph.execute(tasks, MAPPING)
+
+    # 3 * dtm - 2 * dtm
+    expected = arrays.dtm(tasks[0]['parameters'])
+    numpy.testing.assert_array_equal(results[3], expected)
+    # intermediate results are dropped
+    assert_equal(results[:3], [None, None, None])
+    assert_equal(len(timings), 4)
+    # the task file is not modified
+    assert 'data' not in tasks[3]['parameters']
+
+
+def test_execute_threads():
+    """Parallel execution with threads matches the sequential one"""
+    expected, _ = graph.execute(diamond(), MAPPING)
+
+    results, _ = graph.execute(diamond(), MAPPING, workers=3, pool='thread')
+
+    numpy.testing.assert_array_equal(results[3], expected[3])
+
+
+def test_execute_processes():
+    """Parallel execution with processes matches the sequential one"""
+    expected, _ = graph.execute(diamond(), MAPPING)
+
+    results, _ = graph.execute(diamond(), MAPPING, workers=2, pool='process')
+
+    numpy.testing.assert_array_equal(results[3], expected[3])
+
+
+def test_execute_spill():
+    """Spilling every array to disk doesn't change the results"""
+    expected, _ = graph.execute(diamond(), MAPPING)
+
+    results, _ = graph.execute(diamond(), MAPPING, memory_budget=0)
+
+    assert isinstance(results[3], numpy.memmap)
+    numpy.testing.assert_array_equal(results[3], expected[3])
+
+
+@raises(TypeError)
+def test_execute_failure():
+    """Failing tasks raise their exception in parallel execution too"""
+    tasks = diamond()
+    tasks.append({'task': 'arrays.load',
+                  'parameters': {'path': 'foo.bar'}})
+    tasks.append({'task': 'arithmetic.add',
+                  'parameters': {'input_index': [0, 4]}})
+
+    graph.execute(tasks, MAPPING, workers=2)
+
+
+def test_execute_cache():
+    """Load cached results and skip the tasks they depend on"""
+    directory = tempfile.mkdtemp(prefix='gram-cache-')
+    cache = ResultCache(directory)
+    expected, _ = graph.execute(diamond(), MAPPING, cache=cache)
+
+    results, timings = graph.execute(diamond(), MAPPING, cache=cache)
+
+    numpy.testing.assert_array_equal(results[3], expected[3])
+    assert_equal(timings[:3], [None, None, None])
+
+    # changing the last task loads its inputs from the cache
+    tasks = diamond()
+    tasks[3]['parameters']['input_index'] = [1, 2]
+    results, timings = graph.execute(tasks, MAPPING, workers=2, cache=cache)
+
+    dtm = arrays.dtm(tasks[0]['parameters'])
+    numpy.testing.assert_array_equal(results[3], -dtm)
+    assert_equal(timings[0], None)
+    shutil.rmtree(directory)
+
+
+def test_execute_cache_evict():
+    """Results stored during an execution don't evict the planned ones"""
+    directory = tempfile.mkdtemp(prefix='gram-cache-')
+    # room for two 10x10 float results
+    cache = ResultCache(directory, max_size=2000)
+    tasks = [
+        {'task': 'arrays.dtm',
+         'parameters': {'slope_step': 1, 'min_value': 0, 'size': [10, 10]}},
+        {'task': 'arithmetic.add', 'parameters': {'input_index': [0, 0]}},
+        {'task': 'arrays.dtm',
+         'parameters': {'slope_step': 2, 'min_value': 0, 'size': [10, 10]}},
+        {'task': 'arithmetic.add', 'parameters': {'input_index': [2, 2]}},
+    ]
+    graph.execute(tasks, MAPPING, cache=cache)
+    keys = cache.keys(tasks, graph.dependencies(tasks))
+    assert keys[3] in cache
+    # every cached result is older than the ones of the next execution
+    past = time.time() - 100
+    for name in os.listdir(directory):
+        os.utime(os.path.join(directory, name), (past, past))
+
+    # the first two tasks are executed and stored before the last is loaded
+    tasks[0]['parameters']['min_value'] = 5
+    try:
+        results, timings = graph.execute(tasks, MAPPING, cache=cache)
+    finally:
+        shutil.rmtree(directory)
+
+    assert_equal(timings[2], None)
+    numpy.testing.assert_array_equal(results[3],
+                                     2 * arrays.dtm(tasks[2]['parameters']))
+    numpy.testing.assert_array_equal(results[1],
+                                     2 * arrays.dtm(tasks[0]['parameters']))
+
+
+def test_execute_dtype():
+    """Execute a task file in float32"""
+    results, _ = graph.execute(diamond(), MAPPING, dtype='float32')
+
+    assert_equal(results[3].dtype, numpy.dtype('float32'))
+
+
+def mixed():
+    """Tasks fixture of the diamond followed by tasks with floating results,
+    and their mapping"""
+    mapping = dict(MAPPING)
+    mapping.update({'statistics.stddev': statistics.stddev,
+                    'arithmetic.divide': arithmetic.divide,
+                    'geometric.resize': geometric.resize})
+    tasks = diamond() + [
+        {'task': 'statistics.stddev',
+         'parameters': {'input_index': [0], 'size': [3, 3]}},
+        {'task': 'arithmetic.divide',
+         'parameters': {'input_index': [1, 2]}},
+        {'task': 'geometric.resize',
+         'parameters': {'input_index': [0], 'output_shape': [5, 5]}},
+    ]
+
+    return tasks, mapping
+
+
+def test_execute_mixed_dtype():
+    """Execute tasks with floating results in float32"""
+    tasks, mapping = mixed()
+
+    results, _ = graph.execute(tasks, mapping, dtype='float32')
+
+    for result in results[3:]:
+        assert_equal(result.dtype, numpy.dtype('float32'))
+    # the first column of the DTM is 0
+    numpy.testing.assert_allclose(results[5][:, 1:], 2.0 / 3, rtol=1e-6)
+
+
+@raises(ValueError)
+def test_execute_integer_dtype():
+    """Fail before executing anything with an integer dtype"""
+    tasks, mapping = mixed()
+
+    graph.execute(tasks, mapping, dtype='uint16')
@@ -0,0 +1,95 @@
+"""Tests for module gramcore.execution.profiling"""
+import os
+import json
+import shutil
+import tempfile
+
+import numpy
+
+from nose.tools import assert_equal, raises
+
+from gramcore.data import arrays
+from gramcore.execution import graph, profiling
+from gramcore.transformations import arithmetic
+
+
+MAPPING = {
+    'arrays.dtm': arrays.dtm,
+    'arithmetic.add': arithmetic.add,
+}
+
+TASKS = [
+    {'task': 'arrays.dtm',
+     'parameters': {'slope_step': 1, 'min_value': 0, 'size': [10, 10]}},
+    {'task': 'arithmetic.add',
+     'parameters': {'input_index': [0, 0]}},
+]
+
+
+def test_describe():
+    """Describe arrays by shape, dtype and bytes, anything else by type"""
+    description = profiling.describe([numpy.zeros((2, 3), dtype='uint8'), 1])
+
+    assert_equal(description, [{'shape': [2, 3], 'dtype': 'uint8',
+                                'nbytes': 6},
+                               {'type': 'int'}])
+
+
+def test_run_task():
+    """Measure a task and dump its cProfile statistics"""
+    directory = tempfile.mkdtemp(prefix='gram-profile-')
+    parameters = {'data': [numpy.ones(10), numpy.ones(10)]}
+
+    success, result, elapsed, record = profiling.run_task(
+        arithmetic.add, parameters, 3, 'arithmetic.add',
+        profile_dir=directory)
+
+    assert success
+    assert_equal(result.tolist(), [2.0] * 10)
+    assert_equal(record['index'], 3)
+    assert_equal(record['wall'], elapsed)
+    assert_equal(record['output'], {'shape': [10], 'dtype': 'float64',
+                                    'nbytes': 80})
+    assert_equal(len(record['inputs']), 2)
+    assert os.path.exists(record['profile'])
+    shutil.rmtree(directory)
+
+
+def test_execute_jsonl():
+    """Write one JSON line per executed task"""
+    directory = tempfile.mkdtemp(prefix='gram-profile-')
+    path = os.path.join(directory, 'profile.jsonl')
+    profiler = profiling.Profiler(path)
+
+    graph.execute(TASKS, MAPPING, workers=2, profiler=profiler)
+    profiler.close()
+
+    with open(path) as profile:
+        records = [json.loads(line) for line in profile]
+    assert_equal(sorted(record['task'] for record in records),
+                 ['arithmetic.add', 'arrays.dtm'])
+    shutil.rmtree(directory)
+
+
+def test_execute_chrome():
+    """Write a Chrome trace with one complete event per executed task"""
+    directory = tempfile.mkdtemp(prefix='gram-profile-')
+    path = os.path.join(directory, 'trace.json')
+    profiler = profiling.Profiler(path, format='chrome')
+
+    graph.execute(TASKS, MAPPING, workers=2, pool='process',
+                  profiler=profiler)
+    profiler.close()
+
+    with open(path) as profile:
+        trace = json.load(profile)
+    events = trace['traceEvents']
+    assert_equal(len(events), 2)
+    assert_equal(set(event['ph'] for event in events), set(['X']))
+    shutil.rmtree(directory)
+
+
+@raises(ValueError)
+def test_profiler_format():
+    """Fail on unknown formats"""
+    profiling.Profiler(os.devnull, format='foo')
@@ -0,0 +1,70 @@
+"""Tests for module gramcore.execution.store"""
+import os
+import numpy
+
+from nose.tools import assert_equal, raises
+
+from gramcore.execution.store import ResultStore
+
+
+def test_release():
+    """Drop a result only after its last consumer has finished"""
+    # task 0 is used by tasks 1 and 2, the rest are not used
+    store = ResultStore([[1, 2], [], []])
+    store.put(0, numpy.ones((10, 10)))
+
+    assert_equal(store.in_memory, 800)
+    assert not store.release(0)
+    assert 0 in store
+    assert store.release(0)
+    assert 0 not in store
+    assert_equal(store.in_memory, 0)
+
+
+@raises(KeyError)
+def test_get_dropped():
+    """Fail to get a dropped result"""
+    store = ResultStore([[1], []])
+    store.put(0, 'foo')
+    store.release(0)
+
+    store.get(0)
+
+
+def test_results():
+    """Results of unused tasks are kept, dropped ones are None"""
+    store = ResultStore([[1], []])
+    store.put(0, 'foo')
+    store.put(1, 'bar')
+    store.release(0)
+
+    assert_equal(store.results(2), [None, 'bar'])
+
+
+def test_spill():
+    """Spill an array that doesn't fit in the memory budget"""
+    store = ResultStore([[2], [2], []], memory_budget=1000)
+    store.put(0, numpy.ones((10, 10)))
+    store.put(1, 2 * numpy.ones((10, 10)))
+
+    spilled = store.get(1)
+    path = os.path.join(store.spill_dir, 'result-1.npy')
+
+    assert_equal(store.in_memory, 800)
+    assert isinstance(spilled, numpy.memmap)
+    assert_equal(spilled.sum(), 200)
+    assert os.path.exists(path)
+
+    store.release(1)
+    assert not os.path.exists(path)
+    store.close()
+    assert store.spill_dir is None
+
+
+def test_non_arrays():
+    """Results that are not arrays are never spilled"""
+    store = ResultStore([[1], []], memory_budget=0)
+    store.put(0, (10, 10))
+
+    assert_equal(store.get(0), (10, 10))
+    assert_equal(store.spill_dir, None)
@@ -1,3 +1 @@
-"""Relative imports for gramcore.features"""
-import gramcore.features.descriptors
-import gramcore.features.points
+"""Feature detection and description"""
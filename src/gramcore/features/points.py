@@ -3,9 +3,26 @@
 These are applied to numpy.arrays representing images.
 
 """
+from multiprocessing.pool import ThreadPool
+
 import numpy
+from scipy import sparse
 from skimage import feature
 
+from gramcore.filters import tiling
+
+
+# cells around a pixel that affect its harris response, the derivatives and
+# the gaussian smoothing with the default deviation of 1
+RESPONSE_HALO = 5
+
+# the defaults of skimage.feature.harris, points weaker than THRESHOLD times
+# the strongest response are dropped
+THRESHOLD = 0.1
+EPS = 1e-6
+
+RESULTS = ['mask', 'coordinates', 'sparse']
+
 
 def harris(parameters):
     """Harris interest point operator.
@@ -13,17 +30,29 @@ def harris(parameters):
     It wraps `skimage.feature.harris`. The `threshold`, `eps` and
     `gaussian_deviation` options are not supported.
 
-    This function returns an array of 0s and 1s. Harris points are marked
-    with 1s. This way the result can be easily transformed to an image. It
-    works on RGB and greyscale images.
+    By default this function returns an array of 0s and 1s. Harris points are
+    marked with 1s. This way the result can be easily transformed to an
+    image. It works on RGB and greyscale images.
 
-    The wrapped function returns a set of point coordinates in a list. For
-    some reason it is not possible to do something like:
+    When only the points are needed, e.g. for large images, the `result`
+    parameter avoids allocating an array of the size of the image:
 
-        >>> points = feature.harris(data, min_distance=5)
-        >>> data[points] = 1
+        1. 'mask', the default, an array of 0s and 1s,
+        2. 'coordinates', an (N, 2) array with the row and column of every
+           point, sorted by row,
+        3. 'sparse', a scipy.sparse.coo_matrix of the size of the image with
+           1s on the points.
 
-    so a for loop is used.
+    Large images can be processed in blocks by setting `block_shape`, then
+    only the harris response of a single block is in memory at a time.
+    Every block is read with a halo wide enough for the response and its
+    local maxima to be the same as on the whole image. Points weaker than a
+    fraction of the strongest response of the whole image are dropped, as in
+    `skimage.feature.harris`, so a first pass over the blocks finds that
+    response. Points closer than `min_distance` to each other that were
+    found in different blocks are merged, keeping the stronger one. On
+    plateaus of the response the whole image can have such close points, in
+    blocks they are always at least `min_distance` apart.
 
     .. note::
 
@@ -36,18 +65,201 @@ def harris(parameters):
                                        interest points and image boundary,
                                        defaults to 10
     :type parameters['min_distance']: float
+    :param parameters['result']: 'mask', 'coordinates' or 'sparse', defaults
+                                 to 'mask'
+    :type parameters['result']: string
+    :param parameters['block_shape']: optional, find points in blocks of this
+                                      shape, e.g. [2048, 2048]
+    :type parameters['block_shape']: list
+    :param parameters['workers']: number of threads processing blocks,
+                                  defaults to 1
+    :type parameters['workers']: integer
 
-    :return: numpy.array, it contains 1s where points were found, otherwise 0
+    :return: numpy.array, it contains 1s where points were found, otherwise
+             0, or the points as requested by `result`
 
     """
     data = parameters['data'][0]
     min_distance = parameters.get('min_distance', 10)
+    result = parameters.get('result', 'mask')
+    block_shape = parameters.get('block_shape')
+
+    if result not in RESULTS:
+        raise ValueError('Unknown harris result %s' % result)
+
+    if block_shape is None:
+        points = as_coordinates(feature.harris(data,
+                                               min_distance=min_distance))
+    else:
+        points = tiled_harris(data, min_distance, block_shape,
+                              workers=parameters.get('workers', 1))
+
+    shape = data.shape[:2]
+    if result == 'coordinates':
+        return points[numpy.lexsort((points[:, 1], points[:, 0]))]
+    if result == 'sparse':
+        values = numpy.ones(len(points), dtype='uint8')
+        return sparse.coo_matrix((values, (points[:, 0], points[:, 1])),
+                                 shape=shape)
+
+    mask = numpy.zeros(shape, dtype='uint8')
+    mask[points[:, 0], points[:, 1]] = 1
+
+    return mask
+
+
+def as_coordinates(points):
+    """Converts points to an (N, 2) integer array.
+
+    `skimage.feature.harris` returns either an array or a list of
+    coordinates, depending on its version.
+
+    :param points: the row and column of every point
+    :type points: list or numpy.array
+
+    :return: numpy.array
+
+    """
+    return numpy.asarray(points, dtype=numpy.intp).reshape(-1, 2)
+
+
+def response(data):
+    """Calculates the harris response that `skimage.feature.harris` finds
+    points in.
+
+    RGB images are averaged to greyscale first.
+
+    :param data: input array
+    :type data: numpy.array
 
-    points = feature.harris(data, min_distance=min_distance)
+    :return: numpy.array, float64
+
+    """
+    if data.ndim == 3:
+        data = data.mean(axis=2)
+
+    return feature.corner_harris(data, method='eps', eps=EPS)
+
+
+def tiled_harris(data, min_distance, block_shape, workers=1):
+    """Finds harris points block by block.
+
+    The blocks are read twice, first to find the strongest response of the
+    image, which sets the threshold of the points, and then to find the
+    points.
+
+    :param data: the input array, it can be a memory map
+    :type data: numpy.array
+    :param min_distance: minimum number of pixels separating points
+    :type min_distance: integer
+    :param block_shape: the shape of every block
+    :type block_shape: list
+    :param workers: number of threads processing blocks, defaults to 1
+    :type workers: integer
+
+    :return: numpy.array, (N, 2) coordinates of the points
+
+    """
+    margin = int(min_distance) + RESPONSE_HALO
+    parts = tiling.blocks(data.shape, block_shape[:2], [margin, margin])
+
+    def strongest(part):
+        """Returns the strongest response inside a block"""
+        outer, inner, _ = part
+        return response(data[outer])[inner[:2]].max()
+
+    def find(part, threshold):
+        """Returns the points inside a block, in image coordinates, and
+        their responses
+
+        """
+        outer, _, target = part
+        values = response(data[outer])
+        points = as_coordinates(feature.peak_local_max(
+            values, min_distance=min_distance, threshold_abs=threshold,
+            threshold_rel=0))
+        strengths = values[points[:, 0], points[:, 1]]
+        points += [outer[0].start, outer[1].start]
+        inside = ((points[:, 0] >= target[0].start) &
+                  (points[:, 0] < target[0].stop) &
+                  (points[:, 1] >= target[1].start) &
+                  (points[:, 1] < target[1].stop))
+        return points[inside], strengths[inside]
+
+    if workers > 1:
+        pool = ThreadPool(workers)
+        try:
+            threshold = THRESHOLD * max(pool.map(strongest, parts))
+            found = pool.map(lambda part: find(part, threshold), parts)
+        finally:
+            pool.close()
+            pool.join()
+    else:
+        threshold = THRESHOLD * max(strongest(part) for part in parts)
+        found = [find(part, threshold) for part in parts]
+
+    return merge([points for points, _ in found],
+                 [target for _, _, target in parts], min_distance,
+                 strengths=[strengths for _, strengths in found])
+
+
+def merge(found, targets, min_distance, strengths=None):
+    """Merges the points of blocks, dropping points closer than min_distance
+    to a stronger point of another block, or without strengths to a point
+    of an earlier block.
+
+    Only points within min_distance of a block border can conflict, so the
+    rest are kept without comparing them. The conflicting ones are compared
+    with their neighbours in a grid of min_distance cells.
+
+    :param found: (N, 2) coordinates of the points of every block
+    :type found: list
+    :param targets: the slices of every block in the image
+    :type targets: list
+    :param min_distance: minimum number of pixels separating points
+    :type min_distance: integer
+    :param strengths: the response of every point of every block, defaults
+                      to None
+    :type strengths: list
+
+    :return: numpy.array, (N, 2) coordinates of the points
+
+    """
+    distance = int(min_distance)
+    if strengths is None:
+        strengths = [numpy.zeros(len(points)) for points in found]
+    kept = []
+    border = []
+    for block, (points, target) in enumerate(zip(found, targets)):
+        near = ((points[:, 0] < target[0].start + distance) |
+                (points[:, 0] >= target[0].stop - distance) |
+                (points[:, 1] < target[1].start + distance) |
+                (points[:, 1] >= target[1].stop - distance))
+        kept.append(points[~near])
+        border.extend((-strength, block, row, column)
+                      for strength, (row, column) in
+                      zip(strengths[block][near], points[near]))
+    # the strongest points claim their neighbourhood first
+    border.sort()
 
-    result = numpy.zeros((data.shape[0], data.shape[1]), dtype='uint8')
+    cell = max(distance, 1)
+    grid = {}
+    for _, block, row, column in border:
+        key = (row // cell, column // cell)
+        conflict = False
+        for cell_row in range(key[0] - 1, key[0] + 2):
+            for cell_column in range(key[1] - 1, key[1] + 2):
+                for other, other_row, other_column in \
+                        grid.get((cell_row, cell_column), []):
+                    if other != block and \
+                       abs(row - other_row) <= distance and \
+                       abs(column - other_column) <= distance:
+                        conflict = True
+        if not conflict:
+            grid.setdefault(key, []).append((block, row, column))
 
-    for point in points:
-       result[point[0], point[1]] = 1
+    merged = [(row, column) for entries in grid.values()
+              for _, row, column in entries]
+    kept.append(as_coordinates(merged))
 
-    return result
+    return numpy.concatenate(kept)
@@ -1,7 +1,7 @@
 """Tests for module gramcore.features.points"""
 import numpy
 
-from nose.tools import assert_equal
+from nose.tools import assert_equal, raises
 
 from gramcore.features import points
 
@@ -26,3 +26,124 @@ def test_harris():
     assert_equal(results[4, 6], 1)
     assert_equal(results[6, 4], 1)
     assert_equal(results[6, 6], 1)
+
+
+def test_harris_coordinates():
+    """Check the coordinates and sparse results against the mask"""
+    arr = numpy.zeros((10, 10))
+    arr[3:8, 3:8] = 255
+
+    parameters = {'data': [arr], 'min_distance': 1}
+    mask = points.harris(parameters)
+
+    parameters['result'] = 'coordinates'
+    coordinates = points.harris(parameters)
+
+    assert_equal(coordinates.shape, (4, 2))
+    assert_equal(coordinates.tolist(), numpy.argwhere(mask).tolist())
+
+    parameters['result'] = 'sparse'
+    matrix = points.harris(parameters)
+
+    assert_equal(matrix.shape, (10, 10))
+    assert_equal((matrix.toarray() != mask).sum(), 0)
+
+
+@raises(ValueError)
+def test_harris_result():
+    """An unknown result raises ValueError"""
+    arr = numpy.zeros((10, 10))
+    points.harris({'data': [arr], 'result': 'list'})
+
+
+def test_harris_tiled():
+    """Find points in blocks that split the square, with squares of the
+    same contrast the result must be the same as on the whole image
+
+    """
+    arr = numpy.zeros((20, 20))
+    arr[3:8, 3:8] = 255
+    arr[9:16, 10:17] = 255
+
+    parameters = {'data': [arr], 'min_distance': 1}
+    whole = points.harris(parameters)
+
+    parameters['block_shape'] = [5, 5]
+    tiled = points.harris(parameters)
+
+    assert_equal((tiled != whole).sum(), 0)
+
+    parameters['workers'] = 2
+    tiled = points.harris(parameters)
+
+    assert_equal((tiled != whole).sum(), 0)
+
+
+def test_harris_tiled_threshold():
+    """Blocks drop the weak points that the whole image drops
+
+    The weak square is in a block of its own, its corners pass a threshold
+    relative to the strongest response of that block, but not the one
+    relative to the strong square of the whole image, which blocks use.
+
+    """
+    arr = numpy.zeros((40, 80))
+    arr[10:25, 8:23] = 255
+    arr[10:25, 55:70] = 10
+
+    parameters = {'data': [arr], 'min_distance': 3, 'result': 'coordinates'}
+    whole = points.harris(parameters)
+    parameters['block_shape'] = [40, 40]
+    tiled = points.harris(parameters)
+
+    assert_equal((whole[:, 1] >= 40).sum(), 0)
+    assert_equal(tiled.tolist(), whole.tolist())
+
+
+def test_harris_tiled_borders():
+    """Corners on and next to the borders of blocks are found as on the
+    whole image
+
+    """
+    arr = numpy.zeros((60, 60))
+    # corners one cell before, on and one cell after block borders
+    arr[9:19, 21:31] = 255
+    arr[30:41, 8:20] = 120
+    arr[39:50, 31:42] = 200
+    # too weak for the threshold of the whole image
+    arr[50:58, 49:57] = 60
+
+    parameters = {'data': [arr], 'min_distance': 2, 'result': 'coordinates'}
+    whole = points.harris(parameters)
+
+    for block_shape in [[10, 10], [20, 20], [30, 30]]:
+        parameters['block_shape'] = block_shape
+        tiled = points.harris(parameters)
+        assert_equal(tiled.tolist(), whole.tolist())
+
+
+def test_merge():
+    """Close points of different blocks are merged, close points of the same
+    block are kept
+
+    """
+    found = [numpy.array([[4, 4], [4, 6], [1, 1]]),
+             numpy.array([[5, 5], [9, 9]])]
+    targets = [(slice(0, 5), slice(0, 10)), (slice(5, 10), slice(0, 10))]
+
+    merged = points.merge(found, targets, 2)
+    merged = sorted(merged.tolist())
+
+    assert_equal(merged, [[1, 1], [4, 4], [4, 6], [9, 9]])
+
+
+def test_merge_strengths():
+    """Of close points of different blocks the stronger one is kept"""
+    found = [numpy.array([[4, 4], [1, 1]]), numpy.array([[5, 5]])]
+    targets = [(slice(0, 5), slice(0, 10)), (slice(5, 10), slice(0, 10))]
+    strengths = [numpy.array([1.0, 1.0]), numpy.array([2.0])]
+
+    merged = points.merge(found, targets, 2, strengths=strengths)
+    merged = sorted(merged.tolist())
+
+    assert_equal(merged, [[1, 1], [5, 5]])
@@ -1,5 +1 @@
-"""Relative imports for gramcore.filters"""
-import gramcore.filters.edges
-import gramcore.filters.morphology
-import gramcore.filters.statistics
-import gramcore.filters.thresholds
+"""Neighbourhood filters"""
@@ -50,15 +50,18 @@ def prewitt(parameters):
 
     :param parameters['data'][0]: input image
     :type parameters['data'][0]: numpy.array
+    :param parameters['dtype']: dtype of the result, defaults to 'float64',
+                                'float32' uses half the memory
+    :type parameters['dtype']: string
 
-    :return: numpy.array with dtype('float64')
+    :return: numpy.array with dtype('float64'), unless dtype is set
 
     """
     img = parameters['data'][0]
 
     result = filter.prewitt(img)
 
-    return result
+    return result.astype(parameters.get('dtype', 'float64'), copy=False)
 
 
 def sobel(parameters):
@@ -95,12 +98,15 @@ def sobel(parameters):
 
     :param parameters['data'][0]: input image
     :type parameters['data'][0]: numpy.array
+    :param parameters['dtype']: dtype of the result, defaults to 'float64',
+                                'float32' uses half the memory
+    :type parameters['dtype']: string
 
-    :return: numpy.array with dtype('float64')
+    :return: numpy.array with dtype('float64'), unless dtype is set
 
     """
     img = parameters['data'][0]
 
     result = filter.sobel(img)
 
-    return result
+    return result.astype(parameters.get('dtype', 'float64'), copy=False)
@@ -0,0 +1,241 @@
+"""Rank filters of unsigned integer arrays with sliding histograms.
+
+`scipy.ndimage.filters.rank_filter`, and with it the median and percentile
+filters, selects the rank element of every window on its own, so their cost
+grows with the window area. For 8 and 16 bit unsigned integers the values
+are few enough to count instead, as in the median filters of Huang and
+Perreau:
+
+    1. every column of the array keeps a histogram of the values in the
+       rows of the current window,
+    2. moving the window down a row adds the entering row to the column
+       histograms and removes the leaving one, 2 updates per column,
+    3. the histogram of a window is the sum of the histograms of its
+       columns, from running sums along the row,
+    4. the rank element is found by walking the cumulative histogram.
+
+To keep the histograms short the values are resolved a few bits at a time,
+from the most significant ones. Every level only counts the values that
+share the bits already found, e.g. 16 bins for the high 4 bits of 8 bit
+values and 16 for the low 4, instead of 256. Levels with many bins, e.g. the
+last ones of 16 bit values, add up the histograms of the window columns
+directly instead of keeping running sums along the whole row.
+
+For 8 bit values the cost per cell doesn't depend on the window size, for
+16 bit values it grows with the window width, not its area. Only the rows are
+processed one by one in python, all the columns of a row are processed
+together by numpy.
+
+The results are identical to scipy with the default mode, `reflect`.
+
+"""
+import numpy
+
+from gramcore.filters import sliding
+
+
+BACKENDS = ['auto', 'scipy', 'histogram']
+
+# bits of the values resolved at every level
+DIGIT_BITS = 4
+
+# smallest window, in cells, for which 'auto' uses the histograms, for 8 and
+# 16 bit values, from benchmarks/histogram.py
+MIN_AREA = {1: 81, 2: 400}
+
+# how many times more a bin costs when adding up the columns of every window
+# than with running sums along the row, from benchmarks/histogram.py
+GATHER_COST = 2
+
+# most bins in the column histograms of a level, wider arrays are processed
+# in strips of columns
+MAX_BINS = 2 ** 24
+
+
+def rank_filter(data, size, rank):
+    """Calculates the rank element of every window.
+
+    :param data: input array, 2D with 8 or 16 bit unsigned integers
+    :type data: numpy.array
+    :param size: the window size along each axis
+    :type size: tuple
+    :param rank: the rank of the element in the sorted window, 0 for the
+                 minimum, negative ones count from the maximum
+    :type rank: integer
+
+    :return: numpy.array, of the same dtype as data
+
+    """
+    if data.dtype.kind != 'u' or data.dtype.itemsize > 2:
+        raise ValueError('Histograms need 8 or 16 bit unsigned integers, '
+                         'not %s' % data.dtype)
+
+    rows, columns = size
+    area = rows * columns
+    if rank < 0:
+        rank += area
+    if not 0 <= rank < area:
+        raise ValueError('Rank %d outside a window of %d cells'
+                         % (rank, area))
+
+    bits = max(int(data.max()).bit_length(), 1) if data.size else 1
+    levels = -(-bits // DIGIT_BITS)
+    shifts = [DIGIT_BITS * (levels - 1 - level) for level in range(levels)]
+
+    height, width = data.shape
+    row_index = sliding.reflected(height, rows // 2, height + rows - 1)
+    # the last level has 2 ** bits bins per column
+    strip = max(MAX_BINS >> bits, 1)
+    result = numpy.empty(data.shape, dtype=data.dtype)
+    for start in range(0, width, strip):
+        stop = min(start + strip, width)
+        column_index = sliding.reflected(width, columns // 2 - start,
+                                         stop - start + columns - 1)
+        result[:, start:stop] = rank_strip(data, row_index, column_index,
+                                           size, rank, shifts)
+
+    return result
+
+
+def rank_strip(data, row_index, column_index, size, rank, shifts):
+    """Calculates the rank element of every window of a strip of columns.
+
+    :param data: input array
+    :type data: numpy.array
+    :param row_index: rows of data, including the reflected borders
+    :type row_index: numpy.array
+    :param column_index: columns of data in the strip, including the
+                         reflected borders
+    :type column_index: numpy.array
+    :param size: the window size along each axis
+    :type size: tuple
+    :param rank: the rank of the element in the sorted window, from 0
+    :type rank: integer
+    :param shifts: the values are resolved from value >> shift of every level
+    :type shifts: list
+
+    :return: numpy.array
+
+    """
+    rows, columns = size
+    bits = shifts[0] + DIGIT_BITS
+    cells = numpy.arange(len(column_index))
+    outputs = numpy.arange(len(column_index) - columns + 1)
+    window = numpy.arange(columns)
+    # counts never exceed the window area
+    counter = numpy.int16 if rows * columns < 2 ** 15 else numpy.int32
+    histograms = []
+    sums = []
+    for shift in shifts:
+        histograms.append(numpy.zeros((len(cells), 2 ** (bits - shift)),
+                                      dtype=counter))
+        sums.append(numpy.zeros((len(cells) + 1, 2 ** (bits - shift)),
+                                dtype=counter))
+    # where the histogram of every column of every window starts
+    starts = (outputs[:, None] + window)[:, :, None]
+
+    def update(row, step):
+        """Adds or removes a row of the window from the column histograms"""
+        values = data[row_index[row]].take(column_index).astype(numpy.intp)
+        for histogram, shift in zip(histograms, shifts):
+            # every column gets a single value, so there are no duplicate
+            # indices in the assignment
+            histogram.ravel()[cells * histogram.shape[1] +
+                              (values >> shift)] += step
+
+    for row in range(rows - 1):
+        update(row, 1)
+
+    result = numpy.empty((len(row_index) - rows + 1, len(outputs)),
+                         dtype=data.dtype)
+    for row in range(len(result)):
+        update(row + rows - 1, 1)
+
+        prefix = numpy.zeros(len(outputs), dtype=numpy.intp)
+        remaining = numpy.empty(len(outputs), dtype=numpy.intp)
+        remaining.fill(rank)
+        for level, histogram in enumerate(histograms):
+            width = histogram.shape[1]
+            if level == 0:
+                # all the bins, the window is the difference of two running
+                # sums along the row
+                numpy.cumsum(histogram, axis=0, out=sums[0][1:])
+                counts = sums[0][columns:] - sums[0][:-columns]
+            else:
+                bins = prefix[:, None] * 2 ** DIGIT_BITS + \
+                    numpy.arange(2 ** DIGIT_BITS)
+                if width <= GATHER_COST * columns * 2 ** DIGIT_BITS:
+                    numpy.cumsum(histogram, axis=0, out=sums[level][1:])
+                    flat = sums[level].ravel()
+                    counts = flat.take(bins + (outputs[:, None] + columns) *
+                                       width)
+                    counts -= flat.take(bins + outputs[:, None] * width)
+                else:
+                    # adding up the columns of the window is cheaper than
+                    # running sums of all the bins
+                    flat = histogram.ravel()
+                    counts = flat.take(starts * width + bins[:, None, :])
+                    counts = counts.sum(axis=1, dtype=counter)
+
+            below = numpy.cumsum(counts, axis=1)
+            digit = (below <= remaining[:, None]).sum(axis=1)
+            found = digit > 0
+            remaining[found] -= below[outputs[found], digit[found] - 1]
+            if level == 0:
+                prefix = digit
+            else:
+                prefix = prefix * 2 ** DIGIT_BITS + digit
+
+        result[row] = prefix
+        update(row, -1)
+
+    return result
+
+
+def percentile_rank(size, percentile):
+    """Returns the rank of a percentile in a window.
+
+    It follows `scipy.ndimage.filters.percentile_filter`.
+
+    :param size: the window size along each axis
+    :type size: tuple
+    :param percentile: from 0 to 100, negative ones count from the end
+    :type percentile: float
+
+    :return: integer
+
+    """
+    area = int(numpy.prod(size))
+    if percentile < 0:
+        percentile += 100.0
+    if not 0 <= percentile <= 100:
+        raise ValueError('Invalid percentile %s' % percentile)
+    if percentile == 100:
+        return area - 1
+
+    return int(float(area) * percentile / 100.0)
+
+
+def chosen(backend, dtype, size):
+    """Returns whether to use the histograms instead of scipy.
+
+    :param backend: 'scipy', 'histogram' or 'auto', which uses the
+                    histograms for 2D windows of 8 and 16 bit unsigned
+                    integers of at least MIN_AREA cells
+    :type backend: string
+    :param dtype: dtype of the data to filter
+    :type dtype: numpy.dtype
+    :param size: the window size along each axis
+    :type size: tuple
+
+    :return: bool
+
+    """
+    if backend not in BACKENDS:
+        raise ValueError('Unknown backend %s' % backend)
+    if backend == 'auto':
+        dtype = numpy.dtype(dtype)
+        return dtype.kind == 'u' and dtype.itemsize in MIN_AREA and \
+            len(size) == 2 and numpy.prod(size) >= MIN_AREA[dtype.itemsize]
+
+    return backend == 'histogram'
@@ -3,8 +3,276 @@
 The following work on 2D arrays. They wrap the relevant scipy functions. The
 ones provided by skimage are not well documented for now.
 
+All of them can filter large arrays block by block, with `block_shape`, and
+write their results to an npy file, with `output`, which unlike the `output`
+of scipy is a path and not an array. For details check
+gramcore.filters.tiling.apply().
+
+For 8 and 16 bit integers and windows of at least sliding.MIN_LENGTH cells
+they use the van Herk/Gil-Werman filters of gramcore.filters.sliding instead,
+which are faster and give identical results. The `backend` parameter forces
+one or the other, 'scipy' or 'vhgw', the default is 'auto'.
+
+Instead of a rectangular `size`, they also take a `footprint`, either an
+array of 0s and 1s or one of the following structuring elements:
+
+    1. {"shape": "disk", "radius": r}, the cells within r of the center,
+    2. {"shape": "diamond", "radius": r}, the cells within r steps along the
+       axes of the center,
+    3. {"shape": "line", "length": n, "angle": a}, n cells through the center,
+       at 0, 45, 90 or 135 degrees, counterclockwise from the row axis.
+
+Filtering with a large footprint cell by cell is slow, so these elements are
+decomposed into cheaper ones with the same result:
+
+    1. a disk is the union of the largest rectangles that fit in it, its
+       erosion is the minimum of the erosions by each rectangle, which are
+       rectangular filters,
+    2. a diamond of radius r is the dilation of a cross with crosses of
+       radius 1, 2, 4, ..., so it takes log2(r) filters of 5 cells each,
+    3. a line is a rectangular filter along the axes, otherwise the dilation
+       of 3 cell lines with gaps of 1, 3, 9, ..., so it takes log3(n) filters
+       of 3 cells each.
+
+Decomposed elements give the same results as scipy with the whole footprint,
+`decompose` set to false uses the latter. Lines of even length that aren't
+along the axes are never decomposed.
+
 """
 from scipy.ndimage import morphology
+import numpy
+
+from gramcore.filters import sliding
+from gramcore.filters import tiling
+
+
+SHAPES = ['disk', 'diamond', 'line']
+
+
+def erode(data, size, backend='auto'):
+    """Erodes data with the chosen backend, check sliding.chosen()"""
+    if sliding.chosen(backend, data.dtype, size):
+        return sliding.minimum(data, size)
+    return morphology.grey_erosion(data, size=size)
+
+
+def dilate(data, size, backend='auto'):
+    """Dilates data with the chosen backend, check sliding.chosen()"""
+    if sliding.chosen(backend, data.dtype, size):
+        # grey_dilation shifts windows of even length by one cell
+        origin = tuple(-1 if length % 2 == 0 else 0 for length in size)
+        return sliding.maximum(data, size, origin)
+    return morphology.grey_dilation(data, size=size)
+
+
+def footprint(element):
+    """Returns the footprint of a structuring element.
+
+    :param element: a structuring element, as described in the module
+                    documentation, or a footprint
+    :type element: dict or list
+
+    :return: numpy.array of bools
+
+    """
+    if not isinstance(element, dict):
+        return numpy.asarray(element, dtype=bool)
+
+    shape = element['shape']
+    if shape in ('disk', 'diamond'):
+        radius = element['radius']
+        rows, columns = numpy.ogrid[-radius:radius + 1, -radius:radius + 1]
+        if shape == 'disk':
+            return rows * rows + columns * columns <= radius * radius
+        return abs(rows) + abs(columns) <= radius
+
+    if shape == 'line':
+        length = element['length']
+        angle = element.get('angle', 0)
+        if angle == 0:
+            return numpy.ones((1, length), dtype=bool)
+        if angle == 90:
+            return numpy.ones((length, 1), dtype=bool)
+        if angle == 45:
+            return numpy.eye(length, dtype=bool)[::-1]
+        if angle == 135:
+            return numpy.eye(length, dtype=bool)
+        raise ValueError('Lines at %s degrees are not supported' % angle)
+
+    raise ValueError('Unknown structuring element %s' % shape)
+
+
+def decompose(element):
+    """Decomposes a structuring element into cheaper ones.
+
+    :param element: a structuring element, as described in the module
+                    documentation
+    :type element: dict
+
+    :return: list of steps, each one is ('rectangles', sizes), the union of
+             rectangles, or ('cells', offsets), the cells around the center,
+             and the element is the dilation of the elements of all the
+             steps, or None if it can't be decomposed
+
+    """
+    shape = element['shape']
+    if shape == 'disk':
+        radius = element['radius']
+        # the half width of every row, from the center row outwards
+        widths = [int(numpy.sqrt(radius * radius - row * row))
+                  for row in range(radius + 1)]
+        # the largest rectangles end on rows after which the disk narrows
+        sizes = [(2 * row + 1, 2 * width + 1)
+                 for row, width in enumerate(widths)
+                 if row == radius or widths[row + 1] < width]
+        return [('rectangles', sizes)]
+
+    if shape == 'diamond':
+        steps = []
+        radius, reach = element['radius'], 0
+        while reach < radius:
+            gap = max(min(reach, radius - reach), 1)
+            steps.append(('cells', [(0, 0), (gap, 0), (-gap, 0), (0, gap),
+                                    (0, -gap)]))
+            reach += gap
+        return steps
+
+    length = element['length']
+    angle = element.get('angle', 0)
+    if angle in (0, 90):
+        size = (1, length) if angle == 0 else (length, 1)
+        return [('rectangles', [size])]
+    if length % 2 == 0:
+        return None
+
+    # the direction from the center to the end of the line on the right
+    direction = (-1, 1) if angle == 45 else (1, 1)
+    steps = []
+    radius, reach = length // 2, 0
+    while reach < radius:
+        gap = min(2 * reach + 1, radius - reach)
+        steps.append(('cells', [(0, 0),
+                                (gap * direction[0], gap * direction[1]),
+                                (-gap * direction[0], -gap * direction[1])]))
+        reach += gap
+    return steps
+
+
+def overlap(shape, offset):
+    """Returns the cells of an array that move inside it by an offset.
+
+    :param shape: the shape of the array
+    :type shape: tuple
+    :param offset: how many cells to move along each axis
+    :type offset: tuple
+
+    :return: tuple (inside, moved), the slices of the cells and of the cells
+             + offset
+
+    """
+    inside = tuple(slice(max(-step, 0), length - max(step, 0))
+                   for length, step in zip(shape, offset))
+    moved = tuple(slice(max(step, 0), length + min(step, 0))
+                  for length, step in zip(shape, offset))
+
+    return inside, moved
+
+
+def decomposed(data, steps, dilation=False, backend='auto'):
+    """Erodes or dilates data with a decomposed structuring element.
+
+    :param data: input array, 2D
+    :type data: numpy.array
+    :param steps: as returned by decompose()
+    :type steps: list
+    :param dilation: dilate instead of erode, defaults to False
+    :type dilation: bool
+    :param backend: the backend of rectangular filters, check
+                    sliding.chosen(), defaults to 'auto'
+    :type backend: string
+
+    :return: numpy.array
+
+    """
+    if not steps:
+        return data.copy()
+
+    # the elements are symmetric, so dilation takes the same cells
+    function = numpy.maximum if dilation else numpy.minimum
+    rectangle = dilate if dilation else erode
+
+    # diagonal lines are not symmetric along each axis, so the borders of
+    # their steps differ from reflecting the whole element, reflect the data
+    # once by the reach of all the steps instead, then the cells that the
+    # steps leave out at the borders are in the margins
+    margins = [sum(max(abs(offset[axis]) for offset in items)
+                   for kind, items in steps if kind == 'cells')
+               for axis in range(2)]
+    shape = data.shape
+    for axis, margin in enumerate(margins):
+        if margin:
+            count = shape[axis]
+            data = data.take(sliding.reflected(count, margin,
+                                               count + 2 * margin), axis=axis)
+
+    for kind, items in steps:
+        if kind == 'rectangles':
+            result = rectangle(data, items[0], backend)
+            for size in items[1:]:
+                function(result, rectangle(data, size, backend), out=result)
+        else:
+            result = data.copy()
+            for offset in items:
+                if offset != (0, 0):
+                    inside, moved = overlap(data.shape, offset)
+                    function(result[inside], data[moved], out=result[inside])
+        data = result
+
+    return data[margins[0]:margins[0] + shape[0],
+                margins[1]:margins[1] + shape[1]]
+
+
+def operators(parameters):
+    """Returns the erosion and dilation of the structuring element of a task.
+
+    :param parameters['size']: the size of a rectangular element
+    :type parameters['size']: list
+    :param parameters['footprint']: or the footprint of any element, an array
+                                    of 0s and 1s or a description of a disk,
+                                    diamond or line
+    :type parameters['footprint']: list or dict
+    :param parameters['decompose']: decompose disks, diamonds and lines into
+                                    cheaper elements, defaults to True
+    :type parameters['decompose']: bool
+    :param parameters['backend']: 'scipy', 'vhgw' or 'auto', defaults to
+                                  'auto'
+    :type parameters['backend']: string
+
+    :return: tuple (erosion, dilation, size), functions that take an array
+             and the size of the element
+
+    """
+    backend = parameters.get('backend', 'auto')
+    element = parameters.get('footprint')
+
+    if element is None:
+        size = tuple(parameters['size'])
+        return (lambda data: erode(data, size, backend),
+                lambda data: dilate(data, size, backend), size)
+
+    array = footprint(element)
+    steps = None
+    if isinstance(element, dict) and parameters.get('decompose', True):
+        steps = decompose(element)
+
+    if steps is None:
+        return (lambda data: morphology.grey_erosion(data, footprint=array),
+                lambda data: morphology.grey_dilation(data, footprint=array),
+                array.shape)
+
+    return (lambda data: decomposed(data, steps, False, backend),
+            lambda data: decomposed(data, steps, True, backend),
+            array.shape)
 
 
 def closing(parameters):
@@ -12,9 +280,8 @@ def closing(parameters):
 
     This is equal to performing a dilation and then an erosion.
 
-    It wraps `scipy.ndimage.morphology.grey_closing`. The `footprint`,
-    `structure`, `output`, `mode`, `cval` and `origin` options are not
-    supported.
+    It wraps `scipy.ndimage.morphology.grey_closing`. The `structure`,
+    `mode`, `cval` and `origin` options are not supported.
 
     Keep in mind that `mode` and `cval` influence the results. In this case
     the default mode is used, `reflect`.
@@ -24,14 +291,29 @@ def closing(parameters):
     :param parameters['size']: which neighbours to take into account, defaults
                                to (3, 3) a.k.a. numpy.ones((3, 3))
     :type parameters['size']: list
+    :param parameters['footprint']: instead of size, the structuring element,
+                                    check the module documentation
+    :type parameters['footprint']: list or dict
+    :param parameters['decompose']: decompose the footprint, defaults to True
+    :type parameters['decompose']: bool
+    :param parameters['backend']: 'scipy', 'vhgw' or 'auto', defaults to
+                                  'auto'
+    :type parameters['backend']: string
+    :param parameters['block_shape']: optional, filter in blocks of this shape
+    :type parameters['block_shape']: list
+    :param parameters['output']: optional, npy file to write the result to
+    :type parameters['output']: string
 
     :return: numpy.array
 
     """
-    data = parameters['data'][0]
-    size = tuple(parameters['size'])
+    erosion, dilation, size = operators(parameters)
 
-    return morphology.grey_closing(data, size=size)
+    def function(data):
+        """Dilates and then erodes data"""
+        return erosion(dilation(data))
+
+    return tiling.apply(parameters, function, tiling.halo(size, passes=2))
 
 
 def erosion(parameters):
@@ -40,9 +322,8 @@ def erosion(parameters):
     For the simple case of a full and flat structuring element, it can be
     viewed as a minimum filter over a sliding window.
 
-    It wraps `scipy.ndimage.morphology.grey_erosion`. The `footprint`,
-    `structure`, `output`, `mode`, `cval` and `origin` options are not
-    supported.
+    It wraps `scipy.ndimage.morphology.grey_erosion`. The `structure`,
+    `mode`, `cval` and `origin` options are not supported.
 
     Keep in mind that `mode` and `cval` influence the results. In this case
     the default mode is used, `reflect`.
@@ -52,14 +333,25 @@ def erosion(parameters):
     :param parameters['size']: which neighbours to take into account, defaults
                                to (3, 3) a.k.a. numpy.ones((3, 3))
     :type parameters['size']: list
+    :param parameters['footprint']: instead of size, the structuring element,
+                                    check the module documentation
+    :type parameters['footprint']: list or dict
+    :param parameters['decompose']: decompose the footprint, defaults to True
+    :type parameters['decompose']: bool
+    :param parameters['backend']: 'scipy', 'vhgw' or 'auto', defaults to
+                                  'auto'
+    :type parameters['backend']: string
+    :param parameters['block_shape']: optional, filter in blocks of this shape
+    :type parameters['block_shape']: list
+    :param parameters['output']: optional, npy file to write the result to
+    :type parameters['output']: string
 
     :return: numpy.array
 
     """
-    data = parameters['data'][0]
-    size = tuple(parameters['size'])
+    function, _, size = operators(parameters)
 
-    return morphology.grey_erosion(data, size=size)
+    return tiling.apply(parameters, function, tiling.halo(size))
 
 
 def dilation(parameters):
@@ -68,9 +360,8 @@ def dilation(parameters):
     For the simple case of a full and flat structuring element, it can be
     viewed as a maximum filter over a sliding window.
 
-    It wraps `scipy.ndimage.morphology.grey_dilation`. The `footprint`,
-    `structure`, `output`, `mode`, `cval` and `origin` options are not
-    supported.
+    It wraps `scipy.ndimage.morphology.grey_dilation`. The `structure`,
+    `mode`, `cval` and `origin` options are not supported.
 
     Keep in mind that `mode` and `cval` influence the results. In this case
     the default mode is used, `reflect`.
@@ -80,24 +371,34 @@ def dilation(parameters):
     :param parameters['size']: which neighbours to take into account, defaults
                                to (3, 3) a.k.a. numpy.ones((3, 3))
     :type parameters['size']: list
+    :param parameters['footprint']: instead of size, the structuring element,
+                                    check the module documentation
+    :type parameters['footprint']: list or dict
+    :param parameters['decompose']: decompose the footprint, defaults to True
+    :type parameters['decompose']: bool
+    :param parameters['backend']: 'scipy', 'vhgw' or 'auto', defaults to
+                                  'auto'
+    :type parameters['backend']: string
+    :param parameters['block_shape']: optional, filter in blocks of this shape
+    :type parameters['block_shape']: list
+    :param parameters['output']: optional, npy file to write the result to
+    :type parameters['output']: string
 
     :return: numpy.array
 
     """
-    data = parameters['data'][0]
-    size = tuple(parameters['size'])
+    _, function, size = operators(parameters)
 
-    return morphology.grey_dilation(data, size=size)
+    return tiling.apply(parameters, function, tiling.halo(size))
 
 
 def opening(parameters):
     """Calculates morphological opening of a greyscale image.
 
-    This is equal to performing a dilation and then an erosion.
+    This is equal to performing an erosion and then a dilation.
 
-    It wraps `scipy.ndimage.morphology.grey_closing`. The `footprint`,
-    `structure`, `output`, `mode`, `cval` and `origin` options are not
-    supported.
+    It wraps `scipy.ndimage.morphology.grey_opening`. The `structure`,
+    `mode`, `cval` and `origin` options are not supported.
 
     Keep in mind that `mode` and `cval` influence the results. In this case
     the default mode is used, `reflect`.
@@ -107,11 +408,26 @@ def opening(parameters):
     :param parameters['size']: which neighbours to take into account, defaults
                                to (3, 3) a.k.a. numpy.ones((3, 3))
     :type parameters['size']: list
+    :param parameters['footprint']: instead of size, the structuring element,
+                                    check the module documentation
+    :type parameters['footprint']: list or dict
+    :param parameters['decompose']: decompose the footprint, defaults to True
+    :type parameters['decompose']: bool
+    :param parameters['backend']: 'scipy', 'vhgw' or 'auto', defaults to
+                                  'auto'
+    :type parameters['backend']: string
+    :param parameters['block_shape']: optional, filter in blocks of this shape
+    :type parameters['block_shape']: list
+    :param parameters['output']: optional, npy file to write the result to
+    :type parameters['output']: string
 
     :return: numpy.array
 
     """
-    data = parameters['data'][0]
-    size = tuple(parameters['size'])
+    erosion, dilation, size = operators(parameters)
+
+    def function(data):
+        """Erodes and then dilates data"""
+        return dilation(erosion(data))
 
-    return morphology.grey_opening(data, size=size)
+    return tiling.apply(parameters, function, tiling.halo(size, passes=2))
@@ -0,0 +1,161 @@
+"""Running minimum and maximum with a cost independent of the window size.
+
+These implement the van Herk/Gil-Werman algorithm. Along each axis the data
+is split in blocks as long as the window and two running extrema are
+accumulated in every block, one forwards and one backwards. Every window
+covers the end of one block and the start of the next, so its extremum is
+the extremum of one backward and one forward value. That is 3 comparisons
+per cell and axis, whatever the window length, and all of them are
+vectorized numpy operations.
+
+The results are identical to `scipy.ndimage.filters.minimum_filter` and
+`maximum_filter` with a rectangular size and the default mode, `reflect`,
+including the placement of windows of even length.
+
+`scipy.ndimage` itself already filters rectangular windows axis by axis with
+a cost independent of the window size, but one cell at a time. The vectorized
+comparisons here are faster for 8 and 16 bit integers, where numpy compares
+many cells per instruction, and slower for floats. The filter tasks choose
+between the two with chosen().
+
+"""
+import numpy
+
+
+BACKENDS = ['auto', 'scipy', 'vhgw']
+
+# shortest window along any axis for which 'auto' uses the running filters,
+# from benchmarks/sliding.py
+MIN_LENGTH = 5
+
+
+def running(data, length, function, axis, origin=0):
+    """Calculates the running extremum along an axis.
+
+    :param data: input array
+    :type data: numpy.array
+    :param length: the window length
+    :type length: integer
+    :param function: numpy.minimum or numpy.maximum
+    :type function: numpy.ufunc
+    :param axis: the axis to filter along
+    :type axis: integer
+    :param origin: shift of the window, as in scipy.ndimage, defaults to 0
+    :type origin: integer
+
+    :return: numpy.array
+
+    """
+    if length <= 1 and origin == 0:
+        return data.copy()
+
+    data = numpy.swapaxes(data, 0, axis)
+    count = data.shape[0]
+    before = length // 2 + origin
+    blocks = -(-(count + length - 1) // length)
+
+    # the data with its borders reflected and padded to a whole number of
+    # blocks, the extra cells are never part of a window
+    padded = data.take(reflected(count, before, blocks * length), axis=0)
+
+    padded = padded.reshape((blocks, length) + data.shape[1:])
+    forward = function.accumulate(padded, axis=1)
+    backward = function.accumulate(padded[:, ::-1], axis=1)[:, ::-1]
+    forward = forward.reshape((-1,) + data.shape[1:])
+    backward = backward.reshape((-1,) + data.shape[1:])
+
+    result = function(backward[:count],
+                      forward[length - 1:length - 1 + count])
+
+    return numpy.swapaxes(result, 0, axis)
+
+
+def reflected(count, before, total):
+    """Returns the indices of data extended with its reflection.
+
+    The data is reflected as in the `reflect` mode of scipy.ndimage,
+    'd c b a | a b c d', repeatedly when the extension is longer than the
+    data.
+
+    :param count: length of the data
+    :type count: integer
+    :param before: how many cells to add before the data
+    :type before: integer
+    :param total: length of the extended data
+    :type total: integer
+
+    :return: numpy.array
+
+    """
+    index = numpy.arange(total) - before
+    index %= 2 * count
+    return numpy.where(index < count, index, 2 * count - 1 - index)
+
+
+def minimum(data, size, origin=0):
+    """Calculates the local minimum over a rectangular window.
+
+    :param data: input array
+    :type data: numpy.array
+    :param size: the window size along each axis
+    :type size: tuple
+    :param origin: shift of the window along every axis, defaults to 0
+    :type origin: integer or tuple
+
+    :return: numpy.array
+
+    """
+    return separable(data, size, numpy.minimum, origin)
+
+
+def maximum(data, size, origin=0):
+    """Calculates the local maximum over a rectangular window.
+
+    :param data: input array
+    :type data: numpy.array
+    :param size: the window size along each axis
+    :type size: tuple
+    :param origin: shift of the window along every axis, defaults to 0
+    :type origin: integer or tuple
+
+    :return: numpy.array
+
+    """
+    return separable(data, size, numpy.maximum, origin)
+
+
+def separable(data, size, function, origin=0):
+    """Applies the running extremum along every axis of the window"""
+    if isinstance(origin, int):
+        origin = [origin] * len(size)
+
+    result = data
+    for axis, (length, shift) in enumerate(zip(size, origin)):
+        result = running(result, length, function, axis, shift)
+
+    return result
+
+
+def chosen(backend, dtype, size):
+    """Returns whether to use the running filters instead of scipy.
+
+    :param backend: 'scipy', 'vhgw' or 'auto', which uses the running
+                    filters for 8 and 16 bit integers and windows at least
+                    MIN_LENGTH long along every axis
+    :type backend: string
+    :param dtype: dtype of the data to filter
+    :type dtype: numpy.dtype
+    :param size: the window size along each axis
+    :type size: tuple
+
+    :return: bool
+
+    """
+    if backend not in BACKENDS:
+        raise ValueError('Unknown backend %s' % backend)
+    if backend == 'auto':
+        dtype = numpy.dtype(dtype)
+        return dtype.kind in 'ui' and dtype.itemsize <= 2 and \
+            min(size) >= MIN_LENGTH
+
+    return backend == 'vhgw'
@@ -6,20 +6,397 @@ underlying array is not an image.
 These functions wrap the relevant scipy functions. The ones provided by
 skimage are not well documented and they lack a standard deviation filter.
 
+All of them can filter large arrays block by block, with `block_shape`, and
+write their results to an npy file, with `output`, which unlike the `output`
+of scipy is a path and not an array. For details check
+gramcore.filters.tiling.apply().
+
 """
+import numpy
 from scipy.ndimage.filters import minimum_filter
 from scipy.ndimage.filters import maximum_filter
 from scipy.ndimage.filters import uniform_filter
 from scipy.ndimage.filters import median_filter
-from scipy.ndimage.filters import generic_filter
-from scipy.ndimage.measurements import standard_deviation
+from scipy.ndimage.filters import percentile_filter
+from scipy.ndimage.filters import rank_filter
+
+from gramcore.filters import histogram
+from gramcore.filters import sliding
+from gramcore.filters import tiling
+
+
+def floating(dtype):
+    """Returns the dtype of a result, which must be floating.
+
+    Averages, variances and standard deviations are fractions, an integer
+    dtype would truncate them or fail to hold them.
+
+    :param dtype: e.g. 'float' or 'float32'
+    :type dtype: string
+
+    :return: numpy.dtype
+
+    """
+    dtype = numpy.dtype(dtype)
+    if dtype.kind != 'f':
+        raise ValueError('The dtype of local statistics must be floating, '
+                         'not %s' % dtype)
+
+    return dtype
+
+
+def local_moments(data, size, dtype='float', mean=None, variance=None):
+    """Calculates the local average and the local variance as
+    E[x^2] - E[x]^2.
+
+    Both averages come from uniform filters, so the cost per cell doesn't
+    depend on the window size, as opposed to calling back into python for
+    every cell with `scipy.ndimage.filters.generic_filter`.
+
+    Subtracting the two averages loses precision when the values are large
+    compared to their variance, e.g. heights in a DTM. To limit this the
+    averages are always calculated in float64, only the results are cast to
+    dtype, and the global average is subtracted from the data first, which
+    doesn't change the variance. Results within rounding error of zero, or
+    negative ones, are set to zero.
+
+    :param data: input array
+    :type data: numpy.array
+    :param size: the window size along each axis
+    :type size: tuple
+    :param dtype: dtype of the results, defaults to 'float', use 'float32'
+                  to halve their memory
+    :type dtype: string
+    :param mean: where to write the average, defaults to None which
+                 allocates a new array
+    :type mean: numpy.array
+    :param variance: where to write the variance, defaults to None which
+                     allocates a new array
+    :type variance: numpy.array
+
+    :return: tuple of numpy.arrays, (mean, variance)
+
+    """
+    dtype = floating(dtype)
+    data = data.astype('float64')
+    offset = data.mean()
+    data -= offset
+
+    average = uniform_filter(data, size=size)
+    data *= data
+    spread = uniform_filter(data, size=size)
+    # reuse the squares for the squared average and the rounding error of
+    # each cell, which is relative to the average of the squares
+    squared = numpy.multiply(average, average, out=data)
+    spread -= squared
+    tolerance = numpy.add(squared, spread, out=data)
+    tolerance *= 8 * numpy.finfo(spread.dtype).eps
+    spread[spread <= tolerance] = 0
+    average += offset
+
+    if mean is None:
+        mean = average.astype(dtype, copy=False)
+    else:
+        mean[...] = average
+    if variance is None:
+        variance = spread.astype(dtype, copy=False)
+    else:
+        variance[...] = spread
+
+    return mean, variance
+
+
+def local_variance(data, size, dtype='float'):
+    """Calculates the local variance as E[x^2] - E[x]^2.
+
+    Check local_moments() for details.
+
+    :param data: input array
+    :type data: numpy.array
+    :param size: the window size along each axis
+    :type size: tuple
+    :param dtype: dtype of the result, defaults to 'float', use 'float32'
+                  to halve its memory
+    :type dtype: string
+
+    :return: numpy.array
+
+    """
+    return local_moments(data, size, dtype=dtype)[1]
+
+
+def integral_images(data, before, after):
+    """Calculates the integral images of the data and of its square.
+
+    The data is extended with its reflection, as in the `reflect` mode of
+    scipy.ndimage, and the global average is subtracted first to limit the
+    rounding errors of the sums, which grow with the size of the array. The
+    images have an extra first row and column of zeros, so the sum over
+    rows a to b and columns c to d is::
+
+        image[b, d] - image[a, d] - image[b, c] + image[a, c]
+
+    :param data: input array, 2D
+    :type data: numpy.array
+    :param before: how many rows and columns to add before the data
+    :type before: tuple
+    :param after: how many rows and columns to add after the data
+    :type after: tuple
+
+    :return: tuple (sums, sums of squares, average), the images are float64
+             arrays and the average is the one subtracted from the data
+
+    """
+    rows = sliding.reflected(data.shape[0], before[0],
+                             data.shape[0] + before[0] + after[0])
+    columns = sliding.reflected(data.shape[1], before[1],
+                                data.shape[1] + before[1] + after[1])
+    extended = data.astype('float64')
+    average = extended.mean()
+    extended -= average
+    extended = extended.take(rows, axis=0).take(columns, axis=1)
+
+    shape = (extended.shape[0] + 1, extended.shape[1] + 1)
+    sums = numpy.zeros(shape)
+    numpy.cumsum(extended, axis=0, out=sums[1:, 1:])
+    numpy.cumsum(sums[1:, 1:], axis=1, out=sums[1:, 1:])
+    extended *= extended
+    squares = numpy.zeros(shape)
+    numpy.cumsum(extended, axis=0, out=squares[1:, 1:])
+    numpy.cumsum(squares[1:, 1:], axis=1, out=squares[1:, 1:])
+
+    return sums, squares, average
+
+
+def window_sum(image, shape, size, before, out):
+    """Sums the windows of an integral image.
+
+    :param image: integral image, as returned by integral_images()
+    :type image: numpy.array
+    :param shape: shape of the data
+    :type shape: tuple
+    :param size: the window size along each axis
+    :type size: tuple
+    :param before: rows and columns added before the data in the image
+    :type before: tuple
+    :param out: where to write the sums
+    :type out: numpy.array
+
+    :return: numpy.array, out
+
+    """
+    top = before[0] - size[0] // 2
+    left = before[1] - size[1] // 2
+    rows = slice(top, top + shape[0])
+    columns = slice(left, left + shape[1])
+    lower = slice(top + size[0], top + size[0] + shape[0])
+    right = slice(left + size[1], left + size[1] + shape[1])
+
+    numpy.subtract(image[lower, right], image[rows, right], out=out)
+    out -= image[lower, columns]
+    out += image[rows, columns]
+
+    return out
+
+
+BANK = ['mean', 'stddev', 'variance']
+
+
+def bank(parameters):
+    """Calculates the local mean and standard deviation for several window
+    sizes and stacks them.
+
+    It is the same as calling mean and stddev for every size, but the data
+    is only read once. The integral images of the data and of its square are
+    calculated once, then every window sum takes 3 additions per cell,
+    whatever the window size.
+
+    The stack has one layer per size and statistic, ordered by size, e.g.
+    for sizes [[3, 3], [9, 9]] and statistics ['mean', 'stddev'] the layers
+    are the mean and the stddev with 3x3 windows, then with 9x9 windows.
+
+    The integral images take 16 bytes per cell, set `block_shape` to limit
+    memory usage and `output` to write the stack to an npy file instead of
+    keeping it in memory.
+
+    The results equal those of mean and stddev, with the default mode,
+    `reflect`, up to rounding. Standard deviations within rounding error of
+    zero are set to zero.
+
+    :param parameters['data'][0]: input array
+    :type parameters['data'][0]: numpy.array
+    :param parameters['sizes']: window sizes, e.g. [[3, 3], [9, 9]]
+    :type parameters['sizes']: list
+    :param parameters['statistics']: which statistics to calculate for every
+                                     size and their order in the stack, any
+                                     of 'mean', 'stddev' and 'variance',
+                                     defaults to ['mean', 'stddev']
+    :type parameters['statistics']: list
+    :param parameters['dtype']: floating dtype of the result, defaults to
+                                'float', 'float32' uses half the memory, the
+                                sums are always float64
+    :type parameters['dtype']: string
+    :param parameters['block_shape']: optional, filter in blocks of this shape
+    :type parameters['block_shape']: list
+    :param parameters['output']: optional, npy file to write the stack to
+    :type parameters['output']: string
+
+    :return: numpy.array, with one layer per size and statistic along the
+             last axis
+
+    """
+    sizes = [tuple(size) for size in parameters['sizes']]
+    names = parameters.get('statistics', ['mean', 'stddev'])
+    dtype = floating(parameters.get('dtype', 'float'))
+
+    unknown = [name for name in names if name not in BANK]
+    if unknown:
+        raise ValueError('Unknown statistics %s' % ', '.join(unknown))
+
+    before = tuple(max(size[axis] // 2 for size in sizes) for axis in (0, 1))
+    after = tuple(max(size[axis] - 1 - size[axis] // 2 for size in sizes)
+                  for axis in (0, 1))
+
+    def function(data):
+        """Calculates the statistics of every size into a stack"""
+        sums, squares, offset = integral_images(data, before, after)
+        # the rounding error of a window sum is relative to the largest sums
+        # it is calculated from
+        error = 8 * numpy.finfo('float64').eps * abs(squares).max()
+
+        # layers are contiguous in memory, as in describe()
+        stack = numpy.empty((len(sizes) * len(names),) + data.shape,
+                            dtype=dtype)
+        average = numpy.empty(data.shape)
+        variance = numpy.empty(data.shape)
+        squared = numpy.empty(data.shape)
+        for index, size in enumerate(sizes):
+            area = float(size[0] * size[1])
+            window_sum(sums, data.shape, size, before, average)
+            average /= area
+            if 'stddev' in names or 'variance' in names:
+                window_sum(squares, data.shape, size, before, variance)
+                variance /= area
+                variance -= numpy.multiply(average, average, out=squared)
+                variance[variance <= error / area] = 0
+
+            layers = stack[index * len(names):(index + 1) * len(names)]
+            for name, layer in zip(names, layers):
+                if name == 'mean':
+                    # the average of the data was subtracted from the sums
+                    numpy.add(average, offset, out=layer)
+                elif name == 'variance':
+                    layer[...] = variance
+                else:
+                    numpy.sqrt(variance, out=layer)
+
+        return numpy.rollaxis(stack, 0, stack.ndim)
+
+    return tiling.apply(parameters, function, list(before))
+
+
+STATISTICS = ['minimum', 'maximum', 'mean', 'variance', 'range']
+
+
+def describe(parameters):
+    """Calculates several local statistics and stacks them.
+
+    It is the same as calling minimum, maximum, mean and stddev on the same
+    data with the same size, but work is shared between the statistics:
+
+        1. the minimum and maximum are written directly in the result dtype,
+        2. the variance reuses the average, check local_moments(),
+        3. the range reuses the minimum and the maximum,
+        4. every statistic is written directly into its layer of a single
+           preallocated stack, without temporary arrays.
+
+    The stack is returned as an (H, W, k) array, but its layers are stored
+    one after the other, which is faster to fill. Block by block, with
+    `block_shape` or `output`, the result is an ordinary (H, W, k) array.
+
+    The minimum and maximum are those of maximum() and minimum() and the
+    variance is the one of local_moments(). The `footprint`, `mode`, `cval`
+    and `origin` options are not supported, the default mode is used,
+    `reflect`.
+
+    :param parameters['data'][0]: input array
+    :type parameters['data'][0]: numpy.array
+    :param parameters['statistics']: which statistics to calculate and their
+                                     order in the stack, any of 'minimum',
+                                     'maximum', 'mean', 'variance' and
+                                     'range', defaults to all of them
+    :type parameters['statistics']: list
+    :param parameters['size']: which neighbours to take into account, defaults
+                               to (3, 3) a.k.a. numpy.ones((3, 3))
+    :type parameters['size']: list
+    :param parameters['dtype']: floating dtype of the result, defaults to
+                                'float', 'float32' uses half the memory
+    :type parameters['dtype']: string
+    :param parameters['backend']: backend of the minimum and maximum, check
+                                  maximum(), defaults to 'auto'
+    :type parameters['backend']: string
+    :param parameters['block_shape']: optional, filter in blocks of this shape
+    :type parameters['block_shape']: list
+    :param parameters['output']: optional, npy file to write the result to
+    :type parameters['output']: string
+
+    :return: numpy.array, with one layer per statistic along the last axis
+
+    """
+    names = parameters.get('statistics', STATISTICS)
+    size = tuple(parameters.get('size', [3, 3]))
+    dtype = floating(parameters.get('dtype', 'float'))
+    backend = parameters.get('backend', 'auto')
+
+    unknown = [name for name in names if name not in STATISTICS]
+    if unknown:
+        raise ValueError('Unknown statistics %s' % ', '.join(unknown))
+
+    def function(data):
+        """Calculates the statistics into the layers of a stack"""
+        # layers are contiguous in memory, scipy filters write to them
+        # faster than to the interleaved cells of an (H, W, k) array
+        stack = numpy.empty((len(names),) + data.shape, dtype=dtype)
+        layers = dict(zip(names, stack))
+        running = sliding.chosen(backend, data.dtype, size)
+
+        if 'minimum' in layers or 'range' in layers:
+            # without the minimum layer, the range layer holds it until the
+            # maximum is subtracted
+            low = layers.get('minimum', layers.get('range'))
+            if running:
+                low[...] = sliding.minimum(data, size)
+            else:
+                minimum_filter(data, size=size, output=low)
+        if 'maximum' in layers or 'range' in layers:
+            high = layers.get('maximum')
+            if high is None:
+                high = numpy.empty(data.shape, dtype=dtype)
+            if running:
+                high[...] = sliding.maximum(data, size)
+            else:
+                maximum_filter(data, size=size, output=high)
+        if 'range' in layers:
+            numpy.subtract(high, low, out=layers['range'])
+
+        if 'mean' in layers or 'variance' in layers:
+            local_moments(data, size, dtype=dtype, mean=layers.get('mean'),
+                          variance=layers.get('variance'))
+
+        return numpy.rollaxis(stack, 0, stack.ndim)
+
+    return tiling.apply(parameters, function, tiling.halo(size))
 
 
 def maximum(parameters):
     """Calculates the local maximum.
 
-    It wraps `scipy.ndimage.filters.minimum_filter`. The `footprint`,
-    `output`, `mode`, `cval` and `origin` options are not supported.
+    It wraps `scipy.ndimage.filters.maximum_filter`. The `footprint`,
+    `mode`, `cval` and `origin` options are not supported.
+
+    For 8 and 16 bit integers and windows of at least
+    sliding.MIN_LENGTH cells it uses gramcore.filters.sliding instead, which
+    is faster and gives identical results.
 
     Keep in mind that `mode` and `cval` influence the results. In this case
     the default mode is used, `reflect`.
@@ -29,21 +406,35 @@ def maximum(parameters):
     :param parameters['size']: which neighbours to take into account, defaults
                                to (3, 3) a.k.a. numpy.ones((3, 3))
     :type parameters['size']: list
+    :param parameters['backend']: 'scipy', 'vhgw' for
+                                  gramcore.filters.sliding or 'auto', the
+                                  default, which picks the faster one
+    :type parameters['backend']: string
+    :param parameters['block_shape']: optional, filter in blocks of this shape
+    :type parameters['block_shape']: list
+    :param parameters['output']: optional, npy file to write the result to
+    :type parameters['output']: string
 
     :return: numpy.array
 
     """
-    data = parameters['data'][0]
-    size = parameters.get('size', [3, 3])
+    size = tuple(parameters.get('size', [3, 3]))
+    backend = parameters.get('backend', 'auto')
+
+    def function(data):
+        """Filters data with the chosen backend"""
+        if sliding.chosen(backend, data.dtype, size):
+            return sliding.maximum(data, size)
+        return maximum_filter(data, size=size)
 
-    return maximum_filter(data, size=tuple(size))
+    return tiling.apply(parameters, function, tiling.halo(size))
 
 
 def mean(parameters):
     """Calculates the local average.
 
-    It wraps `scipy.ndimage.filters.minimum_filter`. The `footprint`,
-    `output`, `mode`, `cval` and `origin` options are not supported.
+    It wraps `scipy.ndimage.filters.uniform_filter`. The `footprint`,
+    `mode`, `cval` and `origin` options are not supported.
 
     Keep in mind that `mode` and `cval` influence the results. In this case
     the default mode is used, `reflect`.
@@ -53,21 +444,36 @@ def mean(parameters):
     :param parameters['size']: which neighbours to take into account, defaults
                                to (3, 3) a.k.a. numpy.ones((3, 3))
     :type parameters['size']: list
+    :param parameters['dtype']: dtype of the result, defaults to 'float',
+                                'float32' uses half the memory
+    :type parameters['dtype']: string
+    :param parameters['block_shape']: optional, filter in blocks of this shape
+    :type parameters['block_shape']: list
+    :param parameters['output']: optional, npy file to write the result to
+    :type parameters['output']: string
 
     :return: numpy.array
 
     """
-    data = parameters['data'][0].astype('float')
-    size = parameters.get('size', [3, 3])
+    size = tuple(parameters.get('size', [3, 3]))
+    dtype = numpy.dtype(parameters.get('dtype', 'float'))
+
+    def function(data):
+        """Averages data directly into an output array of dtype"""
+        return uniform_filter(data, size=size, output=dtype)
 
-    return uniform_filter(data, size=tuple(size))
+    return tiling.apply(parameters, function, tiling.halo(size))
 
 
 def median(parameters):
     """Calculates the local median.
 
-    It wraps `scipy.ndimage.filters.minimum_filter`. The `footprint`,
-    `output`, `mode`, `cval` and `origin` options are not supported.
+    It wraps `scipy.ndimage.filters.median_filter`. The `footprint`,
+    `mode`, `cval` and `origin` options are not supported.
+
+    For 8 and 16 bit unsigned integers and large windows it uses the sliding
+    histograms of gramcore.filters.histogram instead, which are faster and
+    give identical results.
 
     Keep in mind that `mode` and `cval` influence the results. In this case
     the default mode is used, `reflect`.
@@ -77,21 +483,39 @@ def median(parameters):
     :param parameters['size']: which neighbours to take into account, defaults
                                to (3, 3) a.k.a. numpy.ones((3, 3))
     :type parameters['size']: list
+    :param parameters['backend']: 'scipy', 'histogram' or 'auto', the
+                                  default, which picks the faster one
+    :type parameters['backend']: string
+    :param parameters['block_shape']: optional, filter in blocks of this shape
+    :type parameters['block_shape']: list
+    :param parameters['output']: optional, npy file to write the result to
+    :type parameters['output']: string
 
     :return: numpy.array
 
     """
-    data = parameters['data'][0]
-    size = parameters.get('size', [3, 3])
+    size = tuple(parameters.get('size', [3, 3]))
+    backend = parameters.get('backend', 'auto')
+
+    def function(data):
+        """Filters data with the chosen backend"""
+        if histogram.chosen(backend, data.dtype, size):
+            middle = int(numpy.prod(size)) // 2
+            return histogram.rank_filter(data, size, middle)
+        return median_filter(data, size=size)
 
-    return median_filter(data, size=tuple(size))
+    return tiling.apply(parameters, function, tiling.halo(size))
 
 
 def minimum(parameters):
     """Calculates the local minimum.
 
     It wraps `scipy.ndimage.filters.minimum_filter`. The `footprint`,
-    `output`, `mode`, `cval` and `origin` options are not supported.
+    `mode`, `cval` and `origin` options are not supported.
+
+    For 8 and 16 bit integers and windows of at least
+    sliding.MIN_LENGTH cells it uses gramcore.filters.sliding instead, which
+    is faster and gives identical results.
 
     Keep in mind that `mode` and `cval` influence the results. In this case
     the default mode is used, `reflect`.
@@ -101,21 +525,130 @@ def minimum(parameters):
     :param parameters['size']: which neighbours to take into account, defaults
                                to (3, 3) a.k.a. numpy.ones((3, 3))
     :type parameters['size']: list
+    :param parameters['backend']: 'scipy', 'vhgw' for
+                                  gramcore.filters.sliding or 'auto', the
+                                  default, which picks the faster one
+    :type parameters['backend']: string
+    :param parameters['block_shape']: optional, filter in blocks of this shape
+    :type parameters['block_shape']: list
+    :param parameters['output']: optional, npy file to write the result to
+    :type parameters['output']: string
 
     :return: numpy.array
 
     """
-    data = parameters['data'][0]
-    size = parameters.get('size', [3, 3])
+    size = tuple(parameters.get('size', [3, 3]))
+    backend = parameters.get('backend', 'auto')
+
+    def function(data):
+        """Filters data with the chosen backend"""
+        if sliding.chosen(backend, data.dtype, size):
+            return sliding.minimum(data, size)
+        return minimum_filter(data, size=size)
+
+    return tiling.apply(parameters, function, tiling.halo(size))
+
+
+def percentile(parameters):
+    """Calculates a local percentile.
+
+    It wraps `scipy.ndimage.filters.percentile_filter`. The `footprint`,
+    `mode`, `cval` and `origin` options are not supported.
 
-    return minimum_filter(data, size=tuple(size))
+    For 8 and 16 bit unsigned integers and large windows it uses the sliding
+    histograms of gramcore.filters.histogram instead, which are faster and
+    give identical results.
+
+    Keep in mind that `mode` and `cval` influence the results. In this case
+    the default mode is used, `reflect`.
+
+    :param parameters['data'][0]: input array
+    :type parameters['data'][0]: numpy.array
+    :param parameters['percentile']: from 0 to 100, negative ones count from
+                                     the end
+    :type parameters['percentile']: float
+    :param parameters['size']: which neighbours to take into account, defaults
+                               to (3, 3) a.k.a. numpy.ones((3, 3))
+    :type parameters['size']: list
+    :param parameters['backend']: 'scipy', 'histogram' or 'auto', the
+                                  default, which picks the faster one
+    :type parameters['backend']: string
+    :param parameters['block_shape']: optional, filter in blocks of this shape
+    :type parameters['block_shape']: list
+    :param parameters['output']: optional, npy file to write the result to
+    :type parameters['output']: string
+
+    :return: numpy.array
+
+    """
+    size = tuple(parameters.get('size', [3, 3]))
+    backend = parameters.get('backend', 'auto')
+    value = parameters['percentile']
+
+    def function(data):
+        """Filters data with the chosen backend"""
+        if histogram.chosen(backend, data.dtype, size):
+            return histogram.rank_filter(
+                data, size, histogram.percentile_rank(size, value))
+        return percentile_filter(data, value, size=size)
+
+    return tiling.apply(parameters, function, tiling.halo(size))
+
+
+def rank(parameters):
+    """Calculates the local element of a rank, e.g. 0 for the minimum.
+
+    It wraps `scipy.ndimage.filters.rank_filter`. The `footprint`,
+    `mode`, `cval` and `origin` options are not supported.
+
+    For 8 and 16 bit unsigned integers and large windows it uses the sliding
+    histograms of gramcore.filters.histogram instead, which are faster and
+    give identical results.
+
+    Keep in mind that `mode` and `cval` influence the results. In this case
+    the default mode is used, `reflect`.
+
+    :param parameters['data'][0]: input array
+    :type parameters['data'][0]: numpy.array
+    :param parameters['rank']: the rank in the sorted window, negative ones
+                               count from the end, e.g. -1 for the maximum
+    :type parameters['rank']: integer
+    :param parameters['size']: which neighbours to take into account, defaults
+                               to (3, 3) a.k.a. numpy.ones((3, 3))
+    :type parameters['size']: list
+    :param parameters['backend']: 'scipy', 'histogram' or 'auto', the
+                                  default, which picks the faster one
+    :type parameters['backend']: string
+    :param parameters['block_shape']: optional, filter in blocks of this shape
+    :type parameters['block_shape']: list
+    :param parameters['output']: optional, npy file to write the result to
+    :type parameters['output']: string
+
+    :return: numpy.array
+
+    """
+    size = tuple(parameters.get('size', [3, 3]))
+    backend = parameters.get('backend', 'auto')
+    value = parameters['rank']
+
+    def function(data):
+        """Filters data with the chosen backend"""
+        if histogram.chosen(backend, data.dtype, size):
+            return histogram.rank_filter(data, size, value)
+        return rank_filter(data, value, size=size)
+
+    return tiling.apply(parameters, function, tiling.halo(size))
 
 
 def stddev(parameters):
     """Calculates the local standard deviation.
 
-    It wraps `scipy.ndimage.filters.minimum_filter`. The `footprint`,
-    `output`, `mode`, `cval` and `origin` options are not supported.
+    It is the square root of the local variance, computed from uniform
+    filters of the data and its square, check local_variance() for details.
+    It gives the same results as `scipy.ndimage.filters.generic_filter` with
+    `scipy.ndimage.measurements.standard_deviation`, up to rounding, in a
+    fraction of the time. The `footprint`, `mode`, `cval` and `origin`
+    options are not supported.
 
     Keep in mind that `mode` and `cval` influence the results. In this case
     the default mode is used, `reflect`.
@@ -125,11 +658,24 @@ def stddev(parameters):
     :param parameters['size']: which neighbours to take into account, defaults
                                to (3, 3) a.k.a. numpy.ones((3, 3))
     :type parameters['size']: list
+    :param parameters['dtype']: floating dtype of the result, defaults to
+                                'float', 'float32' uses half the memory, the
+                                calculations are always in float64
+    :type parameters['dtype']: string
+    :param parameters['block_shape']: optional, filter in blocks of this shape
+    :type parameters['block_shape']: list
+    :param parameters['output']: optional, npy file to write the result to
+    :type parameters['output']: string
 
     :return: numpy.array
 
     """
-    data = parameters['data'][0].astype('float')
-    size = parameters.get('size', [3, 3])
+    size = tuple(parameters.get('size', [3, 3]))
+    dtype = floating(parameters.get('dtype', 'float'))
+
+    def function(data):
+        """Calculates the standard deviation from the local variance"""
+        variance = local_variance(data, size, dtype=dtype)
+        return numpy.sqrt(variance, out=variance)
 
-    return generic_filter(data, standard_deviation, size=tuple(size))
+    return tiling.apply(parameters, function, tiling.halo(size))
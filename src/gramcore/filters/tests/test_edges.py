@@ -82,3 +82,16 @@ def test_sobel():
     result = result.astype('uint8')
 
     assert_equal(result.sum(), 76)
+
+
+def test_sobel_dtype():
+    """Apply sobel to grey image and get a float32 result"""
+    img = io.imread('white-square.tif')
+
+    parameters = {'data': [img], 'dtype': 'float32'}
+
+    result = edges.sobel(parameters)
+    expected = edges.sobel({'data': [img]})
+
+    assert_equal(result.dtype, numpy.dtype('float32'))
+    numpy.testing.assert_allclose(result, expected, rtol=1e-6)
@@ -0,0 +1,91 @@
+"""Tests for module gramcore.filters.histogram"""
+import numpy
+from scipy.ndimage.filters import rank_filter
+
+from nose.tools import assert_equal, raises
+
+from gramcore.filters import histogram
+
+
+def test_rank_filter():
+    """Compare every rank with scipy, for odd and even windows"""
+    numpy.random.seed(0)
+    arr = numpy.random.randint(0, 255, (20, 31)).astype('uint8')
+
+    for size in [(1, 1), (3, 3), (2, 2), (4, 7), (11, 6)]:
+        area = size[0] * size[1]
+        for rank in range(area):
+            result = histogram.rank_filter(arr, size, rank)
+            expected = rank_filter(arr, rank, size=size)
+            assert_equal(result.dtype, arr.dtype)
+            assert_equal((result != expected).sum(), 0)
+
+
+def test_rank_filter_uint16():
+    """Compare with scipy for 16 bit values, which take 4 levels, and
+    windows longer than the data
+
+    """
+    numpy.random.seed(0)
+    arr = numpy.random.randint(0, 2 ** 16, (7, 5)).astype('uint16')
+
+    for size in [(3, 3), (5, 8), (9, 12)]:
+        area = size[0] * size[1]
+        for rank in [0, area // 3, area // 2, -1]:
+            result = histogram.rank_filter(arr, size, rank)
+            expected = rank_filter(arr, rank, size=size)
+            assert_equal((result != expected).sum(), 0)
+
+
+def test_rank_filter_strips():
+    """Filter wide arrays in strips of columns"""
+    numpy.random.seed(0)
+    arr = numpy.random.randint(0, 2 ** 12, (9, 40)).astype('uint16')
+    expected = rank_filter(arr, 12, size=(5, 5))
+
+    max_bins = histogram.MAX_BINS
+    # strips of 8 columns for 12 bit values
+    histogram.MAX_BINS = 2 ** 15
+    try:
+        result = histogram.rank_filter(arr, (5, 5), 12)
+    finally:
+        histogram.MAX_BINS = max_bins
+
+    assert_equal((result != expected).sum(), 0)
+
+
+@raises(ValueError)
+def test_rank_filter_float():
+    """Floats can't be counted in histograms"""
+    histogram.rank_filter(numpy.zeros((5, 5)), (3, 3), 4)
+
+
+@raises(ValueError)
+def test_rank_filter_rank():
+    """A rank outside the window raises ValueError"""
+    histogram.rank_filter(numpy.zeros((5, 5), dtype='uint8'), (3, 3), 9)
+
+
+def test_percentile_rank():
+    """Ranks of percentiles are the ones of scipy"""
+    assert_equal(histogram.percentile_rank((3, 3), 50), 4)
+    assert_equal(histogram.percentile_rank((3, 3), 0), 0)
+    assert_equal(histogram.percentile_rank((3, 3), 100), 8)
+    assert_equal(histogram.percentile_rank((3, 3), -25), 6)
+
+
+def test_chosen():
+    """auto picks the histograms for small unsigned integers and large
+    windows
+
+    """
+    assert_equal(histogram.chosen('auto', numpy.dtype('uint8'), (15, 15)),
+                 True)
+    assert_equal(histogram.chosen('auto', numpy.dtype('uint8'), (3, 3)),
+                 False)
+    assert_equal(histogram.chosen('auto', numpy.dtype('int16'), (31, 31)),
+                 False)
+    assert_equal(histogram.chosen('auto', numpy.dtype('float32'), (31, 31)),
+                 False)
+    assert_equal(histogram.chosen('histogram', numpy.dtype('uint8'),
+                                  (3, 3)), True)
@@ -1,7 +1,8 @@
 """Tests for module gramcore.filters.morphology"""
 import numpy
 
-from nose.tools import assert_equal
+from nose.tools import assert_equal, raises
+from scipy.ndimage import morphology as reference
 
 from gramcore.filters import morphology
 
@@ -68,3 +69,102 @@ def test_opening():
     result = morphology.opening(parameters)
 
     assert_equal(result.sum(), 5 * 5 * 255 - 255)
+
+
+def test_backends():
+    """Both backends give the same results, for odd and even windows"""
+    numpy.random.seed(0)
+    arr = numpy.random.randint(0, 255, (40, 30)).astype('uint8')
+
+    for task in [morphology.closing, morphology.dilation,
+                 morphology.erosion, morphology.opening]:
+        for size in [[5, 5], [6, 8]]:
+            parameters = {'data': [arr], 'size': size, 'backend': 'scipy'}
+            expected = task(parameters)
+            parameters['backend'] = 'vhgw'
+            result = task(parameters)
+            assert_equal((result != expected).sum(), 0)
+
+
+def test_footprint():
+    """Footprints of the structuring elements"""
+    disk = morphology.footprint({'shape': 'disk', 'radius': 2})
+    assert_equal(disk.sum(), 13)
+    assert_equal(disk[0].tolist(), [False, False, True, False, False])
+
+    diamond = morphology.footprint({'shape': 'diamond', 'radius': 2})
+    assert_equal(diamond.sum(), 13)
+    assert_equal(diamond[1].tolist(), [False, True, True, True, False])
+
+    line = morphology.footprint({'shape': 'line', 'length': 3, 'angle': 45})
+    assert_equal(line.tolist(), [[False, False, True], [False, True, False],
+                                 [True, False, False]])
+
+    explicit = morphology.footprint([[0, 1], [1, 0]])
+    assert_equal(explicit.tolist(), [[False, True], [True, False]])
+
+
+@raises(ValueError)
+def test_footprint_angle():
+    """Lines are only supported along the axes and the diagonals"""
+    morphology.footprint({'shape': 'line', 'length': 3, 'angle': 30})
+
+
+def test_decompose():
+    """Decomposed elements are cheap"""
+    steps = morphology.decompose({'shape': 'disk', 'radius': 2})
+    assert_equal(steps, [('rectangles', [(1, 5), (3, 3), (5, 1)])])
+
+    steps = morphology.decompose({'shape': 'diamond', 'radius': 30})
+    assert_equal(len(steps), 6)
+
+    steps = morphology.decompose({'shape': 'line', 'length': 81,
+                                  'angle': 135})
+    assert_equal(len(steps), 4)
+
+    steps = morphology.decompose({'shape': 'line', 'length': 4,
+                                  'angle': 45})
+    assert_equal(steps, None)
+
+
+def test_decomposed():
+    """Decomposed elements give the same results as the whole footprint"""
+    numpy.random.seed(0)
+    elements = [{'shape': 'disk', 'radius': 7},
+                {'shape': 'diamond', 'radius': 6},
+                {'shape': 'line', 'length': 9, 'angle': 0},
+                {'shape': 'line', 'length': 15, 'angle': 45},
+                {'shape': 'line', 'length': 6, 'angle': 135}]
+    tasks = [(morphology.closing, reference.grey_closing),
+             (morphology.dilation, reference.grey_dilation),
+             (morphology.erosion, reference.grey_erosion),
+             (morphology.opening, reference.grey_opening)]
+
+    for dtype in ['uint8', 'float64']:
+        arr = (255 * numpy.random.rand(30, 25)).astype(dtype)
+        for element in elements:
+            footprint = morphology.footprint(element)
+            for task, function in tasks:
+                expected = function(arr, footprint=footprint)
+                result = task({'data': [arr], 'footprint': element})
+                assert_equal((result != expected).sum(), 0)
+
+
+def test_footprint_tiled():
+    """Footprints work block by block and without decomposing"""
+    numpy.random.seed(0)
+    arr = numpy.random.randint(0, 255, (50, 40)).astype('uint8')
+    element = {'shape': 'disk', 'radius': 4}
+    expected = reference.grey_opening(arr,
+                                      footprint=morphology.footprint(element))
+
+    for extra in [{'block_shape': [16, 16]}, {'decompose': False}]:
+        parameters = {'data': [arr], 'footprint': element}
+        parameters.update(extra)
+        result = morphology.opening(parameters)
+        assert_equal((result != expected).sum(), 0)
+
+    cross = [[0, 1, 0], [1, 1, 1], [0, 1, 0]]
+    expected = reference.grey_erosion(arr, footprint=cross)
+    result = morphology.erosion({'data': [arr], 'footprint': cross})
+    assert_equal((result != expected).sum(), 0)
@@ -0,0 +1,64 @@
+"""Tests for module gramcore.filters.sliding"""
+import numpy
+from scipy.ndimage.filters import minimum_filter, maximum_filter
+
+from nose.tools import assert_equal, raises
+
+from gramcore.filters import sliding
+
+
+def test_minimum():
+    """Compare the running minimum with scipy, for odd and even windows"""
+    numpy.random.seed(0)
+    arr = numpy.random.randint(0, 255, (30, 41)).astype('uint8')
+
+    for size in [(1, 1), (3, 3), (2, 2), (4, 7), (11, 6)]:
+        result = sliding.minimum(arr, size)
+        expected = minimum_filter(arr, size=size)
+        assert_equal(result.dtype, arr.dtype)
+        assert_equal((result != expected).sum(), 0)
+
+
+def test_maximum():
+    """Compare the running maximum with scipy, for odd and even windows and
+    shifted origins
+
+    """
+    numpy.random.seed(0)
+    arr = numpy.random.rand(30, 41)
+
+    for size in [(3, 3), (4, 7), (11, 6)]:
+        for origin in [0, -1, 1]:
+            result = sliding.maximum(arr, size, origin)
+            expected = maximum_filter(arr, size=size, origin=origin)
+            assert_equal((result != expected).sum(), 0)
+
+
+def test_long_window():
+    """Windows longer than the data reflect it repeatedly, as scipy does"""
+    arr = numpy.arange(5 * 3).reshape(5, 3)
+
+    result = sliding.minimum(arr, (12, 8))
+    expected = minimum_filter(arr, size=(12, 8))
+
+    assert_equal((result != expected).sum(), 0)
+
+
+def test_chosen():
+    """auto picks the running filters for small integers and large windows"""
+    assert_equal(sliding.chosen('auto', numpy.dtype('uint8'), (51, 51)),
+                 True)
+    assert_equal(sliding.chosen('auto', numpy.dtype('uint16'), (3, 51)),
+                 False)
+    assert_equal(sliding.chosen('auto', numpy.dtype('float32'), (51, 51)),
+                 False)
+    assert_equal(sliding.chosen('vhgw', numpy.dtype('float32'), (3, 3)),
+                 True)
+    assert_equal(sliding.chosen('scipy', numpy.dtype('uint8'), (51, 51)),
+                 False)
+
+
+@raises(ValueError)
+def test_chosen_unknown():
+    """An unknown backend raises ValueError"""
+    sliding.chosen('numba', numpy.dtype('uint8'), (3, 3))
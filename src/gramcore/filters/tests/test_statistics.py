@@ -1,7 +1,9 @@
 """Tests for module gramcore.filters.statistics"""
 import numpy
+from scipy.ndimage.filters import generic_filter
+from scipy.ndimage.measurements import standard_deviation
 
-from nose.tools import assert_equal
+from nose.tools import assert_equal, raises
 
 from gramcore.filters import statistics
 
@@ -42,6 +44,20 @@ def test_mean():
     assert_equal(result[4, 2], 1.0)
 
 
+def test_mean_dtype():
+    """Average an 8 bit array directly into float32"""
+    arr = numpy.zeros((5, 5), dtype='uint8')
+    arr[1:4, 1:4] = 9
+
+    parameters = {'data': [arr], 'size': [3, 3], 'dtype': 'float32'}
+
+    result = statistics.mean(parameters)
+
+    assert_equal(result.dtype, numpy.dtype('float32'))
+    assert_equal(result[2, 2], 9.0)
+    assert_equal(result[1, 1], 4.0)
+
+
 def test_median():
     """Create a fixture and check the local median"""
     arr = numpy.zeros((5, 5))
@@ -82,3 +98,202 @@ def test_stddev():
     result = statistics.stddev(parameters)
 
     assert_equal(result[2, 2], 0.0)
+
+
+def test_stddev_generic():
+    """Compare the local standard deviation with scipy generic_filter
+
+    The fixture has a large offset compared to its variance, like heights in a
+    DTM, to check the numerical stability of the calculations.
+
+    """
+    numpy.random.seed(0)
+    arr = 1000 + numpy.random.rand(30, 40)
+    expected = generic_filter(arr, standard_deviation, size=(5, 3))
+
+    parameters = {'data': [arr], 'size': [5, 3]}
+    result = statistics.stddev(parameters)
+
+    numpy.testing.assert_allclose(result, expected, rtol=1e-6)
+    assert_equal(result.dtype, numpy.dtype('float64'))
+
+    parameters['dtype'] = 'float32'
+    result = statistics.stddev(parameters)
+
+    numpy.testing.assert_allclose(result, expected, rtol=1e-3)
+    assert_equal(result.dtype, numpy.dtype('float32'))
+
+
+def test_stddev_relief():
+    """Keep the texture of large relief in float32
+
+    The fixture has terraces 2000 apart, with a texture of about 1 on them,
+    so the global average is far from the local ones.
+
+    """
+    numpy.random.seed(0)
+    terraces = 2000 * (numpy.arange(90) // 10)
+    arr = terraces[:, None] + numpy.random.rand(90, 90)
+    arr = arr.astype('float32')
+    expected = generic_filter(arr.astype('float64'), standard_deviation,
+                              size=(3, 3))
+
+    parameters = {'data': [arr], 'size': [3, 3], 'dtype': 'float32'}
+    result = statistics.stddev(parameters)
+
+    assert_equal((result == 0).sum(), 0)
+    numpy.testing.assert_allclose(result, expected, rtol=1e-4)
+
+
+def test_describe():
+    """Compare the stack of statistics with the single statistic tasks"""
+    numpy.random.seed(0)
+    arr = 1000 + 10 * numpy.random.rand(30, 40)
+    parameters = {'data': [arr], 'size': [5, 3]}
+
+    result = statistics.describe(parameters)
+
+    assert_equal(result.shape, (30, 40, 5))
+    assert_equal(result.dtype, numpy.dtype('float64'))
+    minimum = statistics.minimum(parameters)
+    maximum = statistics.maximum(parameters)
+    numpy.testing.assert_allclose(result[..., 0], minimum, rtol=1e-6)
+    numpy.testing.assert_allclose(result[..., 1], maximum, rtol=1e-6)
+    numpy.testing.assert_allclose(result[..., 2], statistics.mean(parameters),
+                                  rtol=1e-6)
+    numpy.testing.assert_allclose(numpy.sqrt(result[..., 3]),
+                                  statistics.stddev(parameters), rtol=1e-3)
+    numpy.testing.assert_allclose(result[..., 4], maximum - minimum,
+                                  rtol=1e-4)
+
+
+def test_describe_subset():
+    """Calculate some statistics in the given order, block by block"""
+    arr = numpy.zeros((11, 11), dtype='uint8')
+    arr[4:9, 4:9] = 255
+
+    parameters = {'data': [arr], 'size': [3, 3], 'dtype': 'float32',
+                  'statistics': ['range', 'mean']}
+    result = statistics.describe(parameters)
+
+    assert_equal(result.shape, (11, 11, 2))
+    assert_equal(result.dtype, numpy.dtype('float32'))
+    assert_equal(result[3, 3, 0], 255)
+    assert_equal(result[6, 6, 0], 0)
+    numpy.testing.assert_allclose(result[4, 4, 1], 255 * 4 / 9.0, rtol=1e-6)
+
+    parameters['block_shape'] = [4, 4]
+    tiled = statistics.describe(parameters)
+
+    numpy.testing.assert_allclose(tiled, result, atol=1e-4)
+
+
+@raises(ValueError)
+def test_describe_unknown():
+    """An unknown statistic raises ValueError"""
+    arr = numpy.zeros((5, 5))
+    statistics.describe({'data': [arr], 'statistics': ['mode']})
+
+
+@raises(ValueError)
+def test_stddev_integer_dtype():
+    """An integer dtype raises ValueError instead of failing in sqrt"""
+    arr = numpy.zeros((5, 5), dtype='uint8')
+    statistics.stddev({'data': [arr], 'dtype': 'uint8'})
+
+
+@raises(ValueError)
+def test_describe_integer_dtype():
+    """An integer dtype raises ValueError instead of truncating results"""
+    arr = numpy.zeros((5, 5), dtype='uint8')
+    statistics.describe({'data': [arr], 'dtype': 'uint8'})
+
+
+@raises(ValueError)
+def test_bank_integer_dtype():
+    """An integer dtype raises ValueError instead of failing in sqrt"""
+    arr = numpy.zeros((5, 5), dtype='uint8')
+    statistics.bank({'data': [arr], 'sizes': [[3, 3]], 'dtype': 'uint8'})
+
+
+def test_backends():
+    """Both backends give the same minimum and maximum"""
+    numpy.random.seed(0)
+    arr = numpy.random.randint(0, 255, (40, 30)).astype('uint8')
+
+    for task in [statistics.minimum, statistics.maximum]:
+        for size in [[5, 5], [6, 8]]:
+            parameters = {'data': [arr], 'size': size, 'backend': 'scipy'}
+            expected = task(parameters)
+            parameters['backend'] = 'vhgw'
+            result = task(parameters)
+            assert_equal((result != expected).sum(), 0)
+
+    parameters = {'data': [arr], 'size': [7, 7], 'backend': 'scipy'}
+    expected = statistics.describe(parameters)
+    parameters['backend'] = 'vhgw'
+    result = statistics.describe(parameters)
+    numpy.testing.assert_allclose(result, expected)
+
+
+def test_rank_backends():
+    """Both backends give the same median, percentiles and ranks"""
+    numpy.random.seed(0)
+    arr = numpy.random.randint(0, 255, (40, 30)).astype('uint8')
+
+    tasks = [(statistics.median, {}),
+             (statistics.percentile, {'percentile': 20}),
+             (statistics.rank, {'rank': -3})]
+    for task, options in tasks:
+        for size in [[5, 5], [6, 8]]:
+            parameters = {'data': [arr], 'size': size, 'backend': 'scipy'}
+            parameters.update(options)
+            expected = task(parameters)
+            parameters['backend'] = 'histogram'
+            result = task(parameters)
+            assert_equal((result != expected).sum(), 0)
+
+
+def test_bank():
+    """Compare the filter bank with mean and stddev for every size,
+    including even sizes and windows longer than the data
+
+    """
+    numpy.random.seed(0)
+    arr = 1000 + 10 * numpy.random.rand(30, 40)
+    sizes = [[3, 3], [4, 6], [15, 9], [41, 3]]
+
+    parameters = {'data': [arr], 'sizes': sizes, 'dtype': 'float64'}
+    result = statistics.bank(parameters)
+
+    assert_equal(result.shape, (30, 40, 8))
+    for index, size in enumerate(sizes):
+        expected = {'data': [arr], 'size': size}
+        numpy.testing.assert_allclose(result[..., 2 * index],
+                                      statistics.mean(expected), rtol=1e-12)
+        numpy.testing.assert_allclose(result[..., 2 * index + 1],
+                                      statistics.stddev(expected),
+                                      rtol=1e-8)
+
+    parameters['block_shape'] = [8, 16]
+    tiled = statistics.bank(parameters)
+
+    numpy.testing.assert_allclose(tiled, result, rtol=1e-8)
+
+
+def test_bank_statistics():
+    """Calculate some statistics, in float64 by default"""
+    arr = numpy.zeros((5, 5), dtype='uint8')
+    arr[1:4, 1:4] = 3
+
+    parameters = {'data': [arr], 'sizes': [[3, 3], [1, 1]],
+                  'statistics': ['variance', 'mean']}
+    result = statistics.bank(parameters)
+
+    assert_equal(result.shape, (5, 5, 4))
+    assert_equal(result.dtype, numpy.dtype('float64'))
+    assert_equal(result[2, 2, 0], 0)
+    numpy.testing.assert_allclose(result[2, 2, 1], 3)
+    numpy.testing.assert_allclose(result[1, 1, 0], 20 / 9.0, rtol=1e-6)
+    assert_equal(result[..., 2].sum(), 0)
+    numpy.testing.assert_allclose(result[..., 3], arr, atol=1e-5)
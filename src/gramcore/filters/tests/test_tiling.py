@@ -0,0 +1,103 @@
+"""Tests for module gramcore.filters.tiling"""
+import os
+import numpy
+
+from nose.tools import assert_equal
+
+from gramcore.filters import morphology, statistics, tiling
+
+
+def setup():
+    """Create a random array fixture with odd dimensions"""
+    numpy.random.seed(0)
+    numpy.save('random.npy', numpy.random.randint(0, 255, (37, 53)))
+
+
+def teardown():
+    """Delete fixtures"""
+    os.remove('random.npy')
+    if os.path.exists('filtered.npy'):
+        os.remove('filtered.npy')
+
+
+def test_halo():
+    """Check the halo of single and double pass filters"""
+    assert_equal(tiling.halo([3, 4]), [1, 2])
+    assert_equal(tiling.halo([3, 5], passes=2), [2, 4])
+
+
+def test_blocks():
+    """Split a 5x4 array in 2x3 blocks with a halo of 1"""
+    parts = tiling.blocks((5, 4), [2, 3], [1, 1])
+
+    assert_equal(len(parts), 3 * 2)
+    outer, inner, target = parts[3]
+    # second row of blocks, second column
+    assert_equal(target, (slice(2, 4), slice(3, 4)))
+    assert_equal(outer, (slice(1, 5), slice(2, 4)))
+    assert_equal(inner, (slice(1, 3), slice(1, 2)))
+
+
+def test_blocks_trailing():
+    """Dimensions missing from the block shape are not split"""
+    parts = tiling.blocks((5, 4, 3), [2, 2], [1, 1])
+
+    assert_equal(len(parts), 3 * 2)
+    assert_equal(parts[0][2][2], slice(0, 3))
+
+
+def check_identical(task, size):
+    """Compare a task applied block by block with the whole array one
+
+    Averages and standard deviations are calculated with running sums, which
+    depend on where each block starts, so they are only equal up to floating
+    point rounding.
+
+    """
+    arr = numpy.load('random.npy')
+
+    expected = task({'data': [arr], 'size': size})
+    result = task({'data': [arr], 'size': size, 'block_shape': [10, 16]})
+
+    if task in (statistics.mean, statistics.stddev):
+        numpy.testing.assert_allclose(result, expected, rtol=1e-9,
+                                      atol=1e-9)
+    else:
+        numpy.testing.assert_array_equal(result, expected)
+
+
+def test_identical():
+    """Every tiled filter gives the same result as the whole array one"""
+    tasks = [
+        statistics.maximum,
+        statistics.mean,
+        statistics.median,
+        statistics.minimum,
+        statistics.stddev,
+        morphology.closing,
+        morphology.dilation,
+        morphology.erosion,
+        morphology.opening,
+    ]
+    for task in tasks:
+        for size in ([3, 3], [4, 7]):
+            yield check_identical, task, size
+
+
+def test_output_memmap():
+    """Write the tiled result to an npy file with multiple workers"""
+    arr = numpy.load('random.npy', mmap_mode='r')
+
+    expected = statistics.mean({'data': [arr], 'size': [5, 5]})
+    parameters = {
+        'data': [arr],
+        'size': [5, 5],
+        'block_shape': [8, 8],
+        'output': 'filtered.npy',
+        'workers': 3,
+    }
+    result = statistics.mean(parameters)
+
+    assert isinstance(result, numpy.memmap)
+    numpy.testing.assert_allclose(result, expected, rtol=1e-12)
+    numpy.testing.assert_array_equal(numpy.load('filtered.npy'), result)
@@ -0,0 +1,183 @@
+"""Block by block execution of the neighbourhood filters.
+
+Arrays larger than the available memory, e.g. memory mapped npy files, can't
+be filtered in a single call. Instead they are split in blocks, every block is
+filtered on its own and the results are written in a preallocated output,
+which can also be a memory mapped npy file.
+
+Every block is read together with a halo of neighbouring cells, at least as
+wide as the filter footprint. The halo is discarded after filtering, so the
+result is identical to filtering the whole array at once. Blocks on the array
+border are not extended beyond it, so the border `mode` of the filter applies
+exactly as it would on the whole array.
+
+.. note::
+
+    Filters based on running sums, e.g. the local average, accumulate
+    floating point rounding errors differently in every block. Their results
+    are equal to the whole array ones up to the last digits.
+
+"""
+import itertools
+from multiprocessing.pool import ThreadPool
+
+import numpy
+from numpy.lib import format
+
+
+def halo(size, passes=1):
+    """Returns the halo required by a filter with a rectangular footprint.
+
+    :param size: the footprint size of the filter along each axis
+    :type size: list
+    :param passes: how many times the filter is applied, e.g. 2 for
+                   morphological opening, defaults to 1
+    :type passes: integer
+
+    :return: list, the halo along each axis
+
+    """
+    return [passes * (length // 2) for length in size]
+
+
+def blocks(shape, block_shape, margins):
+    """Splits an array in blocks.
+
+    :param shape: the shape of the array
+    :type shape: tuple
+    :param block_shape: the shape of every block, the last ones can be
+                        smaller, missing trailing dimensions aren't split
+    :type block_shape: list
+    :param margins: the halo to add along each axis
+    :type margins: list
+
+    :return: list of (outer, inner, target) tuples of slices, outer is the
+             block with its halo, inner is the block relative to the outer one
+             and target is the block in the array
+
+    """
+    block_shape = list(block_shape) + list(shape[len(block_shape):])
+    margins = list(margins) + [0] * (len(shape) - len(margins))
+
+    ranges = []
+    for length, step, margin in zip(shape, block_shape, margins):
+        axis = []
+        for start in range(0, length, step):
+            stop = min(start + step, length)
+            outer_start = max(start - margin, 0)
+            outer_stop = min(stop + margin, length)
+            axis.append((slice(outer_start, outer_stop),
+                         slice(start - outer_start, stop - outer_start),
+                         slice(start, stop)))
+        ranges.append(axis)
+
+    result = []
+    for block in itertools.product(*ranges):
+        outer, inner, target = zip(*block)
+        result.append((outer, inner, target))
+
+    return result
+
+
+def tiled(function, data, margins, block_shape, output=None, workers=1):
+    """Applies a filter to an array block by block.
+
+    :param function: the filter, it must take an array and return an array of
+                     the same shape, optionally with trailing axes
+    :type function: function
+    :param data: the input array, it can be a memory map
+    :type data: numpy.array
+    :param margins: the halo along each axis, as returned by halo()
+    :type margins: list
+    :param block_shape: the shape of every block
+    :type block_shape: list
+    :param output: where to write the result, the path of an npy file or a
+                   preallocated array, defaults to None which allocates a new
+                   array in memory
+    :type output: string or numpy.array
+    :param workers: number of threads filtering blocks, defaults to 1
+    :type workers: integer
+
+    :return: numpy.array, or numpy.memmap if output is a path
+
+    """
+    parts = blocks(data.shape, block_shape, margins)
+
+    def filter_block(part):
+        """Filters one block with its halo and returns its useful part"""
+        outer, inner, target = part
+        return target, function(data[outer])[inner]
+
+    # the output dtype is only known after filtering the first block, as
+    # well as any trailing axes the filter adds, e.g. a stack of statistics
+    target, result = filter_block(parts[0])
+    shape = data.shape + result.shape[data.ndim:]
+    if output is None:
+        output = numpy.empty(shape, dtype=result.dtype)
+    elif not isinstance(output, numpy.ndarray):
+        output = format.open_memmap(output, mode='w+', dtype=result.dtype,
+                                    shape=shape)
+    output[target] = result
+
+    def write_block(part):
+        """Filters one block and writes it to the output"""
+        target, result = filter_block(part)
+        output[target] = result
+
+    if workers > 1:
+        pool = ThreadPool(workers)
+        try:
+            pool.map(write_block, parts[1:])
+        finally:
+            pool.close()
+            pool.join()
+    else:
+        for part in parts[1:]:
+            write_block(part)
+
+    if isinstance(output, numpy.memmap):
+        output.flush()
+
+    return output
+
+
+def apply(parameters, function, margins):
+    """Applies a filter to the input of a task, if asked block by block.
+
+    This is a helper for the filter tasks, which support the following
+    optional parameters:
+
+    :param parameters['block_shape']: filter the input in blocks of this
+                                      shape, e.g. [1024, 1024]
+    :type parameters['block_shape']: list
+    :param parameters['output']: path of an npy file to write the result to,
+                                 instead of keeping it in memory
+    :type parameters['output']: string
+    :param parameters['workers']: number of threads filtering blocks,
+                                  defaults to 1
+    :type parameters['workers']: integer
+
+    When none of them is set the filter is applied to the whole input.
+
+    :param parameters['data'][0]: input array
+    :type parameters['data'][0]: numpy.array
+    :param function: the filter, it must take an array and return an array of
+                     the same shape
+    :type function: function
+    :param margins: the halo along each axis, as returned by halo()
+    :type margins: list
+
+    :return: numpy.array
+
+    """
+    data = parameters['data'][0]
+    block_shape = parameters.get('block_shape')
+    output = parameters.get('output')
+
+    if block_shape is None and output is None:
+        return function(data)
+    if block_shape is None:
+        block_shape = data.shape
+
+    return tiled(function, data, margins, block_shape, output=output,
+                 workers=parameters.get('workers', 1))
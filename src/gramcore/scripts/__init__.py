@@ -1,2 +1 @@
-"""Relative imports for gramcore.scripts"""
-import gramcore.scripts.gram
+"""Command line tools"""
@@ -0,0 +1,217 @@
+"""Command line tool to execute a task file on many inputs.
+
+The task file is a template. Every string parameter in it can contain the
+following placeholders, which are replaced for every input::
+
+    {input}     the input path, e.g. scenes/tile_01.tif
+    {name}      the file name, e.g. tile_01.tif
+    {stem}      the file name without extension, e.g. tile_01
+    {index}     the position of the input in the batch, e.g. 0
+
+For example::
+
+    {
+        "batch_workers": 8,
+        "tasks": [
+            {"task": "arrays.load",
+             "parameters": {"path": "{input}"}},
+            {"task": "statistics.stddev",
+             "parameters": {"input_index": [0], "size": [5, 5]}},
+            {"task": "arrays.save",
+             "parameters": {"input_index": [1],
+                            "path": "results/{stem}_stddev.npy"}}
+        ]
+    }
+
+Inputs are given as a glob pattern or as a manifest, a text file with one
+path per line. They are processed by a pool of worker processes that import
+gramcore once and then execute many inputs each, instead of starting a new
+interpreter for every one of them. A failed input is reported and the rest
+of the batch goes on. Workers can share the same result cache. A profile
+path should contain a placeholder, e.g. "profiles/{stem}.jsonl", otherwise
+inputs overwrite each other's profile.
+
+The number of worker processes is the top level `batch_workers` of the
+template. The top level `workers` and `pool` mean the same as for gram, the
+threads executing the tasks of every input, which defaults to 1. Worker
+processes can't start processes of their own, so `pool` can't be 'process'.
+
+Usage::
+
+    gram-batch template.json "scenes/*.tif" --workers 8 --report failed.json
+
+"""
+import os
+import sys
+import glob
+import json
+import time
+import argparse
+import logging
+import traceback
+from multiprocessing import Pool
+
+from gramcore.execution import graph
+from gramcore.scripts.gram import MAPPING, get_args, get_cache
+from gramcore.scripts.gram import get_profiler
+
+
+logger = logging.getLogger('gramcore')
+
+
+def get_inputs(inputs):
+    """Returns the input paths of a batch.
+
+    :param inputs: a glob pattern or the path of a manifest file with one
+                   input path per line, empty lines and lines starting with #
+                   are skipped
+    :type inputs: string
+
+    :return: list of paths, sorted for glob patterns, in manifest order
+             otherwise
+
+    """
+    if os.path.isfile(inputs) and not glob.has_magic(inputs):
+        with open(inputs) as manifest:
+            lines = [line.strip() for line in manifest]
+        return [line for line in lines if line and not line.startswith('#')]
+
+    return sorted(glob.glob(inputs))
+
+
+def render(template, path, index):
+    """Replaces the placeholders of a template with the values of an input.
+
+    :param template: the template or part of it, it is not modified
+    :type template: dict, list, string or any other JSON value
+    :param path: the input path
+    :type path: string
+    :param index: position of the input in the batch
+    :type index: integer
+
+    :return: a copy of the template with the placeholders replaced
+
+    """
+    if isinstance(template, dict):
+        return dict((key, render(value, path, index))
+                    for key, value in template.items())
+    if isinstance(template, list):
+        return [render(value, path, index) for value in template]
+    if not isinstance(template, type(u'')) and \
+       not isinstance(template, type('')):
+        return template
+
+    name = os.path.basename(path)
+    fields = {
+        '{input}': path,
+        '{name}': name,
+        '{stem}': os.path.splitext(name)[0],
+        '{index}': str(index),
+    }
+    for placeholder, value in fields.items():
+        template = template.replace(placeholder, value)
+
+    return template
+
+
+def run_input(job):
+    """Executes the task file of a single input in a worker process.
+
+    :param job: (index, path, args) where args is the task file of the
+                input, with its placeholders replaced
+    :type job: tuple
+
+    :return: tuple (index, path, error or None, elapsed seconds)
+
+    """
+    index, path, args = job
+    spill_dir = args.get('spill_dir')
+    if spill_dir is not None:
+        # concurrent inputs can't share the same spill files
+        spill_dir = os.path.join(spill_dir, 'input-%d' % index)
+
+    start = time.time()
+    profiler = None
+    try:
+        profiler = get_profiler(args)
+        graph.execute(args['tasks'], MAPPING,
+                      workers=args.get('workers', 1),
+                      pool=args.get('pool', 'thread'),
+                      memory_budget=args.get('memory_budget'),
+                      spill_dir=spill_dir, cache=get_cache(args),
+                      profiler=profiler, dtype=args.get('dtype'))
+    except Exception:
+        error = ''.join(traceback.format_exception_only(*sys.exc_info()[:2]))
+        return index, path, error.strip(), time.time() - start
+    finally:
+        if profiler is not None:
+            profiler.close()
+
+    return index, path, None, time.time() - start
+
+
+def batch(argv=None):
+    """Parses the command line and executes a task file on many inputs.
+
+    The number of worker processes is set with --workers, or the top level
+    `batch_workers` entry of the template, and defaults to the number of
+    CPUs. Every input is executed by a single worker process, with the
+    `workers` threads of the template running its tasks.
+
+    Progress is logged as soon as each input finishes. Failed inputs are
+    logged with their error and, optionally, written to a JSON report.
+
+    :param argv: command line arguments, defaults to sys.argv[1:]
+    :type argv: list
+
+    :return: 0 if all inputs succeeded, otherwise 1
+
+    """
+    parser = argparse.ArgumentParser(
+        description="Execute a task file template on many inputs.")
+    parser.add_argument('template', help="JSON task file template")
+    parser.add_argument('inputs', help="glob pattern or manifest file")
+    parser.add_argument('--workers', type=int, default=None,
+                        help="number of worker processes")
+    parser.add_argument('--report', default=None,
+                        help="write failed inputs to this JSON file")
+    options = parser.parse_args(argv)
+
+    template = get_args(options.template)
+    paths = get_inputs(options.inputs)
+    workers = options.workers or template.get('batch_workers') or None
+    if template.get('pool', 'thread') != 'thread':
+        parser.error("the pool of a batch template must be 'thread'")
+    if not paths:
+        logger.warning("No inputs found for %s", options.inputs)
+
+    jobs = [(index, path, render(template, path, index))
+            for index, path in enumerate(paths)]
+    failures = []
+    start = time.time()
+
+    pool = Pool(workers)
+    try:
+        for done, outcome in enumerate(pool.imap_unordered(run_input, jobs)):
+            index, path, error, elapsed = outcome
+            if error is None:
+                logger.info("[%d/%d] %s finished in %.3f seconds",
+                            done + 1, len(jobs), path, elapsed)
+            else:
+                logger.error("[%d/%d] %s failed: %s",
+                             done + 1, len(jobs), path, error)
+                failures.append({'index': index, 'input': path,
+                                 'error': error})
+    finally:
+        pool.close()
+        pool.join()
+
+    logger.info("Executed %d inputs in %.3f seconds, %d failed",
+                len(jobs), time.time() - start, len(failures))
+    if options.report is not None:
+        failures.sort(key=lambda failure: failure['index'])
+        with open(options.report, 'w') as report:
+            json.dump({'total': len(jobs), 'failed': failures}, report,
+                      indent=4)
+
+    return 1 if failures else 0
@@ -2,55 +2,107 @@
 import sys
 import json
 import logging
-from gramcore.data import images, arrays
-from gramcore.features import descriptors, points
-from gramcore.filters import edges, statistics, morphology, thresholds
-from gramcore.transformations import arithmetic, geometric
+import importlib
+from gramcore.execution import graph
+from gramcore.execution.cache import ResultCache
+from gramcore.execution.profiling import Profiler
+
+try:
+    from collections.abc import Mapping
+except ImportError:
+    from collections import Mapping
 
 
 logging.basicConfig(level=logging.DEBUG)
 logger = logging.getLogger('gramcore')
 
 
-MAPPING = {
-    'images.fromarray': images.fromarray,
-    'images.load': images.load,
-    'images.save': images.save,
+class LazyMapping(Mapping):
+    """Task names to functions, importing each module on first use.
+
+    Importing all the task modules pulls in PIL, skimage and most of
+    scipy.ndimage, which takes longer than many short task files need to
+    run. Instead, every task is given as the dotted path of its function and
+    its module is only imported the first time the task is looked up. The
+    function is then cached, so later lookups are plain dict lookups.
+
+    :param paths: task name to dotted path of the function, e.g.
+                  {'arrays.load': 'gramcore.data.arrays.load'}
+    :type paths: dict
+
+    """
+
+    def __init__(self, paths):
+        self.paths = paths
+        self._functions = {}
+
+    def __getitem__(self, task):
+        try:
+            return self._functions[task]
+        except KeyError:
+            module_name, name = self.paths[task].rsplit('.', 1)
+            function = getattr(importlib.import_module(module_name), name)
+            self._functions[task] = function
+            return function
+
+    def preload(self):
+        """Imports the modules of all the tasks now, e.g. for a long running
+        service whose first task file shouldn't wait for them"""
+        for task in self.paths:
+            self.__getitem__(task)
+
+    def __iter__(self):
+        return iter(self.paths)
+
+    def __len__(self):
+        return len(self.paths)
+
+
+MAPPING = LazyMapping({
+    'images.fromarray': 'gramcore.data.images.fromarray',
+    'images.load': 'gramcore.data.images.load',
+    'images.save': 'gramcore.data.images.save',
     # leaving this out for the moment since it isn't necessary to end users
-    #'images.syth_positions': images.synth_positions,
-    'images.synthetic': images.synthetic,
-    'images.tiled': images.tiled,
-    'arrays.asarray': arrays.asarray,
-    'arrays.get_shape': arrays.get_shape,
-    'arrays.gaussian_noise': arrays.gaussian_noise,
-    'arrays.load': arrays.load,
-    'arrays.save': arrays.save,
-    'arrays.split': arrays.split,
-    'arrays.dtm': arrays.dtm,
-    'arrays.dsm': arrays.dsm,
-    'descriptors.hog': descriptors.hog,
-    'points.harris': points.harris,
-    'edges.canny': edges.canny,
-    'edges.prewitt': edges.prewitt,
-    'edges.sobel': edges.sobel,
-    'morphology.closing': morphology.closing,
-    'morphology.erosion': morphology.erosion,
-    'morphology.dilation': morphology.dilation,
-    'morphology.opening': morphology.opening,
-    'statistics.maximum': statistics.maximum,
-    'statistics.average': statistics.mean,
-    'statistics.median': statistics.median,
-    'statistics.minimum': statistics.minimum,
-    'statistics.stddev': statistics.stddev,
-    'thresholds.binary': thresholds.binary,
-    'thresholds.otsu': thresholds.otsu,
-    'arithmetic.add': arithmetic.add,
-    'arithmetic.diff': arithmetic.diff,
-    'arithmetic.divide': arithmetic.divide,
-    'arithmetic.ndvi': arithmetic.ndvi,
-    'geometric.resize': geometric.resize,
-    'geometric.rotate': geometric.rotate,
-}
+    #'images.syth_positions': 'gramcore.data.images.synth_positions',
+    'images.synthetic': 'gramcore.data.images.synthetic',
+    'images.tiled': 'gramcore.data.images.tiled',
+    'arrays.asarray': 'gramcore.data.arrays.asarray',
+    'arrays.get_shape': 'gramcore.data.arrays.get_shape',
+    'arrays.gaussian_noise': 'gramcore.data.arrays.gaussian_noise',
+    'arrays.load': 'gramcore.data.arrays.load',
+    'arrays.save': 'gramcore.data.arrays.save',
+    'arrays.split': 'gramcore.data.arrays.split',
+    'arrays.dtm': 'gramcore.data.arrays.dtm',
+    'arrays.dsm': 'gramcore.data.arrays.dsm',
+    'descriptors.hog': 'gramcore.features.descriptors.hog',
+    'points.harris': 'gramcore.features.points.harris',
+    'edges.canny': 'gramcore.filters.edges.canny',
+    'edges.prewitt': 'gramcore.filters.edges.prewitt',
+    'edges.sobel': 'gramcore.filters.edges.sobel',
+    'morphology.closing': 'gramcore.filters.morphology.closing',
+    'morphology.erosion': 'gramcore.filters.morphology.erosion',
+    'morphology.dilation': 'gramcore.filters.morphology.dilation',
+    'morphology.opening': 'gramcore.filters.morphology.opening',
+    'statistics.bank': 'gramcore.filters.statistics.bank',
+    'statistics.describe': 'gramcore.filters.statistics.describe',
+    'statistics.maximum': 'gramcore.filters.statistics.maximum',
+    'statistics.average': 'gramcore.filters.statistics.mean',
+    'statistics.median': 'gramcore.filters.statistics.median',
+    'statistics.minimum': 'gramcore.filters.statistics.minimum',
+    'statistics.percentile': 'gramcore.filters.statistics.percentile',
+    'statistics.rank': 'gramcore.filters.statistics.rank',
+    'statistics.stddev': 'gramcore.filters.statistics.stddev',
+    'thresholds.binary': 'gramcore.filters.thresholds.binary',
+    'thresholds.otsu': 'gramcore.filters.thresholds.otsu',
+    'arithmetic.add': 'gramcore.transformations.arithmetic.add',
+    'arithmetic.diff': 'gramcore.transformations.arithmetic.diff',
+    'arithmetic.divide': 'gramcore.transformations.arithmetic.divide',
+    'arithmetic.expression':
+        'gramcore.transformations.arithmetic.expression',
+    'arithmetic.ndvi': 'gramcore.transformations.arithmetic.ndvi',
+    'geometric.resize': 'gramcore.transformations.geometric.resize',
+    'geometric.rotate': 'gramcore.transformations.geometric.rotate',
+})
 
 
 def get_args(json_file):
@@ -85,45 +137,135 @@ def get_args(json_file):
     return args
 
 
+def get_cache(args):
+    """Returns the result cache configured in a JSON task file or None.
+
+    :param args: the parsed JSON task file, as returned by get_args()
+    :type args: dict
+
+    :return: gramcore.execution.cache.ResultCache
+
+    """
+    options = args.get('cache')
+    if options is None:
+        return None
+
+    return ResultCache(options['directory'], max_size=options.get('max_size'))
+
+
+def get_profiler(args):
+    """Returns the profiler configured in a JSON task file or None.
+
+    :param args: the parsed JSON task file, as returned by get_args()
+    :type args: dict
+
+    :return: gramcore.execution.profiling.Profiler
+
+    """
+    options = args.get('profile')
+    if options is None:
+        return None
+
+    return Profiler(options['path'], format=options.get('format', 'jsonl'),
+                    profile_dir=options.get('profile_dir'))
+
+
 def gram():
     """Parses JSON input and executes a series of tasks.
 
-    It loops through the JSON project file and for each provided task::
+    For each provided task in the JSON project file::
 
         1. It gets the function object corresponding to the task, based on the
         MAPPING
         2. It gets the provided parameters
-        3. It executes the task with the parameters and appends the returned
-        results to a list
+        3. It executes the task with the parameters and keeps the returned
+        results
 
-    The results list is used so that during execution every function can get
-    input from previously executed ones.
+    The results are kept so that during execution every function can get
+    input from previously executed ones. Only the modules of the tasks in the
+    JSON file are imported, check LazyMapping.
 
     In the JSON file when a function needs input from a previous one it uses
     parameters['input_index']. This is always a list e.g. [1, 2]. Every number
     in the list is an index to a function in the JSON file.
 
-    main() loops through parameters['input_index'] and gets the proper data
-    from the results list. It then executes the task parsing data to a new
+    gram() gets the proper data from the results of the tasks listed in
+    parameters['input_index']. It then executes the task parsing data to a new
     dictionary entry parameters['data']. Each function knows how to handle the
     provided input.
 
+    The input indices form a dependency graph. Tasks that don't depend on each
+    other can run in parallel by setting the optional top level entries of the
+    JSON file::
+
+        {
+            "workers": 4,
+            "pool": "thread",
+            "tasks": [...]
+        }
+
+    `workers` defaults to 1, which runs the tasks one after the other. `pool`
+    can be 'thread' or 'process' and defaults to 'thread'. For details check
+    gramcore.execution.graph.execute().
+
+    Every result is dropped as soon as the last task using it has finished.
+    In order to keep memory usage under control for very large arrays, set
+    the optional top level entries `memory_budget`, in bytes, and
+    `spill_dir`. Arrays that don't fit in the budget are written to
+    `spill_dir`, by default a temporary directory, and used as memory maps.
+
+    Results can be cached on disk across executions by setting the optional
+    top level entry `cache`::
+
+        {
+            "cache": {"directory": "/tmp/gram-cache", "max_size": 1e9},
+            "tasks": [...]
+        }
+
+    `max_size` is in bytes and defaults to no limit. Tasks with cached
+    results are loaded instead of executed, so executing a task file again
+    after changing its last tasks only executes the changed ones. For
+    details check gramcore.execution.cache.
+
+    Every task can be measured by setting the optional top level entry
+    `profile`::
+
+        {
+            "profile": {"path": "profile.jsonl", "format": "jsonl",
+                        "profile_dir": "profiles"},
+            "tasks": [...]
+        }
+
+    `format` is 'jsonl' or 'chrome' and defaults to 'jsonl'. With
+    `profile_dir` every task also runs under cProfile. For details check
+    gramcore.execution.profiling.
+
+    The optional top level entry `dtype`, e.g. "float32", is the default
+    dtype of every task that has a dtype option and doesn't set it. A whole
+    task file can run in float32 instead of float64 this way. It must be a
+    floating dtype, integer results are set per task.
+
     """
     args = get_args(sys.argv[1])
-    results = []
-
-    for arg in args['tasks']:
-        task = MAPPING[arg['task']]
-        parameters = arg['parameters']
-        # TODO: this should be made a log with logger.debug(....)
-        # now it doesn't seem to work
-        print "Executing function: ", parameters['task']
-        if 'input_index' in parameters:
-            data = []
-            for input_index in parameters['input_index']:
-                data.append(results[input_index])
-            parameters['data'] = data
-
-        results.append(task(parameters))
+    workers = args.get('workers', 1)
+    pool = args.get('pool', 'thread')
+    memory_budget = args.get('memory_budget')
+    spill_dir = args.get('spill_dir')
+
+    profiler = get_profiler(args)
+    try:
+        _, timings = graph.execute(args['tasks'], MAPPING,
+                                   workers=workers, pool=pool,
+                                   memory_budget=memory_budget,
+                                   spill_dir=spill_dir,
+                                   cache=get_cache(args),
+                                   profiler=profiler,
+                                   dtype=args.get('dtype'))
+    finally:
+        if profiler is not None:
+            profiler.close()
+    executed = [timing for timing in timings if timing is not None]
+    logger.info("Executed %d tasks in %.3f seconds of task time",
+                len(executed), sum(executed))
 
     return True
@@ -0,0 +1,385 @@
+"""Long running service executing task files sent over a Unix socket.
+
+Starting gram for every task file means importing Python, numpy, scipy and
+the task modules again and loading the same input rasters again. Instead, a
+service keeps running, imports every task module once when it starts and
+keeps recently loaded input arrays in memory.
+
+Start the service::
+
+    gram-service /tmp/gram.sock --jobs 4
+
+and submit task files to it::
+
+    gram-client /tmp/gram.sock task.json
+
+The protocol is one JSON document per connection, terminated by a newline.
+The request is a JSON task file, as for gram, with the optional top level
+entry `return`:
+
+    1. "paths", the default, writes array results to npy files in the
+       results directory of the service and returns their paths,
+    2. "arrays" returns array results as nested lists.
+
+The reply has a `status`, "ok" or "error". For "ok" it has the `results`
+and `timings` of the tasks, for "error" the `error` message. Results of
+intermediate tasks are null, the same way gramcore.execution.graph.execute
+returns None for them.
+
+.. warning::
+
+    The service executes any task file it receives, so only let trusted
+    users access the socket. Relative paths in task files are relative to
+    the working directory of the service, not of the client.
+
+Every job spills to its own subdirectory of the `spill_dir` of its task
+file, `job-<number>`, so concurrent jobs don't overwrite each other's
+spilled results.
+
+"""
+import os
+import sys
+import json
+import socket
+import argparse
+import tempfile
+import itertools
+import threading
+import traceback
+import logging
+from collections import OrderedDict
+
+import numpy
+
+from gramcore.execution import graph
+from gramcore.scripts.gram import MAPPING, get_args, get_cache
+from gramcore.scripts.gram import get_profiler
+
+try:
+    from SocketServer import ThreadingMixIn, UnixStreamServer
+    from SocketServer import StreamRequestHandler
+except ImportError:
+    from socketserver import ThreadingMixIn, UnixStreamServer
+    from socketserver import StreamRequestHandler
+
+try:
+    from collections.abc import Mapping
+except ImportError:
+    from collections import Mapping
+
+
+logger = logging.getLogger('gramcore')
+
+
+# tasks whose results are kept in the input cache, only arrays can be made
+# read only, so PIL images from images.load are not cached
+LOADS = ['arrays.load']
+
+
+class InputCache(object):
+    """Least recently used cache of loaded input arrays.
+
+    Arrays are returned read only, since every job that loads the same file
+    gets the same array. Tasks writing to their input, e.g. arithmetic with
+    inplace, fail instead of modifying the cached array.
+
+    :param max_bytes: maximum bytes of cached arrays
+    :type max_bytes: integer
+
+    """
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.in_memory = 0
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def load(self, task, function, parameters):
+        """Returns the cached result of a load task or executes it.
+
+        The cache key includes the size and modification time of the loaded
+        file, so modified files are loaded again.
+
+        :param task: the task name, e.g. 'arrays.load'
+        :type task: string
+        :param function: the task function
+        :type function: function
+        :param parameters: the task parameters
+        :type parameters: dict
+
+        :return: whatever the task returns, arrays are read only
+
+        """
+        key = self.key(task, parameters)
+        with self._lock:
+            if key in self._entries:
+                # move to the end, the most recently used one
+                result = self._entries.pop(key)
+                self._entries[key] = result
+                self.hits += 1
+                logger.debug("Input cache hit for %s", parameters['path'])
+                return result
+            self.misses += 1
+
+        result = function(parameters)
+        if not isinstance(result, numpy.ndarray) or \
+           result.nbytes > self.max_bytes:
+            return result
+
+        result = result.view()
+        result.flags.writeable = False
+        with self._lock:
+            if key not in self._entries:
+                self._entries[key] = result
+                self.in_memory += result.nbytes
+            while self.in_memory > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self.in_memory -= evicted.nbytes
+
+        return result
+
+    @staticmethod
+    def key(task, parameters):
+        """Returns the cache key of a load task"""
+        path = parameters['path']
+        stat = os.stat(path)
+        options = dict((name, value) for name, value in parameters.items()
+                       if name != 'data')
+
+        return (task, json.dumps(options, sort_keys=True, default=repr),
+                stat.st_size, stat.st_mtime)
+
+
+class CachedMapping(Mapping):
+    """Task names to functions, with load tasks going through a cache.
+
+    :param mapping: task name to function, e.g. gram.MAPPING
+    :type mapping: Mapping
+    :param inputs: the cache of loaded inputs
+    :type inputs: InputCache
+
+    """
+
+    def __init__(self, mapping, inputs):
+        self.mapping = mapping
+        self.inputs = inputs
+
+    def __getitem__(self, task):
+        function = self.mapping[task]
+        if task not in LOADS:
+            return function
+
+        def load(parameters):
+            """Loads through the input cache"""
+            return self.inputs.load(task, function, parameters)
+
+        return load
+
+    def __iter__(self):
+        return iter(self.mapping)
+
+    def __len__(self):
+        return len(self.mapping)
+
+
+class JobHandler(StreamRequestHandler):
+    """Reads a task file from a connection and replies with its results"""
+
+    def handle(self):
+        try:
+            args = json.loads(self.rfile.readline().decode('utf-8'))
+            reply = self.server.run(args)
+        except Exception:
+            logger.error(''.join(traceback.format_exception(*sys.exc_info())))
+            error = traceback.format_exception_only(*sys.exc_info()[:2])
+            reply = {'status': 'error', 'error': ''.join(error).strip()}
+
+        self.wfile.write((json.dumps(reply) + '\n').encode('utf-8'))
+
+
+class Service(ThreadingMixIn, UnixStreamServer):
+    """Executes task files received over a Unix socket.
+
+    Every connection is handled in its own thread, but at most `jobs` task
+    files are executed at the same time, the rest wait for their turn.
+
+    :param path: path of the Unix socket
+    :type path: string
+    :param jobs: maximum number of task files executed at the same time,
+                 defaults to 2
+    :type jobs: integer
+    :param results_dir: where to write array results, defaults to a
+                        temporary directory
+    :type results_dir: string
+    :param input_cache_size: maximum bytes of loaded inputs kept in memory,
+                             defaults to 1 GB
+    :type input_cache_size: integer
+
+    """
+
+    daemon_threads = True
+
+    def __init__(self, path, jobs=2, results_dir=None,
+                 input_cache_size=2 ** 30):
+        UnixStreamServer.__init__(self, path, JobHandler)
+        self.jobs = threading.BoundedSemaphore(jobs)
+        self.results_dir = results_dir or tempfile.mkdtemp(prefix='gram-')
+        self.inputs = InputCache(input_cache_size)
+        self.mapping = CachedMapping(MAPPING, self.inputs)
+        self._counter = itertools.count()
+        MAPPING.preload()
+
+    def run(self, args):
+        """Executes a task file and returns the reply to the client.
+
+        :param args: the JSON task file
+        :type args: dict
+
+        :return: dict
+
+        """
+        job = next(self._counter)
+        pool = args.get('pool', 'thread')
+        # the cached loads can't be pickled for process pools
+        mapping = self.mapping if pool == 'thread' else MAPPING
+        spill_dir = args.get('spill_dir')
+        if spill_dir is not None:
+            # concurrent jobs can't share the same spill files
+            spill_dir = os.path.join(spill_dir, 'job-%d' % job)
+
+        with self.jobs:
+            logger.info("Executing job %d with %d tasks", job,
+                        len(args['tasks']))
+            profiler = get_profiler(args)
+            try:
+                results, timings = graph.execute(
+                    args['tasks'], mapping, workers=args.get('workers', 1),
+                    pool=pool, memory_budget=args.get('memory_budget'),
+                    spill_dir=spill_dir, cache=get_cache(args),
+                    profiler=profiler, dtype=args.get('dtype'))
+            finally:
+                if profiler is not None:
+                    profiler.close()
+
+        as_arrays = args.get('return', 'paths') == 'arrays'
+        encoded = []
+        for index, result in enumerate(results):
+            path = os.path.join(self.results_dir,
+                                'job-%d-task-%d.npy' % (job, index))
+            encoded.append(encode(result, path, as_arrays))
+
+        return {'status': 'ok', 'results': encoded, 'timings': timings}
+
+
+def encode(result, path, as_arrays=False):
+    """Converts a task result to JSON.
+
+    :param result: what the task returned
+    :param path: where to write it, if it is an array
+    :type path: string
+    :param as_arrays: return arrays as nested lists instead of writing them,
+                      defaults to False
+    :type as_arrays: bool
+
+    :return: the result if it can be converted to JSON, otherwise its repr
+
+    """
+    if isinstance(result, numpy.ndarray):
+        if as_arrays:
+            return result.tolist()
+        numpy.save(path, result)
+        return path
+
+    try:
+        json.dumps(result)
+    except (TypeError, ValueError):
+        return repr(result)
+
+    return result
+
+
+def submit(path, args):
+    """Sends a task file to a service and waits for its reply.
+
+    :param path: path of the Unix socket of the service
+    :type path: string
+    :param args: the JSON task file
+    :type args: dict
+
+    :return: dict, the reply
+
+    """
+    connection = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        connection.connect(path)
+        connection.sendall((json.dumps(args) + '\n').encode('utf-8'))
+        reply = connection.makefile('rb').readline()
+    finally:
+        connection.close()
+
+    return json.loads(reply.decode('utf-8'))
+
+
+def serve(argv=None):
+    """Parses the command line and runs the service until interrupted.
+
+    :param argv: command line arguments, defaults to sys.argv[1:]
+    :type argv: list
+
+    :return: 0
+
+    """
+    parser = argparse.ArgumentParser(
+        description="Execute task files sent over a Unix socket.")
+    parser.add_argument('socket', help="path of the Unix socket")
+    parser.add_argument('--jobs', type=int, default=2,
+                        help="task files executed at the same time")
+    parser.add_argument('--results-dir', default=None,
+                        help="where to write array results")
+    parser.add_argument('--input-cache-size', type=int, default=2 ** 30,
+                        help="bytes of loaded inputs kept in memory")
+    options = parser.parse_args(argv)
+
+    if os.path.exists(options.socket):
+        os.remove(options.socket)
+    service = Service(options.socket, jobs=options.jobs,
+                      results_dir=options.results_dir,
+                      input_cache_size=options.input_cache_size)
+    logger.info("Listening on %s", options.socket)
+    try:
+        service.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        service.server_close()
+        os.remove(options.socket)
+
+    return 0
+
+
+def client(argv=None):
+    """Parses the command line, submits a task file and prints the reply.
+
+    :param argv: command line arguments, defaults to sys.argv[1:]
+    :type argv: list
+
+    :return: 0 if the task file was executed, otherwise 1
+
+    """
+    parser = argparse.ArgumentParser(
+        description="Submit a task file to a gram service.")
+    parser.add_argument('socket', help="path of the Unix socket")
+    parser.add_argument('task_file', help="JSON task file")
+    parser.add_argument('--arrays', action='store_true',
+                        help="return arrays instead of npy paths")
+    options = parser.parse_args(argv)
+
+    args = get_args(options.task_file)
+    if options.arrays:
+        args['return'] = 'arrays'
+    reply = submit(options.socket, args)
+    sys.stdout.write(json.dumps(reply) + '\n')
+
+    return 0 if reply['status'] == 'ok' else 1
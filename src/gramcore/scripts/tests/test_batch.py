@@ -0,0 +1,140 @@
+"""Tests for module gramcore.scripts.batch"""
+import os
+import json
+import shutil
+import tempfile
+
+import numpy
+
+from nose.tools import assert_equal, with_setup
+
+from gramcore.scripts import batch
+
+
+TEMPLATE = {
+    'tasks': [
+        {'task': 'arrays.load',
+         'parameters': {'path': '{input}'}},
+        {'task': 'arithmetic.add',
+         'parameters': {'input_index': [0, 0]}},
+        {'task': 'arrays.save',
+         'parameters': {'input_index': [1], 'path': '{stem}_double.npy'}},
+    ]
+}
+
+DIRECTORY = {}
+
+
+def setup_inputs():
+    """Creates a directory with three inputs and a template"""
+    directory = tempfile.mkdtemp(prefix='gram-batch-')
+    DIRECTORY['path'] = directory
+    for index in range(3):
+        numpy.save(os.path.join(directory, 'scene_%d.npy' % index),
+                   numpy.arange(4) + index)
+
+    template = json.loads(json.dumps(TEMPLATE))
+    template['tasks'][2]['parameters']['path'] = \
+        os.path.join(directory, '{stem}_double.npy')
+    with open(os.path.join(directory, 'template.json'), 'w') as template_file:
+        json.dump(template, template_file)
+
+
+def teardown_inputs():
+    """Deletes the directory"""
+    shutil.rmtree(DIRECTORY.pop('path'))
+
+
+def test_render():
+    """Replace the placeholders in every string of the template"""
+    rendered = batch.render(TEMPLATE, 'scenes/scene_1.npy', 1)
+
+    assert_equal(rendered['tasks'][0]['parameters']['path'],
+                 'scenes/scene_1.npy')
+    assert_equal(rendered['tasks'][1]['parameters']['input_index'], [0, 0])
+    assert_equal(rendered['tasks'][2]['parameters']['path'],
+                 'scene_1_double.npy')
+    assert_equal(TEMPLATE['tasks'][0]['parameters']['path'], '{input}')
+
+
+@with_setup(setup_inputs, teardown_inputs)
+def test_get_inputs():
+    """Get inputs from a glob pattern and from a manifest"""
+    directory = DIRECTORY['path']
+    inputs = batch.get_inputs(os.path.join(directory, 'scene_*.npy'))
+
+    assert_equal([os.path.basename(path) for path in inputs],
+                 ['scene_0.npy', 'scene_1.npy', 'scene_2.npy'])
+
+    manifest = os.path.join(directory, 'manifest.txt')
+    with open(manifest, 'w') as manifest_file:
+        manifest_file.write('# scenes\nb.npy\n\na.npy\n')
+
+    assert_equal(batch.get_inputs(manifest), ['b.npy', 'a.npy'])
+
+
+@with_setup(setup_inputs, teardown_inputs)
+def test_batch():
+    """Execute the template on every input"""
+    directory = DIRECTORY['path']
+    status = batch.batch([os.path.join(directory, 'template.json'),
+                          os.path.join(directory, 'scene_*.npy'),
+                          '--workers', '2'])
+
+    assert_equal(status, 0)
+    for index in range(3):
+        result = numpy.load(os.path.join(directory,
+                                         'scene_%d_double.npy' % index))
+        expected = 2 * (numpy.arange(4) + index)
+        assert_equal(result.tolist(), expected.tolist())
+
+
+def test_run_input_graph_options():
+    """Pass the workers and pool of the template to the graph"""
+    args = json.loads(json.dumps(TEMPLATE))
+    args['pool'] = 'fiber'
+
+    index, path, error, _ = batch.run_input((1, 'scene_1.npy', args))
+
+    assert_equal((index, path), (1, 'scene_1.npy'))
+    assert 'Unknown pool type fiber' in error
+
+
+@with_setup(setup_inputs, teardown_inputs)
+def test_batch_template_workers():
+    """Take the number of processes from batch_workers, not workers"""
+    directory = DIRECTORY['path']
+    path = os.path.join(directory, 'template.json')
+    with open(path) as template_file:
+        template = json.load(template_file)
+    template.update({'batch_workers': 2, 'workers': 2})
+    with open(path, 'w') as template_file:
+        json.dump(template, template_file)
+
+    status = batch.batch([path, os.path.join(directory, 'scene_*.npy')])
+
+    assert_equal(status, 0)
+    result = numpy.load(os.path.join(directory, 'scene_2_double.npy'))
+    assert_equal(result.tolist(), (2 * (numpy.arange(4) + 2)).tolist())
+
+
+@with_setup(setup_inputs, teardown_inputs)
+def test_batch_failures():
+    """Report failed inputs without stopping the batch"""
+    directory = DIRECTORY['path']
+    manifest = os.path.join(directory, 'manifest.txt')
+    with open(manifest, 'w') as manifest_file:
+        manifest_file.write(os.path.join(directory, 'missing.npy') + '\n')
+        manifest_file.write(os.path.join(directory, 'scene_0.npy') + '\n')
+    report = os.path.join(directory, 'report.json')
+
+    status = batch.batch([os.path.join(directory, 'template.json'),
+                          manifest, '--workers', '2', '--report', report])
+
+    assert_equal(status, 1)
+    assert_equal(os.path.exists(os.path.join(directory,
+                                             'scene_0_double.npy')), True)
+    with open(report) as report_file:
+        failed = json.load(report_file)
+    assert_equal(failed['total'], 2)
+    assert_equal([failure['index'] for failure in failed['failed']], [0])
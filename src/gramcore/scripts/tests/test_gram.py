@@ -0,0 +1,27 @@
+"""Tests for module gramcore.scripts.gram"""
+from nose.tools import assert_equal, raises
+
+from gramcore.data import arrays
+from gramcore.scripts import gram
+
+
+def test_lazy_mapping():
+    """Resolve a task to its function and cache it"""
+    mapping = gram.LazyMapping({'arrays.load': 'gramcore.data.arrays.load'})
+
+    assert_equal(mapping['arrays.load'], arrays.load)
+    assert_equal(mapping._functions, {'arrays.load': arrays.load})
+    assert_equal(list(mapping), ['arrays.load'])
+
+
+@raises(KeyError)
+def test_lazy_mapping_unknown():
+    """Fail on a task that is not in the mapping"""
+    gram.MAPPING['arrays.foo']
+
+
+def test_mapping_paths():
+    """Every path in MAPPING points to the module of its task"""
+    for task, path in gram.MAPPING.paths.items():
+        module = task.split('.')[0]
+        assert_equal(path.split('.')[-2], module)
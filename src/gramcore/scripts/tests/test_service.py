@@ -0,0 +1,118 @@
+"""Tests for module gramcore.scripts.service"""
+import os
+import shutil
+import tempfile
+import threading
+
+import numpy
+
+from nose.tools import assert_equal, raises, with_setup
+
+from gramcore.scripts import service
+
+
+SERVICE = {}
+
+
+def start_service():
+    """Starts a service on a temporary socket and creates an input array"""
+    directory = tempfile.mkdtemp(prefix='gram-service-')
+    numpy.save(os.path.join(directory, 'input.npy'), numpy.arange(6))
+    socket_path = os.path.join(directory, 'gram.sock')
+    server = service.Service(socket_path, jobs=1, results_dir=directory)
+    thread = threading.Thread(target=server.serve_forever)
+    thread.daemon = True
+    thread.start()
+    SERVICE.update(directory=directory, socket=socket_path, server=server)
+
+
+def stop_service():
+    """Stops the service and deletes its directory"""
+    SERVICE['server'].shutdown()
+    SERVICE['server'].server_close()
+    shutil.rmtree(SERVICE['directory'])
+    SERVICE.clear()
+
+
+def job(**options):
+    """Task file that loads the input array and doubles it"""
+    args = {'tasks': [
+        {'task': 'arrays.load',
+         'parameters': {'path': os.path.join(SERVICE['directory'],
+                                             'input.npy')}},
+        {'task': 'arithmetic.add',
+         'parameters': {'input_index': [0, 0]}},
+    ]}
+    args.update(options)
+    return args
+
+
+@with_setup(start_service, stop_service)
+def test_submit_paths():
+    """Array results are written to npy files"""
+    reply = service.submit(SERVICE['socket'], job())
+
+    assert_equal(reply['status'], 'ok')
+    assert_equal(reply['results'][0], None)
+    result = numpy.load(reply['results'][1])
+    assert_equal(result.tolist(), [0, 2, 4, 6, 8, 10])
+
+
+@with_setup(start_service, stop_service)
+def test_submit_arrays():
+    """Array results are returned as lists and inputs are loaded once"""
+    service.submit(SERVICE['socket'], job())
+    reply = service.submit(SERVICE['socket'], job(**{'return': 'arrays'}))
+
+    assert_equal(reply['results'][1], [0, 2, 4, 6, 8, 10])
+    assert_equal(SERVICE['server'].inputs.hits, 1)
+    assert_equal(SERVICE['server'].inputs.misses, 1)
+
+
+@with_setup(start_service, stop_service)
+def test_submit_spill_dir():
+    """Every job spills to its own subdirectory"""
+    spill_dir = os.path.join(SERVICE['directory'], 'spilled')
+    for _ in range(2):
+        reply = service.submit(SERVICE['socket'],
+                               job(spill_dir=spill_dir, memory_budget=0))
+        assert_equal(reply['status'], 'ok')
+
+    assert_equal(sorted(os.listdir(spill_dir)), ['job-0', 'job-1'])
+
+
+def test_loads():
+    """Only loaded arrays go through the input cache"""
+    mapping = service.CachedMapping(service.MAPPING,
+                                    service.InputCache(2 ** 20))
+
+    assert mapping['images.load'] is service.MAPPING['images.load']
+    assert mapping['arrays.load'] is not service.MAPPING['arrays.load']
+
+
+@with_setup(start_service, stop_service)
+def test_submit_error():
+    """Failed task files reply with their error"""
+    args = job()
+    args['tasks'][1]['task'] = 'arithmetic.foo'
+
+    reply = service.submit(SERVICE['socket'], args)
+
+    assert_equal(reply['status'], 'error')
+    assert 'arithmetic.foo' in reply['error']
+
+
+@raises(ValueError)
+def test_input_cache_read_only():
+    """Cached inputs can't be modified"""
+    inputs = service.InputCache(2 ** 20)
+    directory = tempfile.mkdtemp(prefix='gram-service-')
+    path = os.path.join(directory, 'input.npy')
+    numpy.save(path, numpy.arange(6))
+    try:
+        loaded = inputs.load('arrays.load', lambda parameters:
+                             numpy.load(parameters['path']), {'path': path})
+    finally:
+        shutil.rmtree(directory)
+
+    loaded[0] = 1
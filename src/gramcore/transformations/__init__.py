@@ -1,3 +1 @@
-"""Relative imports for gramcore.transformations"""
-import gramcore.transformations.arithmetic
-import gramcore.transformations.geometric
+"""Per pixel and geometric transformations"""
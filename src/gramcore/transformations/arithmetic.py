@@ -4,29 +4,195 @@ These are mostly generic algebraic operations. However, some have meaning only
 when used on images represented as numpy arrays. An example of such a function
 is ndvi.
 
+All of them are evaluated with numpy ufuncs writing to a single output array,
+so they don't allocate temporary arrays for every operation. The output can
+be:
+
+    1. a new array, the default,
+    2. the first input array, by setting parameters['inplace'] to True,
+    3. parameters['output'], the path of an npy file, which is written as a
+       memory map, or a preallocated array when calling from python. This is
+       the same option as the `output` of the filter tasks, check
+       gramcore.filters.tiling.apply().
+
+The optional parameters['dtype'] sets the dtype of the calculations.
+
+.. warning::
+
+    With inplace the first input array is overwritten. Only use it when no
+    other task takes input from the same array.
+
+Band math formulas, e.g. vegetation indices, can be evaluated with
+expression() in a single task, without any full size temporary arrays.
+Integer bands are cast to float64, or the given dtype, before the formula is
+evaluated, so differences don't wrap around and division is true division.
+
+The PRESETS take their bands in a fixed order, red, near infrared and blue,
+with green instead of red for 'ndwi', and follow the standard definition of
+every index. Vegetation has positive NDVI, SAVI and EVI and water has
+positive NDWI. The ndvi() task keeps its original sign, which is the opposite
+of the 'ndvi' preset.
+
 """
+import __future__
+import ast
+from multiprocessing.pool import ThreadPool
+
 import numpy
+from numpy.lib import format
+
+
+# formulas of common indices, the bands are given in the order of the
+# comments
+PRESETS = {
+    # red, near infrared
+    'ndvi': '(data[1] - data[0]) / (data[1] + data[0])',
+    # green, near infrared
+    'ndwi': '(data[0] - data[1]) / (data[0] + data[1])',
+    # red, near infrared
+    'savi': '1.5 * (data[1] - data[0]) / (data[1] + data[0] + 0.5)',
+    # red, near infrared, blue
+    'evi': '2.5 * (data[1] - data[0]) / '
+           '(data[1] + 6 * data[0] - 7.5 * data[2] + 1)',
+}
+
+# functions that can be called in expressions
+FUNCTIONS = {
+    'abs': numpy.absolute,
+    'exp': numpy.exp,
+    'log': numpy.log,
+    'maximum': numpy.maximum,
+    'minimum': numpy.minimum,
+    'sqrt': numpy.sqrt,
+}
+
+# syntax allowed in expressions, anything else is rejected before evaluation
+_NODES = (ast.Expression, ast.BinOp, ast.UnaryOp, ast.Call, ast.Subscript,
+          ast.Name, ast.Load, ast.Add, ast.Sub, ast.Mult, ast.Div, ast.Pow,
+          ast.USub, ast.UAdd) + \
+         tuple(getattr(ast, name) for name in ('Num', 'Constant', 'Index')
+               if hasattr(ast, name))
+
+_COMPILED = {}
+
+
+def _out(parameters, dtype):
+    """Returns the array to write the result to, None for a new one.
+
+    A path in parameters['output'] is opened as an npy memory map of the
+    shape of the first input and the given dtype.
+
+    """
+    output = parameters.get('output')
+    if output is None:
+        if parameters.get('inplace', False):
+            return parameters['data'][0]
+        return None
+    if isinstance(output, numpy.ndarray):
+        return output
+
+    return format.open_memmap(output, mode='w+', dtype=dtype,
+                              shape=parameters['data'][0].shape)
+
+
+def _flushed(result):
+    """Flushes results written to memory maps to disk"""
+    if isinstance(result, numpy.memmap):
+        result.flush()
+    return result
+
+
+def _band(node, formula):
+    """Returns the index of a data[i] subscript, a non negative integer"""
+    index = node.slice
+    if hasattr(ast, 'Index') and isinstance(index, ast.Index):
+        index = index.value
+    if hasattr(ast, 'Constant') and isinstance(index, ast.Constant):
+        band = index.value
+    else:
+        band = getattr(index, 'n', None)
+    if isinstance(band, bool) or not isinstance(band, int) or band < 0:
+        raise ValueError("Bands must be indexed with non negative integers in "
+                         "expression %s" % formula)
+
+    return band
+
+
+def _compile(formula):
+    """Validates a formula and compiles it to a code object.
+
+    Returns the code and the number of bands it uses.
+
+    """
+    if formula in _COMPILED:
+        return _COMPILED[formula]
+
+    tree = ast.parse(formula.strip(), mode='eval')
+    uses_data = False
+    bands = 0
+    for node in ast.walk(tree):
+        if not isinstance(node, _NODES):
+            raise ValueError("Unsupported syntax %s in expression %s" %
+                             (type(node).__name__, formula))
+        if isinstance(node, ast.Name) and node.id not in FUNCTIONS:
+            if node.id != 'data':
+                raise ValueError("Unknown name %s in expression %s" %
+                                 (node.id, formula))
+            uses_data = True
+        if isinstance(node, ast.Call) and \
+           not (isinstance(node.func, ast.Name) and node.func.id in FUNCTIONS):
+            raise ValueError("Unknown function in expression %s" % formula)
+        if isinstance(node, ast.Subscript) and \
+           not (isinstance(node.value, ast.Name) and node.value.id == 'data'):
+            raise ValueError("Only data can be indexed in expression %s" %
+                             formula)
+        if isinstance(node, ast.Subscript):
+            bands = max(bands, _band(node, formula) + 1)
+    if not uses_data:
+        raise ValueError("Expression %s doesn't use any data" % formula)
+
+    # the same division in python 2 and 3
+    code = compile(tree, '<expression>', 'eval',
+                   __future__.division.compiler_flag, True)
+    _COMPILED[formula] = code, bands
+
+    return code, bands
 
 
 def add(parameters):
     """Adds arrays.
 
     It can add multiple arrays together as long as they all have the same
-    dimensions. dtype of the sum is automatically handled by numpy.
+    dimensions. The sum is calculated in float, unless another dtype is set.
+    Adding N arrays allocates at most one array.
 
     :param parameters['data']: the input arrays, can be more than two
     :type parameters['data']: numpy.array
+    :param parameters['dtype']: dtype of the sum, defaults to 'float' or the
+                                dtype of the output array
+    :type parameters['dtype']: string
+    :param parameters['inplace']: add to the first input array, defaults to
+                                  False
+    :type parameters['inplace']: bool
+    :param parameters['output']: optional, path of an npy file or array to
+                                 write the sum to
+    :type parameters['output']: string or numpy.array
 
     :return: numpy.array
 
     """
-    first_array = parameters['data'][0]
-    result = numpy.zeros(first_array.shape)
+    data = parameters['data']
+    dtype = parameters.get('dtype')
+    out = _out(parameters, dtype or 'float')
+    if dtype is None:
+        dtype = 'float' if out is None else out.dtype
 
-    for arr in parameters['data']:
-        result += arr
+    second = data[1] if len(data) > 1 else 0
+    result = numpy.add(data[0], second, out=out, dtype=dtype)
+    for arr in data[2:]:
+        numpy.add(result, arr, out=result, dtype=dtype)
 
-    return result
+    return _flushed(result)
 
 
 def diff(parameters):
@@ -34,33 +200,162 @@ def diff(parameters):
 
     The first array in data is always the minuend and the second is the
     sudtrahend. dtype of the difference is automatically handled by
-    numpy.
+    numpy, unless it is set.
 
     :param parameters['data'][0]: minuend
     :type parameters['data'][0]: numpy.array
     :param parameters['data'][1]: subtrahend
     :type parameters['data'][1]: numpy.array
+    :param parameters['dtype']: optional, dtype of the difference
+    :type parameters['dtype']: string
+    :param parameters['inplace']: subtract from the minuend, defaults to
+                                  False
+    :type parameters['inplace']: bool
+    :param parameters['output']: optional, path of an npy file or array to
+                                 write the difference to
+    :type parameters['output']: string or numpy.array
 
     :return: numpy.array
 
     """
-    return parameters['data'][0] - parameters['data'][1]
+    data = parameters['data']
+    dtype = parameters.get('dtype')
+    out = _out(parameters, dtype or numpy.result_type(data[0], data[1]))
+
+    return _flushed(numpy.subtract(data[0], data[1], out=out, dtype=dtype))
 
 
 def divide(parameters):
     """Divide arrays, element by element.
 
-    Arrays must have exactly the same dimensions.
+    Arrays must have exactly the same dimensions. The division is always a
+    true one, integer arrays give a float64 quotient, in python 2 as well.
 
     :param parameters['data'][0]: numerator
     :type parameters['data'][0]: numpy.array
     :param parameters['data'][1]: denominator
     :type parameters['data'][1]: numpy.array
+    :param parameters['dtype']: optional, dtype of the quotient
+    :type parameters['dtype']: string
+    :param parameters['inplace']: divide the numerator, defaults to False
+    :type parameters['inplace']: bool
+    :param parameters['output']: optional, path of an npy file or array to
+                                 write the quotient to
+    :type parameters['output']: string or numpy.array
 
     :return: numpy.array
 
     """
-    return parameters['data'][0] / parameters['data'][1]
+    data = parameters['data']
+    dtype = parameters.get('dtype')
+    # the dtype of the true division, float64 for integers
+    out = _out(parameters, dtype or numpy.result_type(data[0], data[1], 1.0))
+
+    return _flushed(numpy.true_divide(data[0], data[1], out=out,
+                                      dtype=dtype))
+
+
+def expression(parameters):
+    """Evaluates a band math formula.
+
+    The formula is a string using the input arrays as data[0], data[1] etc,
+    numbers, the operators + - * / ** and the functions in FUNCTIONS, e.g.::
+
+        "(data[1] - data[0]) / (data[1] + data[0] + 0.5)"
+
+    It can also be the name of one of the PRESETS, e.g. "ndvi".
+
+    The inputs are evaluated in blocks of rows that fit in the processor
+    cache and every result block is written to the output array. Temporary
+    arrays are only as big as a block, no matter how many operations the
+    formula has. Blocks can be evaluated by multiple threads, since numpy
+    releases the GIL during calculations.
+
+    All input arrays must have the same shape.
+
+    :param parameters['data']: the input arrays
+    :type parameters['data']: numpy.array
+    :param parameters['expression']: the formula or the name of a preset
+    :type parameters['expression']: string
+    :param parameters['dtype']: dtype to cast the inputs to, defaults to
+                                None which keeps float inputs and casts
+                                integer ones to float64
+    :type parameters['dtype']: string
+    :param parameters['inplace']: write the result to the first input array,
+                                  defaults to False
+    :type parameters['inplace']: bool
+    :param parameters['output']: optional, path of an npy file or array to
+                                 write the result to
+    :type parameters['output']: string or numpy.array
+    :param parameters['block_size']: number of cells in each block, defaults
+                                     to 16384
+    :type parameters['block_size']: integer
+    :param parameters['workers']: number of threads, defaults to 1
+    :type parameters['workers']: integer
+
+    :return: numpy.array
+
+    """
+    data = parameters['data']
+    formula = PRESETS.get(parameters['expression'],
+                          parameters['expression'])
+    if not data:
+        raise ValueError("Expression %s needs at least one input array" %
+                         formula)
+    dtype = parameters.get('dtype')
+    block_size = parameters.get('block_size', 16384)
+    workers = parameters.get('workers', 1)
+
+    code, bands = _compile(formula)
+    if bands > len(data):
+        raise ValueError("Expression %s uses %d bands, but %d were given" %
+                         (formula, bands, len(data)))
+    shape = data[0].shape
+    for arr in data:
+        if arr.shape != shape:
+            raise ValueError("Input arrays must have the same shape")
+
+    row_size = int(numpy.prod(shape[1:]))
+    rows = max(1, block_size // max(row_size, 1))
+    # a single empty block for inputs without rows
+    blocks = [slice(start, start + rows)
+              for start in range(0, shape[0], rows)] or [slice(0, 0)]
+
+    # unsigned bands would wrap around in e.g. nir - red
+    casts = [dtype or (None if arr.dtype.kind in 'fc' else 'float64')
+             for arr in data]
+
+    def evaluate(block):
+        """Evaluates the formula on a block of rows of the inputs"""
+        inputs = [arr[block] if cast is None else arr[block].astype(cast)
+                  for arr, cast in zip(data, casts)]
+        namespace = {'__builtins__': {}, 'data': inputs}
+        namespace.update(FUNCTIONS)
+        return eval(code, namespace)
+
+    # the output dtype is only known after evaluating the first block
+    first = numpy.asarray(evaluate(blocks[0]))
+    out = _out(parameters, first.dtype)
+    if out is None:
+        out = numpy.empty(shape, dtype=first.dtype)
+    out[blocks[0]] = first
+
+    def write(block):
+        """Evaluates a block and writes it to the output"""
+        out[block] = evaluate(block)
+
+    if workers > 1:
+        pool = ThreadPool(workers)
+        try:
+            pool.map(write, blocks[1:])
+        finally:
+            pool.close()
+            pool.join()
+    else:
+        for block in blocks[1:]:
+            write(block)
+
+    return _flushed(out)
 
 
 def ndvi(parameters):
@@ -70,15 +365,31 @@ def ndvi(parameters):
 
     http://en.wikipedia.org/wiki/Normalized_Difference_Vegetation_Index
 
+    It is (red - nir) / (red + nir), as it has always been, so vegetation is
+    negative. This is the negative of the standard definition, use the
+    'ndvi' preset of expression() for that.
+
+    It is evaluated by expression(), so no full size temporary arrays are
+    allocated. Integer channels give a float64 index, set the dtype to e.g.
+    'float32' for half the memory.
+
     :param parameters['data'][0]: red channel
     :type parameters['data'][0]: numpy.array
     :param parameters['data'][1]: near infrared channel
     :type parameters['data'][1]: numpy.array
+    :param parameters['dtype']: optional, dtype of the calculations
+    :type parameters['dtype']: string
+    :param parameters['inplace']: write the index to the red channel array,
+                                  defaults to False
+    :type parameters['inplace']: bool
+    :param parameters['output']: optional, path of an npy file or array to
+                                 write the index to
+    :type parameters['output']: string or numpy.array
 
     :return: numpy.array
 
     """
-    red = parameters['data'][0]
-    nir = parameters['data'][1]
+    parameters = dict(parameters)
+    parameters['expression'] = '(data[0] - data[1]) / (data[0] + data[1])'
 
-    return (red - nir) / (red + nir)
+    return expression(parameters)
@@ -2,10 +2,53 @@
 
 These assume that the transformed array is actually an image.
 
+skimage converts the input to float64 in [0, 1], or [-1, 1] for signed
+integers. With `preserve_range` the input values are kept as they are
+instead, e.g. heights in a DTM or 16 bit reflectances. The optional `dtype`
+sets the dtype of the result, e.g. 'float32' to halve its memory, or the
+input dtype together with `preserve_range` to keep an 8 or 16 bit image in
+its original dtype. Without `preserve_range`, integer dtypes scale the
+[0, 1] result to their whole range, e.g. [0, 255] for 'uint8'.
+
 """
+import numpy
 from skimage import transform
 
 
+def _cast(result, dtype, preserve_range=False):
+    """Casts a result to dtype, rounding it first for integer dtypes.
+
+    Results scaled to [0, 1], or [-1, 1], are scaled to the range of integer
+    dtypes, unless preserve_range is set.
+
+    """
+    if dtype is None:
+        return result
+    dtype = numpy.dtype(dtype)
+    if dtype.kind in 'iu':
+        if not preserve_range:
+            result *= numpy.iinfo(dtype).max
+        numpy.rint(result, out=result)
+        info = numpy.iinfo(dtype)
+        numpy.clip(result, info.min, info.max, out=result)
+
+    return result.astype(dtype)
+
+
+def _options(parameters):
+    """Returns the interpolation options shared by all transformations"""
+    options = {
+        'order': parameters.get('order', 1),
+        'mode': parameters.get('mode', 'constant'),
+        'cval': parameters.get('cval', 0.0),
+    }
+    # older skimage versions don't have this option
+    if parameters.get('preserve_range', False):
+        options['preserve_range'] = True
+
+    return options
+
+
 def resize(parameters):
     """Resizes input to match a certain size.
 
@@ -15,8 +58,9 @@ def resize(parameters):
 
     .. warning::
 
-        The result is scaled to [0, 1]. In order to get meaningfull intensity
-        values you have to use rescale_intensity
+        The result is scaled to [0, 1], unless preserve_range is set. In
+        order to get meaningfull intensity values you have to use
+        rescale_intensity
 
     :param parameters['data'][0]: array to resize
     :type parameters['data'][0]: numpy.array
@@ -34,21 +78,26 @@ def resize(parameters):
                                is the value outside image boundaries. It
                                defaults to 0.0
     :type parameters['cval']: integer or float
+    :param parameters['preserve_range']: keep the range of the input values
+                                         instead of scaling them to [0, 1],
+                                         defaults to False
+    :type parameters['preserve_range']: bool
+    :param parameters['dtype']: dtype of the result, integer results are
+                                scaled to its range unless preserve_range
+                                is set and rounded, defaults to None which
+                                returns float64
+    :type parameters['dtype']: string
 
     :return: numpy.array
 
     """
     data = parameters['data'][0]
     output_shape = parameters['output_shape']
-    order = parameters.get('order', 1)
-    mode = parameters.get('mode', 'constant')
-    cval = parameters.get('cval', 0.0)
 
-    return transform.resize(data,
-                            output_shape,
-                            order=order,
-                            mode=mode,
-                            cval=cval)
+    result = transform.resize(data, output_shape, **_options(parameters))
+
+    return _cast(result, parameters.get('dtype'),
+                 parameters.get('preserve_range', False))
 
 
 def rotate(parameters):
@@ -60,8 +109,9 @@ def rotate(parameters):
 
     .. warning::
 
-        The result is scaled to [0, 1]. In order to get meaningfull intensity
-        values you have to use rescale_intensity. Due to a bug in scikit-image
+        The result is scaled to [0, 1], unless preserve_range is set. In
+        order to get meaningfull intensity values you have to use
+        rescale_intensity. Due to a bug in scikit-image
         the resize option has exactly the opposite outcome. Won't override the
         problem, skimage will get updated eventually.
 
@@ -86,19 +136,24 @@ def rotate(parameters):
                                is the value outside image boundaries. It
                                defaults to 0.0.
     :type parameters['cval']: integer or float
+    :param parameters['preserve_range']: keep the range of the input values
+                                         instead of scaling them to [0, 1],
+                                         defaults to False
+    :type parameters['preserve_range']: bool
+    :param parameters['dtype']: dtype of the result, integer results are
+                                scaled to its range unless preserve_range
+                                is set and rounded, defaults to None which
+                                returns float64
+    :type parameters['dtype']: string
 
     :return: numpy.array
     """
     data = parameters['data'][0]
     angle = parameters['angle']
     resize_option = parameters.get('resize', False)
-    order = parameters.get('order', 1)
-    mode = parameters.get('mode', 'constant')
-    cval = parameters.get('cval', 0.0)
-
-    return transform.rotate(data,
-                            angle,
-                            resize=resize_option,
-                            order=order,
-                            mode=mode,
-                            cval=cval)
+
+    result = transform.rotate(data, angle, resize=resize_option,
+                              **_options(parameters))
+
+    return _cast(result, parameters.get('dtype'),
+                 parameters.get('preserve_range', False))
@@ -1,7 +1,11 @@
 """Tests for module gramcore.transformations.arithmetic"""
+import os
+import shutil
+import tempfile
+
 import numpy
 
-from nose.tools import assert_equal
+from nose.tools import assert_equal, raises
 
 from gramcore.transformations import arithmetic
 
@@ -55,6 +59,17 @@ def test_divide():
     assert_equal(result.sum(), 2 * 10 * 10)
 
 
+def test_divide_integers():
+    """Divide integer arrays, the quotient is a float"""
+    one = numpy.ones((10, 10), dtype='uint8')
+    three = 3 * one
+
+    result = arithmetic.divide({'data': [one, three]})
+
+    assert_equal(result.dtype, numpy.dtype('float64'))
+    numpy.testing.assert_allclose(result, 1 / 3.0)
+
+
 def test_ndvi():
     """Check NDVI"""
     red = numpy.ones((10, 10))
@@ -65,3 +80,189 @@ def test_ndvi():
     result = arithmetic.ndvi(parameters)
 
     assert_equal(result.sum(), 0)
+
+
+def test_add_inplace():
+    """Sum 3 arrays in place of the first one"""
+    one = numpy.ones((10, 10))
+    two = 2 * one
+    three = 3 * one
+
+    parameters = {'data': [one, two, three], 'inplace': True}
+
+    result = arithmetic.add(parameters)
+
+    assert result is one
+    assert_equal(one.sum(), 6 * 10 * 10)
+
+
+def test_add_dtype():
+    """Sum uint8 arrays in float32 without overflow"""
+    one = 200 * numpy.ones((10, 10), dtype='uint8')
+
+    parameters = {'data': [one, one], 'dtype': 'float32'}
+
+    result = arithmetic.add(parameters)
+
+    assert_equal(result.dtype, numpy.dtype('float32'))
+    assert_equal(result.sum(), 400 * 10 * 10)
+
+
+def test_diff_output():
+    """Subtract arrays to a preallocated output"""
+    one = numpy.ones((10, 10))
+    two = 2 * one
+    out = numpy.empty((10, 10), dtype='float32')
+
+    parameters = {'data': [two, one], 'output': out}
+
+    result = arithmetic.diff(parameters)
+
+    assert result is out
+    assert_equal(out.sum(), 1 * 10 * 10)
+
+
+def test_output_path():
+    """Write results to npy files, the same as without a path"""
+    directory = tempfile.mkdtemp()
+    path = os.path.join(directory, 'result.npy')
+    red = numpy.ones((10, 10), dtype='uint8')
+    nir = 3 * numpy.ones((10, 10), dtype='uint8')
+
+    try:
+        for task in [arithmetic.divide, arithmetic.diff, arithmetic.add,
+                     arithmetic.ndvi]:
+            expected = task({'data': [red, nir]})
+            result = task({'data': [red, nir], 'output': path})
+            assert isinstance(result, numpy.memmap)
+            del result
+            saved = numpy.load(path)
+            assert_equal(saved.dtype, expected.dtype)
+            numpy.testing.assert_array_equal(saved, expected)
+    finally:
+        shutil.rmtree(directory)
+
+
+def test_ndvi_inplace():
+    """Check NDVI of integer channels written to the red channel"""
+    red = numpy.ones((10, 10), dtype='float32')
+    nir = 3 * numpy.ones((10, 10), dtype='uint8')
+
+    parameters = {'data': [red, nir], 'inplace': True}
+
+    result = arithmetic.ndvi(parameters)
+
+    assert result is red
+    assert_equal(red[0, 0], -0.5)
+
+
+def test_presets_sign():
+    """Vegetation, more near infrared than red, is positive in all presets"""
+    red = numpy.ones((10, 10), dtype='uint8')
+    nir = 3 * numpy.ones((10, 10), dtype='uint8')
+    blue = numpy.ones((10, 10), dtype='uint8')
+
+    for preset in ['ndvi', 'savi', 'evi']:
+        parameters = {'data': [red, nir, blue], 'expression': preset}
+        result = arithmetic.expression(parameters)
+        assert (result > 0).all()
+
+    # integer bands are divided as floats
+    numpy.testing.assert_allclose(result, 2.5 * 2 / (3 + 6 - 7.5 + 1))
+
+    # the ndvi task keeps its original sign
+    result = arithmetic.ndvi({'data': [red, nir]})
+    numpy.testing.assert_allclose(result, -0.5)
+
+
+def test_expression_unsigned():
+    """Unsigned bands with more red than near infrared don't wrap around"""
+    for dtype in ['uint8', 'uint16']:
+        red = numpy.array([[100, 30]], dtype=dtype)
+        nir = numpy.array([[50, 90]], dtype=dtype)
+
+        parameters = {'data': [red, nir], 'expression': 'ndvi'}
+        result = arithmetic.expression(parameters)
+
+        assert_equal(result.dtype, numpy.dtype('float64'))
+        numpy.testing.assert_allclose(result, [[-50 / 150.0, 0.5]])
+
+
+@raises(ValueError)
+def test_expression_no_data():
+    """Fail clearly without input arrays"""
+    arithmetic.expression({'data': [], 'expression': 'ndvi'})
+
+
+@raises(ValueError)
+def test_expression_missing_band():
+    """Fail clearly when the formula uses more bands than given"""
+    red = numpy.ones((10, 10))
+    nir = numpy.ones((10, 10))
+
+    arithmetic.expression({'data': [red, nir], 'expression': 'evi'})
+
+
+@raises(ValueError)
+def test_expression_band_index():
+    """Fail to index bands with anything else than integers"""
+    parameters = {
+        'data': [numpy.ones((10, 10))],
+        'expression': 'data[-1] + data[0.5]'
+    }
+
+    arithmetic.expression(parameters)
+
+
+def test_expression_empty():
+    """Evaluate inputs without rows to an empty result"""
+    red = numpy.ones((0, 10), dtype='uint8')
+    nir = numpy.ones((0, 10), dtype='uint8')
+
+    result = arithmetic.expression({'data': [red, nir], 'expression': 'ndvi'})
+
+    assert_equal(result.shape, (0, 10))
+    assert_equal(result.dtype, numpy.dtype('float64'))
+
+
+def test_expression():
+    """Evaluate a formula in small blocks with multiple threads"""
+    numpy.random.seed(0)
+    red = numpy.random.rand(50, 20)
+    nir = numpy.random.rand(50, 20)
+
+    parameters = {
+        'data': [red, nir],
+        'expression': 'sqrt(abs(data[1] - data[0])) / (data[1] + 0.5) ** 2',
+        'block_size': 60,
+        'workers': 3
+    }
+
+    result = arithmetic.expression(parameters)
+    expected = numpy.sqrt(abs(nir - red)) / (nir + 0.5) ** 2
+
+    numpy.testing.assert_allclose(result, expected)
+
+
+def test_expression_preset():
+    """Evaluate the savi preset with integer bands cast to float32"""
+    red = numpy.ones((10, 10), dtype='uint8')
+    nir = 3 * numpy.ones((10, 10), dtype='uint8')
+
+    parameters = {'data': [red, nir], 'expression': 'savi', 'dtype': 'float32'}
+
+    result = arithmetic.expression(parameters)
+
+    assert_equal(result.dtype, numpy.dtype('float32'))
+    numpy.testing.assert_allclose(result, 1.5 * 2 / 4.5)
+
+
+@raises(ValueError)
+def test_expression_unsafe():
+    """Fail to evaluate anything else than band math"""
+    parameters = {
+        'data': [numpy.ones((10, 10))],
+        'expression': '__import__("os").getcwd()'
+    }
+
+    arithmetic.expression(parameters)
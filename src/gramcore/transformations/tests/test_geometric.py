@@ -38,6 +38,34 @@ def test_resize_rgb():
     assert_equal(resized.sum(), 16)
 
 
+def test_resize_preserve_range():
+    """Resize an 8 bit image keeping its values and dtype"""
+    data = numpy.zeros((5, 5), dtype='uint8')
+    data[2, 2] = 200
+
+    parameters = {'data': [data], 'output_shape': (5, 5),
+                  'preserve_range': True, 'dtype': 'uint8'}
+
+    resized = geometric.resize(parameters)
+
+    assert_equal(resized.dtype, numpy.dtype('uint8'))
+    numpy.testing.assert_array_equal(resized, data)
+
+
+def test_resize_scaled_dtype():
+    """Resize to an integer dtype scales the [0, 1] result to its range"""
+    data = numpy.zeros((5, 5), dtype='uint8')
+    data[2, 2] = 255
+
+    parameters = {'data': [data], 'output_shape': (5, 5), 'dtype': 'uint16'}
+
+    resized = geometric.resize(parameters)
+
+    assert_equal(resized.dtype, numpy.dtype('uint16'))
+    assert_equal(resized[2, 2], 65535)
+    assert_equal(resized.sum(), 65535)
+
+
 def test_rotate_grey_noexpand():
     """Rotate grey image without expanding, check new size and intensities"""
     data = numpy.zeros((5, 5))
@@ -119,3 +147,16 @@ def test_rotate_rgb_expand():
     assert_equal(rotated[2, 2, 0], 0)
     assert_equal(rotated[2, 2, 1], 1)
     assert_equal(rotated[2, 2, 0], 0)
+
+
+def test_rotate_dtype():
+    """Rotate into a float32 result"""
+    data = numpy.zeros((5, 5), dtype='uint8')
+    data[2, 2] = 255
+
+    parameters = {'data': [data], 'angle': 90, 'dtype': 'float32'}
+
+    rotated = geometric.rotate(parameters)
+
+    assert_equal(rotated.dtype, numpy.dtype('float32'))
+    assert_equal(rotated.max(), 1.0)